@@ -1,126 +1,309 @@
 import ee
+import math
 import os
+import threading
 from datetime import datetime
 
-class GEELoader:
-    def __init__(self):
-        self.is_initialized = False
+from .replay import UPSTREAM_MODE, install_ee_hooks
+from .. import metrics
+
+# Mock values used when GEE is unavailable or a request fails
+OFFLINE_TERRAIN = {"elevation": 1500, "slope": 25}
+OFFLINE_RAINFALL = 0.0
+OFFLINE_BACKSCATTER = -20.0
+
+# Points per reduceRegions request (stays well under the 5000-element getInfo limit)
+BATCH_SIZE = int(os.getenv("GEE_BATCH_SIZE", 2000))
+# How far back to look for the newest Sentinel-1 acquisition at each point
+S1_LOOKBACK_DAYS = 60
+# Upper bound on Sentinel-1 IW acquisitions per point per day (ascending + descending
+# passes of both satellites); sizes series requests to stay under the getInfo limit
+S1_ACQUISITIONS_PER_DAY = 1 / 3
+
+
+def points_collection(points):
+    """
+    Builds a FeatureCollection of points, tagging each feature with its position in `points`.
+    points: iterable of (lat, lon) pairs or an (N, 2) array
+    """
+    features = [
+        ee.Feature(ee.Geometry.Point([float(lon), float(lat)]), {"idx": i})
+        for i, (lat, lon) in enumerate(points)
+    ]
+    return ee.FeatureCollection(features)
+
+
+def _chunks(points, size):
+    points = list(points)
+    for start in range(0, len(points), size):
+        yield start, points[start:start + size]
+
+
+_init_lock = threading.Lock()
+_init_result = None
+
+
+def initialize_earth_engine(authenticate=False):
+    """
+    Initializes the Earth Engine client once per process and returns whether it succeeded.
+    Later calls return the cached result without touching the network.
+    """
+    global _init_result
+    if _init_result is not None:
+        return _init_result
+    with _init_lock:
+        if _init_result is not None:
+            return _init_result
+
+        if UPSTREAM_MODE != "live":
+            install_ee_hooks(ee)
+        # Installed after the replay hooks so replayed calls are counted too
+        metrics.instrument_ee(ee)
+        if UPSTREAM_MODE != "live":
+            if UPSTREAM_MODE == "replay":
+                # Every getInfo/getMapId is answered from the cassette; no credentials needed
+                _init_result = True
+                print("Google Earth Engine running in REPLAY mode from recorded responses.")
+                return _init_result
+
+        project_id = os.getenv("EE_PROJECT_ID")
         try:
-            # Trigger the authentication flow.
-            # ee.Authenticate()
-            
-            # Initialize the library.
-            project_id = os.getenv("EE_PROJECT_ID")
             if project_id:
                 ee.Initialize(project=project_id)
             else:
                 ee.Initialize()
-            self.is_initialized = True
-            print("Google Earth Engine initialized successfully.")
+            _init_result = True
+            print(f"Google Earth Engine initialized successfully with project: {project_id}")
         except Exception as e:
             print(f"GEE Initialization failed: {e}")
-            print("Running in OFFLINE MODE for Terrain Data (Using Mock Elevation/Slope).")
-            print("Tip: To enable GEE, run `earthengine authenticate` and set 'EE_PROJECT_ID' in .env")
+            _init_result = False
+            if authenticate:
+                print("Trying to authenticate...")
+                try:
+                    ee.Authenticate()
+                    ee.Initialize(project=project_id)
+                    _init_result = True
+                except Exception as auth_e:
+                    print(f"Authentication failed: {auth_e}")
+            if not _init_result:
+                print("Running in OFFLINE MODE for Terrain Data (Using Mock Elevation/Slope).")
+                print("Tip: To enable GEE, run `earthengine authenticate` and set 'EE_PROJECT_ID' in .env")
+        return _init_result
 
-    def get_elevation_data(self, lat, lon, scale=30):
+
+class GEELoader:
+    def __init__(self):
+        self._terrain = None
+        self.is_initialized = initialize_earth_engine()
+
+    @property
+    def terrain_image(self):
         """
-        Fetch SRTM elevation data.
+        Two-band [elevation, slope] SRTM image, built once and shared by every terrain request.
+        """
+        if self._terrain is None:
+            dataset = ee.Image('USGS/SRTMGL1_003')
+            self._terrain = dataset.select('elevation').addBands(ee.Terrain.slope(dataset))
+        return self._terrain
+
+    def _reduce_points(self, image, points, reducer, scale, defaults, label):
+        """
+        Samples `image` at every point with one reduceRegions/getInfo round trip per BATCH_SIZE points.
+        Returns one dict per point, in input order, falling back to `defaults` on failure.
+        With defaults=None every band is returned.
+        """
+        results = [dict(defaults or {}) for _ in range(len(points))]
+        for start, chunk in _chunks(points, BATCH_SIZE):
+            try:
+                sampled = image.reduceRegions(
+                    collection=points_collection(chunk),
+                    reducer=reducer,
+                    scale=scale
+                ).getInfo()
+            except Exception as e:
+                print(f"{label}: {e}")
+                continue
+
+            for feature in sampled.get('features', []):
+                props = feature.get('properties', {})
+                row = results[start + int(props['idx'])]
+                for key in (defaults or props):
+                    if key in props and key != 'idx':
+                        row[key] = props[key]
+        return results
+
+    def get_elevation_batch(self, points, scale=30):
         """
+        Fetch SRTM elevation and slope for many points in one request.
+        points: iterable of (lat, lon) pairs or an (N, 2) array
+        Returns a list of {"elevation", "slope"} dicts in input order.
+        """
+        points = list(points)
         # If not initialized, return mock data immediately without error spam
         if not self.is_initialized:
-            return {"elevation": 1500, "slope": 25}
+            return [dict(OFFLINE_TERRAIN) for _ in points]
 
-        try:
-            point = ee.Geometry.Point([lon, lat])
-            dataset = ee.Image('USGS/SRTMGL1_003')
-            elevation = dataset.sample(point, scale).first().get('elevation').getInfo()
-            slope = ee.Terrain.slope(dataset).sample(point, scale).first().get('slope').getInfo()
-            return {"elevation": elevation, "slope": slope}
-        except Exception as e:
-            print(f"Error fetching GEE data: {e}")
-            return {"elevation": 1500, "slope": 25} # Mock data for safe fail
+        return self._reduce_points(
+            self.terrain_image, points, ee.Reducer.first(), scale,
+            OFFLINE_TERRAIN, "Error fetching GEE data"
+        )
 
-    
-    def get_rainfall_history(self, lat, lon, hours=72):
+    def get_elevation_data(self, lat, lon, scale=30):
+        """
+        Fetch SRTM elevation data.
         """
-        Calculates 72-hour cumulative rainfall using GPM (IMERG) data.
+        return self.get_elevation_batch([(lat, lon)], scale)[0]
+
+    def get_rainfall_batch(self, points, hours=72):
+        """
+        Calculates cumulative rainfall over the last `hours` GSMaP images for many points in one request.
+        Returns a list of floats in input order.
         """
+        points = list(points)
         if not self.is_initialized:
-            return 0.0
+            return [OFFLINE_RAINFALL for _ in points]
 
         try:
-            point = ee.Geometry.Point([lon, lat])
-            
-            # GPM V6 (precipitationCal is in mm/hr)
-            # We want the last 72 hours
-            end_date = ee.Date(pd.Timestamp.now()) if 'pd' in globals() else ee.Date(datetime.now()) # Fallback if pd not imported, but ee handles Date best
-            # Actually easier to just rely on server side date or approximate "now"
-            # Since we can't easily pass python datetime object without importing datetime
-            # Let's import datetime at top or use ee.Date(Date.now()) concept
-            
-            # Simplified approach: Use relative time from GEE if possible, or pass explicit dates.
-            # For this agent context, let's just grab the last available 3 days from the dataset irrespective of 'real-time' 
-            # because GPM has latency. Real-time implementation would use "JAXA/GPM_L3/GSMaP/v6/operational"
-            
-            # Using JAXA GSMaP operational for lower latency
+            # Using JAXA GSMaP operational for lower latency (GPM has latency).
+            # Real-time implementation would filter on now.advance(-3, 'day').
             collection = ee.ImageCollection("JAXA/GPM_L3/GSMaP/v6/operational") \
-                .filterBounds(point) \
                 .filterDate(ee.Date(0).update(2026, 1, 1), ee.Date(0).update(2026, 2, 8)) \
                 .select('hourlyPrecipRate')
                 # Note: Time filter above is hardcoded for the "current time" context of the prompt (Feb 2026).
-                # In a real app we would use:
-                # now = ee.Date(datetime.datetime.now())
-                # .filterDate(now.advance(-3, 'day'), now)
-            
-            # Calculate sum
-            # GSMaP hourlyPrecipRate is mm/hr. 
-            # We treat each image as 1 hour average.
-            rainfall = collection.limit(72, 'system:time_start', False).sum() 
-            
-            val = rainfall.reduceRegion(reducer=ee.Reducer.mean(), geometry=point, scale=10000).get('hourlyPrecipRate').getInfo()
-            if val is None: return 0.0
-            return float(val)
 
+            # GSMaP hourlyPrecipRate is mm/hr. We treat each image as 1 hour average.
+            rainfall = collection.limit(hours, 'system:time_start', False).sum()
         except Exception as e:
             print(f"GEE Rain Error: {e}")
-            return 0.0
+            return [OFFLINE_RAINFALL for _ in points]
 
-    def get_sentinel1_data(self, lat, lon):
+        rows = self._reduce_points(
+            rainfall, points, ee.Reducer.mean().setOutputs(['hourlyPrecipRate']), 10000,
+            {"hourlyPrecipRate": None}, "GEE Rain Error"
+        )
+        return [OFFLINE_RAINFALL if row["hourlyPrecipRate"] is None else float(row["hourlyPrecipRate"]) for row in rows]
+
+    def get_rainfall_series_batch(self, points, end_date, days=30):
         """
-        Fetches Sentinel-1 SAR backscatter to estimate soil moisture changes.
-        Returns a simplified 'moisture_index' (0-1 scale) based on VH backscatter.
+        Daily CHIRPS rainfall (mm/day) for the `days` days before end_date, for many points in one request.
+        end_date: 'YYYY-MM-DD'
+        Returns one list of `days` floats per point (oldest first), zero-filled where data is missing.
+        """
+        points = list(points)
+        if not self.is_initialized:
+            return [[0.0] * days for _ in points]
+
+        try:
+            end = ee.Date(end_date)
+            # toBands names each band '<YYYYMMDD>_precipitation', so band order is date order
+            stack = ee.ImageCollection('UCSB-CHG/CHIRPS/DAILY') \
+                .filterDate(end.advance(-days, 'day'), end) \
+                .select('precipitation') \
+                .toBands()
+        except Exception as e:
+            print(f"GEE Rain Series Error: {e}")
+            return [[0.0] * days for _ in points]
+
+        rows = self._reduce_points(stack, points, ee.Reducer.first(), 5000, None, "GEE Rain Series Error")
+        series = []
+        for row in rows:
+            values = [float(row[k]) if row[k] is not None else 0.0 for k in sorted(row)]
+            values = values[-days:]
+            series.append([0.0] * (days - len(values)) + values)
+        return series
+
+    def get_rainfall_history(self, lat, lon, hours=72):
+        """
+        Calculates 72-hour cumulative rainfall using GSMaP data.
         """
+        return self.get_rainfall_batch([(lat, lon)], hours)[0]
+
+    def get_sentinel1_batch(self, points):
+        """
+        Fetches the newest Sentinel-1 VH backscatter at many points in one request.
+        Returns a list of floats (dB) in input order.
+        """
+        points = list(points)
         if not self.is_initialized:
-            return 0.5
+            return [0.5 for _ in points]
 
         try:
-            point = ee.Geometry.Point([lon, lat])
-            
-            # Sentinel-1 GRD
-            s1 = ee.ImageCollection('COPERNICUS/S1_GRD') \
-                .filterBounds(point) \
+            since = ee.Date(datetime.utcnow()).advance(-S1_LOOKBACK_DAYS, 'day')
+
+            # Sentinel-1 GRD, oldest first so the mosaic keeps the newest pixel at each point
+            latest = ee.ImageCollection('COPERNICUS/S1_GRD') \
                 .filter(ee.Filter.listContains('transmitterReceiverPolarisation', 'VH')) \
                 .filter(ee.Filter.eq('instrumentMode', 'IW')) \
+                .filterDate(since, ee.Date(datetime.utcnow())) \
                 .select('VH') \
-                .sort('system:time_start', False) # Newest first
-
-            # Get latest image
-            latest_img = s1.first()
-            
-            # Get a baseline (e.g., mean of last year) - expensive for real-time, 
-            # so let's just return the raw backscatter for the heuristic model to threshold.
-            # Wet soil generally increases backscatter in some contexts, but can verify later.
-            # Actually, for landslides, increasing soil moisture often increases backscatter until saturation/flooding (specular reflection) decreases it.
-            # Let's return the VH value directly. Typical range -30 (dry/smooth) to -5 (wet/rough).
-            
-            val = latest_img.reduceRegion(reducer=ee.Reducer.mean(), geometry=point, scale=10).get('VH').getInfo()
-            
-            if val is None: return -20.0
-            return float(val)
-
+                .sort('system:time_start') \
+                .mosaic()
         except Exception as e:
             print(f"GEE S1 Error: {e}")
-            return -20.0
+            return [OFFLINE_BACKSCATTER for _ in points]
+
+        # Return the VH value directly. Typical range -30 (dry/smooth) to -5 (wet/rough).
+        rows = self._reduce_points(
+            latest, points, ee.Reducer.mean().setOutputs(['VH']), 10,
+            {"VH": None}, "GEE S1 Error"
+        )
+        return [OFFLINE_BACKSCATTER if row["VH"] is None else float(row["VH"]) for row in rows]
+
+    def get_sentinel1_series_batch(self, points, start, end, bands=("VH", "VV")):
+        """
+        Every Sentinel-1 IW acquisition between start and end (datetimes) at many points.
+        Returns one list of {"time": epoch ms, "VH": dB, "VV": dB} per point, oldest first;
+        None for points whose request failed (as opposed to [] for no acquisitions).
+        """
+        points = list(points)
+        if not self.is_initialized:
+            return [None for _ in points]
+
+        bands = list(bands)
+        collection = ee.ImageCollection('COPERNICUS/S1_GRD') \
+            .filter(ee.Filter.listContains('transmitterReceiverPolarisation', 'VH')) \
+            .filter(ee.Filter.listContains('transmitterReceiverPolarisation', 'VV')) \
+            .filter(ee.Filter.eq('instrumentMode', 'IW')) \
+            .filterDate(ee.Date(start), ee.Date(end)) \
+            .select(bands)
+
+        # Each point yields one feature per acquisition, so fewer points fit in one request
+        days = max(1.0, (end - start).total_seconds() / 86400)
+        chunk_size = max(1, int(BATCH_SIZE // math.ceil(days * S1_ACQUISITIONS_PER_DAY)))
+
+        series = [None for _ in points]
+        for start_idx, chunk in _chunks(points, chunk_size):
+            fc = points_collection(chunk)
+
+            def sample(image):
+                return image.reduceRegions(collection=fc, reducer=ee.Reducer.first(), scale=10) \
+                    .filter(ee.Filter.notNull(bands)) \
+                    .map(lambda f: f.set('time', image.get('system:time_start')))
+
+            try:
+                sampled = collection.map(sample).flatten().getInfo()
+            except Exception as e:
+                print(f"GEE S1 Series Error: {e}")
+                continue
+
+            for i in range(len(chunk)):
+                series[start_idx + i] = []
+            for feature in sampled.get('features', []):
+                props = feature.get('properties', {})
+                row = {"time": int(props['time'])}
+                row.update({band: float(props[band]) for band in bands})
+                series[start_idx + int(props['idx'])].append(row)
+        for rows in series:
+            if rows:
+                rows.sort(key=lambda r: r["time"])
+        return series
+
+    def get_sentinel1_data(self, lat, lon):
+        """
+        Fetches Sentinel-1 SAR backscatter to estimate soil moisture changes.
+        Returns the VH backscatter for the heuristic model to threshold.
+        """
+        return self.get_sentinel1_batch([(lat, lon)])[0]
 
 if __name__ == "__main__":
     loader = GEELoader()
@@ -1,25 +1,76 @@
 import requests
+import asyncio
 import os
+import time
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+import httpx
 from dotenv import load_dotenv
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
+from .replay import UPSTREAM_MODE, ReplayAdapter, get_cassette, upstream_transport
+from .. import metrics
+
 load_dotenv()
 
+BASE_URL = "https://api.openweathermap.org/data/2.5/"
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Current conditions refresh roughly every 10 minutes upstream
+CURRENT_TTL_SECONDS = 600
+# The 5-day/3-hour forecast is reissued every 3 hours
+FORECAST_ISSUE_SECONDS = 3 * 3600
+# 2 decimals ~ 1.1 km: neighbouring slope units share one upstream response
+COORD_DECIMALS = 2
+MAX_CACHE_ENTRIES = 10000
+
+
+def parse_forecast_rain(data):
+    """
+    Extract rainfall data (accessing '3h' rain volume if available) from a forecast response.
+    """
+    rain_data = []
+    for item in data.get('list', []):
+        rain = item.get('rain', {}).get('3h', 0)
+        timestamp = item.get('dt')
+        rain_data.append({'timestamp': timestamp, 'rain_3h': rain})
+    return rain_data
+
+
+def retry_after_seconds(value, default):
+    """
+    Seconds to wait from a Retry-After header (delta-seconds or HTTP-date); `default` if absent or malformed.
+    """
+    if value is None:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return default
+
+
 class OpenWeatherLoader:
     def __init__(self):
         self.api_key = os.getenv("OPENWEATHER_API_KEY")
-        self.base_url = "https://api.openweathermap.org/data/2.5/"
-        
+        self.base_url = BASE_URL
+
         # Configure retry strategy
         self.session = requests.Session()
         retry = Retry(
-            total=5, 
-            backoff_factor=1, 
-            status_forcelist=[429, 500, 502, 503, 504],
+            total=5,
+            backoff_factor=1,
+            status_forcelist=list(RETRY_STATUSES),
             allowed_methods=["HEAD", "GET", "OPTIONS"]
         )
-        adapter = HTTPAdapter(max_retries=retry)
+        if UPSTREAM_MODE == "live":
+            adapter = HTTPAdapter(max_retries=retry)
+        else:
+            adapter = ReplayAdapter(get_cassette("openweather"), max_retries=retry)
         self.session.mount("https://", adapter)
         self.session.mount("http://", adapter)
 
@@ -27,7 +78,9 @@ class OpenWeatherLoader:
         """Fetches current weather data."""
         url = f"{self.base_url}weather?lat={lat}&lon={lon}&appid={self.api_key}&units=metric"
         try:
-            response = self.session.get(url, timeout=10)
+            with metrics.timed(metrics.openweather_latency.labels("weather")):
+                response = self.session.get(url, timeout=10)
+            metrics.openweather_calls.labels("weather", str(response.status_code)).inc()
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
@@ -42,20 +95,187 @@ class OpenWeatherLoader:
         """
         url = f"{self.base_url}forecast?lat={lat}&lon={lon}&appid={self.api_key}&units=metric"
         try:
-            response = self.session.get(url, timeout=10)
+            with metrics.timed(metrics.openweather_latency.labels("forecast")):
+                response = self.session.get(url, timeout=10)
+            metrics.openweather_calls.labels("forecast", str(response.status_code)).inc()
             response.raise_for_status()
-            data = response.json()
-            # Extract rainfall data (accessing '3h' rain volume if available)
-            rain_data = []
-            for item in data.get('list', []):
-                rain = item.get('rain', {}).get('3h', 0)
-                timestamp = item.get('dt')
-                rain_data.append({'timestamp': timestamp, 'rain_3h': rain})
-            return rain_data
+            return parse_forecast_rain(response.json())
         except requests.exceptions.RequestException as e:
             print(f"Error fetching forecast data: {e}")
             return None
 
+
+class RateLimiter:
+    """
+    Token bucket shared by all requests of one client: `rate` calls per second, bursts up to `burst`.
+    """
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class AsyncOpenWeatherLoader:
+    """
+    asyncio OpenWeather client for polling many regions at once.
+    Keeps one pooled HTTP connection set, caps concurrency and calls/minute, caches
+    responses on rounded lat/lon, and lets concurrent callers for the same key share
+    a single upstream request.
+
+    Use as `async with AsyncOpenWeatherLoader() as loader: ...` or call aclose().
+    """
+    def __init__(self, max_concurrency=10, calls_per_minute=60, retries=3, timeout=10.0, transport=None):
+        self.api_key = os.getenv("OPENWEATHER_API_KEY")
+        self.base_url = BASE_URL
+        self.max_concurrency = max_concurrency
+        self.retries = retries
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency),
+            transport=transport or upstream_transport(
+                "openweather",
+                httpx.AsyncHTTPTransport(limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency))
+            )
+        )
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._limiter = RateLimiter(calls_per_minute / 60.0, burst=max_concurrency)
+        self._cache = OrderedDict()  # key -> (expires_at, data), least recently used first
+        self._inflight = {}  # key -> asyncio.Task
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def _request(self, path, lat, lon):
+        params = {"lat": lat, "lon": lon, "appid": self.api_key, "units": "metric"}
+        for attempt in range(self.retries + 1):
+            await self._limiter.acquire()
+            try:
+                async with self._semaphore:
+                    with metrics.timed(metrics.openweather_latency.labels(path)):
+                        response = await self.client.get(path, params=params)
+                metrics.openweather_calls.labels(path, str(response.status_code)).inc()
+                if response.status_code in RETRY_STATUSES and attempt < self.retries:
+                    metrics.openweather_retries.labels(path, str(response.status_code)).inc()
+                    delay = retry_after_seconds(response.headers.get("Retry-After"), 2 ** attempt)
+                    await asyncio.sleep(delay)
+                    continue
+                response.raise_for_status()
+                return response.json()
+            except (httpx.TransportError, ValueError) as e:
+                # A truncated or malformed body is retried like a dropped connection
+                reason = "transport_error" if isinstance(e, httpx.TransportError) else "bad_body"
+                metrics.openweather_calls.labels(path, reason).inc()
+                if attempt < self.retries:
+                    metrics.openweather_retries.labels(path, reason).inc()
+                    await asyncio.sleep(2 ** attempt)
+                    continue
+                print(f"Error fetching {path} data: {e}")
+                return None
+            except httpx.HTTPStatusError as e:
+                print(f"Error fetching {path} data: {e}")
+                return None
+
+    async def _cached(self, path, key, expires_at):
+        """
+        key is (path, lat, lon, ...) with lat/lon already snapped to the cache grid.
+        """
+        now = time.time()
+        entry = self._cache.get(key)
+        if entry is not None and entry[0] > now:
+            self.cache_hits += 1
+            metrics.record_cache("openweather", True)
+            self._cache.move_to_end(key)
+            return entry[1]
+
+        task = self._inflight.get(key)
+        if task is None:
+            self.cache_misses += 1
+            metrics.record_cache("openweather", False)
+            # Query the grid-cell centre so every caller sharing the key gets the same answer
+            task = asyncio.ensure_future(self._request(path, key[1], key[2]))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.cache_hits += 1
+            metrics.record_cache("openweather", True)
+
+        data = await asyncio.shield(task)
+        if data is not None:
+            self._cache[key] = (expires_at, data)
+            self._cache.move_to_end(key)
+            if len(self._cache) > MAX_CACHE_ENTRIES:
+                self.purge_expired()
+                while len(self._cache) > MAX_CACHE_ENTRIES:
+                    self._cache.popitem(last=False)
+        return data
+
+    def _grid(self, lat, lon):
+        return round(lat, COORD_DECIMALS), round(lon, COORD_DECIMALS)
+
+    async def get_current_weather(self, lat, lon):
+        """Fetches current weather data."""
+        lat, lon = self._grid(lat, lon)
+        return await self._cached("weather", ("weather", lat, lon), time.time() + CURRENT_TTL_SECONDS)
+
+    async def get_forecast(self, lat, lon):
+        """
+        Fetches the 5-day/3-hour forecast. Cached until the next forecast issue.
+        """
+        lat, lon = self._grid(lat, lon)
+        issue = int(time.time() // FORECAST_ISSUE_SECONDS)
+        expires_at = (issue + 1) * FORECAST_ISSUE_SECONDS
+        return await self._cached("forecast", ("forecast", lat, lon, issue), expires_at)
+
+    async def get_historical_rainfall(self, lat, lon):
+        """
+        5-day forecast rainfall as a proxy for 'recent trend' input for the LSTM.
+        """
+        data = await self.get_forecast(lat, lon)
+        return None if data is None else parse_forecast_rain(data)
+
+    async def fetch_regions(self, regions):
+        """
+        Fetches current weather and forecast rainfall for many regions concurrently.
+        regions: iterable of (lat, lon) pairs or dicts with "lat"/"lon"
+        Returns one {"lat", "lon", "current", "rainfall"} dict per region, in input order.
+        """
+        coords = [(r["lat"], r["lon"]) if isinstance(r, dict) else tuple(r) for r in regions]
+        current = asyncio.gather(*(self.get_current_weather(lat, lon) for lat, lon in coords))
+        rainfall = asyncio.gather(*(self.get_historical_rainfall(lat, lon) for lat, lon in coords))
+        current, rainfall = await asyncio.gather(current, rainfall)
+        return [
+            {"lat": lat, "lon": lon, "current": c, "rainfall": r}
+            for (lat, lon), c, r in zip(coords, current, rainfall)
+        ]
+
+    def purge_expired(self):
+        now = time.time()
+        for key in [k for k, (exp, _) in self._cache.items() if exp <= now]:
+            del self._cache[key]
+
+
 if __name__ == "__main__":
     # Test with a sample location (e.g., Munnar, Kerala - prone to landslides)
     loader = OpenWeatherLoader()
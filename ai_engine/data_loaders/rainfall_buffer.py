@@ -0,0 +1,171 @@
+import threading
+
+import numpy as np
+
+HOURLY_SLOTS = 72
+DAILY_SLOTS = 30
+HOURS_PER_DAY = 24
+
+
+class RainfallRingBuffer:
+    """
+    Rolling rainfall for many monitored regions, kept in fixed-size NumPy rings.
+
+    hourly: (regions, 72) mm per hour, with running 24h and 72h sums
+    daily:  (regions, 30) mm per day, with a running 30-day sum
+
+    Appending one reading for every region is O(regions): the running sums add the new
+    value and subtract the one leaving the window instead of re-summing the history.
+    Every 24 hourly readings roll up into one daily reading, so a pure hourly feed (e.g.
+    GSMaP or OpenWeather) also fills the 30-day LSTM window. Daily sources (e.g. CHIRPS)
+    can call append_daily directly instead.
+    """
+    def __init__(self, regions=(), hourly_slots=HOURLY_SLOTS, daily_slots=DAILY_SLOTS):
+        if hourly_slots < HOURS_PER_DAY:
+            raise ValueError(f"hourly_slots must be at least {HOURS_PER_DAY}")
+        self.hourly_slots = hourly_slots
+        self.daily_slots = daily_slots
+        self.region_names = []
+        self.region_index = {}
+
+        self.hourly = np.zeros((0, hourly_slots), dtype=np.float32)
+        self.daily = np.zeros((0, daily_slots), dtype=np.float32)
+        # float64 running sums; recomputed from the rings on every wrap to drop rounding drift
+        self.sum_24h = np.zeros(0)
+        self.sum_hourly = np.zeros(0)
+        self.sum_daily = np.zeros(0)
+        self._day_total = np.zeros(0)
+
+        self._hour_pos = 0
+        self._day_pos = 0
+        self._hours_into_day = 0
+        self.hours_seen = 0
+        self.days_seen = 0
+        self._lock = threading.Lock()
+
+        if regions:
+            self.add_regions(regions)
+
+    def add_regions(self, names):
+        """
+        Registers regions (existing names are ignored). New regions start with no rainfall.
+        """
+        new = [n for n in dict.fromkeys(names) if n not in self.region_index]
+        if not new:
+            return
+        with self._lock:
+            for name in new:
+                self.region_index[name] = len(self.region_names)
+                self.region_names.append(name)
+            pad = len(new)
+            self.hourly = np.vstack([self.hourly, np.zeros((pad, self.hourly_slots), dtype=np.float32)])
+            self.daily = np.vstack([self.daily, np.zeros((pad, self.daily_slots), dtype=np.float32)])
+            self.sum_24h = np.concatenate([self.sum_24h, np.zeros(pad)])
+            self.sum_hourly = np.concatenate([self.sum_hourly, np.zeros(pad)])
+            self.sum_daily = np.concatenate([self.sum_daily, np.zeros(pad)])
+            self._day_total = np.concatenate([self._day_total, np.zeros(pad)])
+
+    def _values(self, readings):
+        """
+        Accepts an array ordered like region_names or a {region: mm} dict (missing regions -> 0).
+        NaN readings count as no rain.
+        """
+        if isinstance(readings, dict):
+            values = np.zeros(len(self.region_names))
+            for name, value in readings.items():
+                i = self.region_index.get(name)
+                if i is not None and value is not None:
+                    values[i] = value
+        else:
+            values = np.asarray(readings, dtype=np.float64).reshape(-1)
+            if len(values) != len(self.region_names):
+                raise ValueError(f"Expected {len(self.region_names)} readings, got {len(values)}")
+        return np.nan_to_num(values, nan=0.0)
+
+    def append_hourly(self, readings):
+        """
+        Appends one hour of rainfall (mm) for every region.
+        """
+        values = self._values(readings)
+        with self._lock:
+            pos = self._hour_pos
+            self.sum_hourly += values - self.hourly[:, pos]
+            self.sum_24h += values - self.hourly[:, (pos - HOURS_PER_DAY) % self.hourly_slots]
+            self.hourly[:, pos] = values
+            self._hour_pos = (pos + 1) % self.hourly_slots
+            self.hours_seen += 1
+            if self._hour_pos == 0:
+                self.sum_hourly = self.hourly.sum(axis=1, dtype=np.float64)
+                self.sum_24h = self._window_sum(HOURS_PER_DAY)
+
+            self._day_total += values
+            self._hours_into_day += 1
+            if self._hours_into_day == HOURS_PER_DAY:
+                day_total = self._day_total
+                self._day_total = np.zeros(len(self.region_names))
+                self._hours_into_day = 0
+                self._push_day(day_total)
+
+    def append_daily(self, readings):
+        """
+        Appends one day of rainfall (mm) for every region.
+        """
+        values = self._values(readings)
+        with self._lock:
+            self._push_day(values)
+
+    def _push_day(self, values):
+        pos = self._day_pos
+        self.sum_daily += values - self.daily[:, pos]
+        self.daily[:, pos] = values
+        self._day_pos = (pos + 1) % self.daily_slots
+        self.days_seen += 1
+        if self._day_pos == 0:
+            self.sum_daily = self.daily.sum(axis=1, dtype=np.float64)
+
+    def _window_sum(self, hours):
+        slots = (self._hour_pos - 1 - np.arange(hours)) % self.hourly_slots
+        return self.hourly[:, slots].sum(axis=1, dtype=np.float64)
+
+    def fill_daily(self, series):
+        """
+        Seeds the daily ring from a (regions, n) history, oldest first, e.g. the output of
+        GEELoader.get_rainfall_series_batch for the region centroids.
+        """
+        series = np.nan_to_num(np.asarray(series, dtype=np.float64), nan=0.0)
+        for day in series[:, -self.daily_slots:].T:
+            self.append_daily(day)
+
+    def accumulations(self):
+        """
+        Returns {"24h", "72h", "30d"} -> (regions,) float arrays of accumulated rainfall in mm.
+        "72h" covers the whole hourly ring, whatever its length.
+        """
+        with self._lock:
+            return {
+                "24h": np.maximum(self.sum_24h, 0.0),
+                "72h": np.maximum(self.sum_hourly, 0.0),
+                "30d": np.maximum(self.sum_daily, 0.0)
+            }
+
+    def region_accumulations(self):
+        """
+        Same as accumulations(), keyed by region name.
+        """
+        sums = self.accumulations()
+        return {
+            name: {window: float(values[i]) for window, values in sums.items()}
+            for i, name in enumerate(self.region_names)
+        }
+
+    def lstm_batch(self, out=None):
+        """
+        Daily rainfall as a (regions, 30, 1) float32 batch, oldest day first, ready for the LSTM.
+        Pass `out` to reuse a preallocated array between ticks.
+        """
+        with self._lock:
+            order = (self._day_pos + np.arange(self.daily_slots)) % self.daily_slots
+            if out is None:
+                out = np.empty((len(self.region_names), self.daily_slots, 1), dtype=np.float32)
+            np.take(self.daily, order, axis=1, out=out[:, :, 0])
+        return out
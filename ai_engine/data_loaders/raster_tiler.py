@@ -0,0 +1,78 @@
+import numpy as np
+
+PATCH_SIZE = 256
+OVERLAP = 32
+
+
+def tile_id(transform, row_off, col_off):
+    """
+    Stable id of a patch: the map coordinates of its upper-left corner.
+    Rasters on the same grid give the same id to the same patch across acquisitions.
+    """
+    x, y = transform * (col_off, row_off)
+    return f"{x:.6f},{y:.6f}"
+
+
+def patch_grid(width, height, patch_size=PATCH_SIZE, overlap=OVERLAP):
+    """
+    Yields (row_off, col_off) of every patch covering a width x height raster.
+    """
+    stride = patch_size - overlap
+    if stride <= 0:
+        raise ValueError("overlap must be smaller than patch_size")
+    for row_off in range(0, max(height - overlap, 1), stride):
+        for col_off in range(0, max(width - overlap, 1), stride):
+            yield row_off, col_off
+
+
+def iter_patches(path, patch_size=PATCH_SIZE, overlap=OVERLAP, bands=(1, 2, 3), normalize=None):
+    """
+    Streams (tile_id, patch) pairs from a large SAR or optical raster.
+    Patches are (patch_size, patch_size, len(bands)) float32, read one window at a time
+    so memory does not depend on the raster size. Edge patches are zero-padded.
+    Single-band rasters (e.g. SAR VH) can pass bands=(1, 1, 1) to fill the CNN's 3 channels.
+
+    normalize: optional callable applied to each patch (e.g. dB -> 0..1 scaling)
+    """
+    import rasterio
+    from rasterio.windows import Window
+
+    with rasterio.open(path) as src:
+        for row_off, col_off in patch_grid(src.width, src.height, patch_size, overlap):
+            window = Window(col_off, row_off, patch_size, patch_size)
+            data = src.read(list(bands), window=window, boundless=True, fill_value=0, out_dtype=np.float32)
+            patch = np.moveaxis(data, 0, -1)
+            if normalize is not None:
+                patch = normalize(patch)
+            yield tile_id(src.transform, row_off, col_off), patch
+
+
+def raster_grid(path, patch_size=PATCH_SIZE, overlap=OVERLAP):
+    """
+    Describes the patch grid of a raster so points can later be mapped to their patch.
+    """
+    import rasterio
+
+    with rasterio.open(path) as src:
+        return {
+            "transform": list(src.transform)[:6],
+            "crs": src.crs.to_wkt() if src.crs else None,
+            "width": src.width,
+            "height": src.height,
+            "patch_size": patch_size,
+            "overlap": overlap
+        }
+
+
+def batched(iterable, batch_size):
+    """
+    Groups an iterator into lists of at most batch_size items.
+    """
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,443 @@
+"""
+Record/replay layer for the upstream services (Earth Engine, OpenWeather).
+
+UPSTREAM_MODE=live    talk to the real services (default)
+UPSTREAM_MODE=record  talk to the real services and append every response to a cassette
+UPSTREAM_MODE=replay  answer from the cassettes only; nothing leaves the machine
+
+Cassettes are JSON-lines files under CASSETTE_DIR, one per service (gee.jsonl,
+openweather.jsonl). API keys are stripped from recorded URLs. In replay mode a
+FaultProfile adds latency, upstream errors and throttling (HTTP 429 / EE quota errors),
+configured with the REPLAY_* environment variables, so load behaviour under a slow or
+flaky upstream can be reproduced on an isolated machine.
+"""
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+UPSTREAM_MODE = os.getenv("UPSTREAM_MODE", "live").lower()
+CASSETTE_DIR = os.getenv("CASSETTE_DIR", os.path.join("data", "cassettes"))
+SECRET_PARAMS = ("appid", "api_key", "apikey", "key", "access_token", "token")
+LATENCY_MODELS = ("none", "fixed", "uniform", "lognormal", "recorded")
+
+
+class CassetteMiss(LookupError):
+    pass
+
+
+class UpstreamThrottled(RuntimeError):
+    pass
+
+
+class UpstreamError(RuntimeError):
+    pass
+
+
+def scrub_url(url):
+    """
+    Drops secret query parameters and sorts the rest so equivalent requests share a key.
+    """
+    parts = urlsplit(str(url))
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k.lower() not in SECRET_PARAMS)
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), ""))
+
+
+def request_key(*parts):
+    return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class FaultProfile:
+    """
+    Latency and failure model applied to replayed responses.
+
+    latency: "none", "fixed" (latency_ms), "uniform" (0..2*latency_ms),
+             "lognormal" (median latency_ms, spread sigma) or "recorded" (the original
+             response time, times `speed`)
+    error_rate:    fraction of calls answered with an upstream failure (HTTP 503 / EE error)
+    throttle_rate: fraction of calls answered with HTTP 429 (Retry-After: retry_after) / EE quota error
+    """
+    def __init__(self, latency="none", latency_ms=0.0, sigma=0.5, error_rate=0.0, throttle_rate=0.0,
+                 retry_after=1.0, speed=1.0, seed=None):
+        if latency not in LATENCY_MODELS:
+            raise ValueError(f"latency must be one of {LATENCY_MODELS}")
+        self.latency = latency
+        self.latency_ms = latency_ms
+        self.sigma = sigma
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.speed = speed
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        seed = os.getenv("REPLAY_SEED")
+        return cls(
+            latency=os.getenv("REPLAY_LATENCY", "recorded"),
+            latency_ms=float(os.getenv("REPLAY_LATENCY_MS", 0)),
+            sigma=float(os.getenv("REPLAY_LATENCY_SIGMA", 0.5)),
+            error_rate=float(os.getenv("REPLAY_ERROR_RATE", 0)),
+            throttle_rate=float(os.getenv("REPLAY_THROTTLE_RATE", 0)),
+            retry_after=float(os.getenv("REPLAY_RETRY_AFTER", 1)),
+            speed=float(os.getenv("REPLAY_SPEED", 1)),
+            seed=int(seed) if seed else None
+        )
+
+    def delay(self, recorded_s=0.0):
+        """
+        Seconds to wait before answering one call.
+        """
+        with self._lock:
+            if self.latency == "fixed":
+                return self.latency_ms / 1000.0
+            if self.latency == "uniform":
+                return self._rng.uniform(0, 2 * self.latency_ms) / 1000.0
+            if self.latency == "lognormal":
+                return self._rng.lognormvariate(math.log(max(self.latency_ms, 1e-3)), self.sigma) / 1000.0
+            if self.latency == "recorded":
+                return (recorded_s or 0.0) * self.speed
+            return 0.0
+
+    def fault(self):
+        """
+        Returns None, "throttle" or "error" for one call.
+        """
+        with self._lock:
+            roll = self._rng.random()
+        if roll < self.throttle_rate:
+            return "throttle"
+        if roll < self.throttle_rate + self.error_rate:
+            return "error"
+        return None
+
+
+class Cassette:
+    """
+    Append-only store of recorded responses: <root>/<name>.jsonl, one interaction per line.
+    Each request key is recorded once; a key that appears several times in a hand-merged
+    cassette replays its responses in turn.
+    """
+    def __init__(self, name, root=CASSETTE_DIR):
+        self.name = name
+        self.path = os.path.join(root, f"{name}.jsonl")
+        self._entries = {}  # key -> [entry]
+        self._cursor = {}   # key -> index of the next entry to replay
+        self._lock = threading.Lock()
+        self.misses = 0
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._entries.setdefault(entry["key"], []).append(entry)
+
+    def __len__(self):
+        return sum(len(entries) for entries in self._entries.values())
+
+    def record(self, key, request, response, elapsed_s):
+        entry = {"key": key, "request": request, "response": response, "elapsed_s": round(elapsed_s, 4)}
+        with self._lock:
+            if key in self._entries:
+                return
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+            self._entries.setdefault(key, []).append(entry)
+
+    def lookup(self, key):
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                self.misses += 1
+                raise CassetteMiss(f"No recorded response in {self.path} for {key}")
+            i = self._cursor.get(key, 0)
+            self._cursor[key] = (i + 1) % len(entries)
+            return entries[i]
+
+
+_cassettes = {}
+_cassettes_lock = threading.Lock()
+
+
+def get_cassette(name):
+    """
+    Process-wide cassette for a service, so every client of that service shares one file.
+    """
+    with _cassettes_lock:
+        if name not in _cassettes:
+            _cassettes[name] = Cassette(name)
+        return _cassettes[name]
+
+
+# --- HTTP (httpx for the async clients, requests for the sync ones) ---
+
+def _http_key(method, url, body):
+    return request_key("http", method.upper(), scrub_url(url), hashlib.sha1(body or b"").hexdigest())
+
+
+def _http_request_summary(method, url):
+    return {"method": method.upper(), "url": scrub_url(url)}
+
+
+def _http_response_summary(status, headers, content):
+    keep = {k: v for k, v in headers.items() if k.lower() in ("content-type", "retry-after", "cache-control")}
+    return {"status": status, "headers": keep, "body": content.decode("utf-8", errors="replace")}
+
+
+def _replayed_http(cassette, profile, key):
+    """
+    Returns (delay_s, status, headers, body bytes) for a replayed HTTP call, with faults applied.
+    """
+    fault = profile.fault()
+    if fault == "throttle":
+        return profile.delay(), 429, {"Retry-After": str(profile.retry_after)}, b'{"cod":429,"message":"throttled (replay)"}'
+    if fault == "error":
+        return profile.delay(), 503, {}, b'{"cod":503,"message":"upstream error (replay)"}'
+    try:
+        entry = cassette.lookup(key)
+    except CassetteMiss as e:
+        print(f"Replay miss: {e}")
+        return 0.0, 404, {}, b'{"cod":404,"message":"not in cassette"}'
+    response = entry["response"]
+    return profile.delay(entry.get("elapsed_s", 0.0)), response["status"], response["headers"], response["body"].encode()
+
+
+try:
+    import httpx
+
+    class ReplayTransport(httpx.AsyncBaseTransport):
+        """
+        httpx transport that records through `inner` or replays from `cassette`.
+        Pass as AsyncClient(transport=...); connection limits belong on `inner`.
+        """
+        def __init__(self, cassette, mode=None, profile=None, inner=None):
+            self.cassette = cassette
+            self.mode = mode or UPSTREAM_MODE
+            self.profile = profile or FaultProfile.from_env()
+            self.inner = inner or httpx.AsyncHTTPTransport()
+
+        async def handle_async_request(self, request):
+            body = await request.aread()
+            key = _http_key(request.method, request.url, body)
+            if self.mode == "replay":
+                delay, status, headers, content = _replayed_http(self.cassette, self.profile, key)
+                if delay:
+                    await asyncio.sleep(delay)
+                return httpx.Response(status, headers=headers, content=content, request=request)
+
+            start = time.perf_counter()
+            response = await self.inner.handle_async_request(request)
+            content = await response.aread()
+            if self.mode == "record":
+                self.cassette.record(
+                    key, _http_request_summary(request.method, request.url),
+                    _http_response_summary(response.status_code, response.headers, content),
+                    time.perf_counter() - start
+                )
+            return response
+
+        async def aclose(self):
+            await self.inner.aclose()
+
+except ImportError:
+    ReplayTransport = None
+
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+    from requests.structures import CaseInsensitiveDict
+
+    class ReplayAdapter(HTTPAdapter):
+        """
+        requests adapter that records real responses or replays them from `cassette`.
+        Mount it in place of HTTPAdapter; urllib3 retries only apply to live/record traffic.
+        """
+        def __init__(self, cassette, mode=None, profile=None, **kwargs):
+            super().__init__(**kwargs)
+            self.cassette = cassette
+            self.mode = mode or UPSTREAM_MODE
+            self.profile = profile or FaultProfile.from_env()
+
+        def send(self, request, **kwargs):
+            body = request.body.encode() if isinstance(request.body, str) else request.body
+            key = _http_key(request.method, request.url, body)
+            if self.mode == "replay":
+                delay, status, headers, content = _replayed_http(self.cassette, self.profile, key)
+                if delay:
+                    time.sleep(delay)
+                response = requests.Response()
+                response.status_code = status
+                response.headers = CaseInsensitiveDict(headers)
+                response._content = content
+                response.url = request.url
+                response.request = request
+                response.encoding = "utf-8"
+                return response
+
+            start = time.perf_counter()
+            response = super().send(request, **kwargs)
+            if self.mode == "record":
+                self.cassette.record(
+                    key, _http_request_summary(request.method, request.url),
+                    _http_response_summary(response.status_code, response.headers, response.content),
+                    time.perf_counter() - start
+                )
+            return response
+
+except ImportError:
+    ReplayAdapter = None
+
+
+def upstream_transport(service, inner=None):
+    """
+    httpx transport for `service` according to UPSTREAM_MODE, or None in live mode.
+    """
+    if UPSTREAM_MODE == "live" or ReplayTransport is None:
+        return inner
+    return ReplayTransport(get_cassette(service), inner=inner)
+
+
+# --- Earth Engine ---
+
+class _TileFetcher:
+    def __init__(self, url_format):
+        self.url_format = url_format
+
+
+def _date_reference(value, values):
+    """
+    The values-table reference holding an ee.Date's epoch-millisecond constant, True when the
+    constant is inline, or None when the date is not a plain number (e.g. a 'YYYY-MM-DD' string).
+    """
+    if isinstance(value, dict) and "valueReference" in value:
+        ref = value["valueReference"]
+        return ref if _date_reference(values.get(ref), values) is True else None
+    if isinstance(value, dict):
+        value = value.get("constantValue")
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return True
+    return None
+
+
+def normalize_ee_expression(expression):
+    """
+    Masks ee.Date constants given as epoch milliseconds. Those come from Python datetimes,
+    typically the clock (ee.Date(datetime.utcnow()), "the last 90 days"), so they differ on
+    every call; masked, a time-relative request replays its recording at any later time.
+    Dates written as strings are part of the request and kept.
+    """
+    try:
+        tree = json.loads(expression)
+    except (TypeError, ValueError):
+        return expression
+    values = tree.get("values", {}) if isinstance(tree, dict) else {}
+    masked_refs = set()
+
+    def mask(node):
+        if isinstance(node, list):
+            return [mask(item) for item in node]
+        if not isinstance(node, dict):
+            return node
+        node = {key: mask(item) for key, item in node.items()}
+        arguments = node.get("arguments")
+        if node.get("functionName") == "Date" and isinstance(arguments, dict) and "value" in arguments:
+            ref = _date_reference(arguments["value"], values)
+            if ref is True:
+                node["arguments"] = {**arguments, "value": "<date>"}
+            elif ref is not None:
+                masked_refs.add(ref)
+        return node
+
+    tree = mask(tree)
+    for ref in masked_refs:
+        tree["values"][ref] = "<date>"
+    return json.dumps(tree, sort_keys=True, separators=(",", ":"))
+
+
+def _ee_key(method, obj, args, kwargs):
+    try:
+        expression = normalize_ee_expression(obj.serialize())
+    except Exception:
+        expression = repr(obj)
+    return request_key("ee", method, expression, args, kwargs)
+
+
+def _ee_fault(ee_module, profile, method):
+    fault = profile.fault()
+    if fault is None:
+        return None
+    error = getattr(ee_module, "EEException", None)
+    if fault == "throttle":
+        message = f"Too many concurrent aggregations (replay {method})"
+        return error(message) if error else UpstreamThrottled(message)
+    message = f"Internal error (replay {method})"
+    return error(message) if error else UpstreamError(message)
+
+
+def _hook(ee_module, original, method, cassette, mode, profile):
+    def to_record(result):
+        if method == "getMapId":
+            fetcher = result.get("tile_fetcher")
+            return {"mapid": result.get("mapid"), "url_format": getattr(fetcher, "url_format", None)}
+        return result
+
+    def from_record(stored):
+        if method == "getMapId":
+            return {"mapid": stored["mapid"], "tile_fetcher": _TileFetcher(stored["url_format"])}
+        return stored
+
+    def wrapper(self, *args, **kwargs):
+        key = _ee_key(method, self, args, kwargs)
+        if mode == "replay":
+            error = _ee_fault(ee_module, profile, method)
+            entry = None if error else cassette.lookup(key)
+            delay = profile.delay(entry["elapsed_s"] if entry else 0.0)
+            if delay:
+                time.sleep(delay)
+            if error:
+                raise error
+            return from_record(entry["response"])
+
+        start = time.perf_counter()
+        result = original(self, *args, **kwargs)
+        cassette.record(key, {"method": method}, to_record(result), time.perf_counter() - start)
+        return result
+
+    wrapper.__replay_original__ = original
+    return wrapper
+
+
+def install_ee_hooks(ee_module=None, mode=None, cassette=None, profile=None):
+    """
+    Routes every getInfo/getMapId of the `ee` client through the cassette.
+    Expressions are keyed by their serialized form (with clock-derived dates masked, see
+    normalize_ee_expression), so the same computation replays the same answer.
+    Safe to call more than once. Returns the number of methods hooked.
+    """
+    if ee_module is None:
+        import ee as ee_module
+    mode = mode or UPSTREAM_MODE
+    if mode == "live":
+        return 0
+    if cassette is None:  # not `or`: an empty Cassette is falsy
+        cassette = get_cassette("gee")
+    profile = profile or FaultProfile.from_env()
+
+    hooked = 0
+    classes = [c for c in vars(ee_module).values() if isinstance(c, type)]
+    for cls in {base for c in classes for base in c.__mro__}:
+        for method in ("getInfo", "getMapId"):
+            original = cls.__dict__.get(method)
+            if original is None or hasattr(original, "__replay_original__"):
+                continue
+            setattr(cls, method, _hook(ee_module, original, method, cassette, mode, profile))
+            hooked += 1
+    return hooked
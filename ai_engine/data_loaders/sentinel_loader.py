@@ -1,9 +1,51 @@
-from sentinelsat import SentinelAPI, read_geojson, geojson_to_wkt
-from datetime import date
+from datetime import date, datetime
+import hashlib
+import json
 import os
+import re
+import threading
+import time
+from concurrent.futures import Future
+
+import requests
+
+from .sentinel_downloads import HASHES, DownloadManager, ProductCache
+
+# Copernicus Data Space Ecosystem (OData); point these at a local stand-in for tests
+SENTINEL_CATALOGUE_URL = os.getenv("SENTINEL_CATALOGUE_URL", "https://catalogue.dataspace.copernicus.eu/odata/v1")
+SENTINEL_DOWNLOAD_URL = os.getenv("SENTINEL_DOWNLOAD_URL", "https://zipper.dataspace.copernicus.eu/odata/v1")
+SENTINEL_TOKEN_URL = os.getenv(
+    "SENTINEL_TOKEN_URL", "https://identity.dataspace.copernicus.eu/auth/realms/CDSE/protocol/openid-connect/token"
+)
+# Identical searches (same AOI, window and product type) within this period reuse the first result
+SEARCH_TTL_SECONDS = float(os.getenv("SENTINEL_SEARCH_TTL_HOURS", 24)) * 3600
+SEARCH_PAGE_SIZE = 100
+
+
+def iso_date(value):
+    """
+    'YYYY-MM-DD' from a date, datetime, 'YYYYMMDD' or 'YYYY-MM-DD'.
+    """
+    if isinstance(value, (date, datetime)):
+        return value.strftime("%Y-%m-%d")
+    value = str(value).strip()
+    if re.fullmatch(r"\d{8}", value):
+        return f"{value[:4]}-{value[4:6]}-{value[6:]}"
+    return value[:10]
+
+
+def normalize_wkt(wkt):
+    wkt = re.sub(r"\s+", " ", wkt.strip())
+    return re.sub(r"\s*([(),])\s*", r"\1", wkt).upper()
+
+
+def search_key(aoi_wkt, start_date, end_date, product_type):
+    raw = json.dumps([normalize_wkt(aoi_wkt), iso_date(start_date), iso_date(end_date), product_type])
+    return hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()
+
 
 class SentinelLoader:
-    def __init__(self):
+    def __init__(self, cache=None):
         # Using Sentinel Hub credentials (OAuth2)
         self.client_id = os.getenv("SENTINEL_CLIENT_ID")
         self.client_secret = os.getenv("SENTINEL_CLIENT_SECRET")
@@ -11,25 +53,149 @@ class SentinelLoader:
         self.user = os.getenv("SENTINEL_USER")
         self.password = os.getenv("SENTINEL_PASSWORD")
 
-    def search_satellite_imagery(self, aoi_wkt, start_date, end_date):
+        self.session = requests.Session()
+        self.downloads = DownloadManager(cache or ProductCache(), headers=self._auth_headers)
+        self._token = None
+        self._token_expires = 0.0
+        self._token_lock = threading.Lock()
+        self._searches = {}   # key -> (expires at, products)
+        self._searching = {}  # key -> Future of an in-flight search
+        self._search_lock = threading.Lock()
+
+    def _auth_headers(self):
+        token = self._access_token()
+        return {"Authorization": f"Bearer {token}"} if token else {}
+
+    def _access_token(self):
+        if self.client_id and self.client_secret:
+            data = {"grant_type": "client_credentials", "client_id": self.client_id, "client_secret": self.client_secret}
+        elif self.user and self.password:
+            data = {"grant_type": "password", "client_id": "cdse-public", "username": self.user, "password": self.password}
+        else:
+            return None  # anonymous (catalogue, local stand-ins)
+        with self._token_lock:
+            if self._token is None or time.time() > self._token_expires:
+                response = self.session.post(SENTINEL_TOKEN_URL, data=data, timeout=30)
+                response.raise_for_status()
+                payload = response.json()
+                self._token = payload["access_token"]
+                self._token_expires = time.time() + payload.get("expires_in", 600) - 60
+            return self._token
+
+    def _search_path(self, key):
+        return os.path.join(self.downloads.cache.root, "searches", f"{key}.json")
+
+    def _cached_search(self, key):
+        cached = self._searches.get(key)
+        if cached is None:
+            try:
+                with open(self._search_path(key)) as f:
+                    stored = json.load(f)
+                cached = self._searches[key] = (stored["expires"], stored["products"])
+            except (FileNotFoundError, ValueError, KeyError):
+                return None
+        expires, products = cached
+        return products if time.time() < expires else None
+
+    def search_satellite_imagery(self, aoi_wkt, start_date, end_date, product_type="GRD"):
         """
         Search for Sentinel-1 products.
+        Returns a list of {"id", "name", "size", "checksum", "date", "url"}, newest first.
+        Repeated and concurrent searches for the same AOI/window share one catalogue query.
         """
-        print(f"Searching for Sentinel-1 data for AOI: {aoi_wkt} from {start_date} to {end_date}")
-        # products = self.api.query(aoi_wkt,
-        #                           date=(start_date, end_date),
-        #                           platformname='Sentinel-1',
-        #                           producttype='GRD')
-        # return products
-        return {"mock_data": "Sentinel-1 GRD Product ID 12345"}
-
-    def download_product(self, product_id):
+        key = search_key(aoi_wkt, start_date, end_date, product_type)
+        with self._search_lock:
+            products = self._cached_search(key)
+            if products is not None:
+                return products
+            future = self._searching.get(key)
+            owner = future is None
+            if owner:
+                future = self._searching[key] = Future()
+        if not owner:
+            return future.result()
+
+        try:
+            print(f"Searching for Sentinel-1 data for AOI: {aoi_wkt} from {start_date} to {end_date}")
+            products = self._query(aoi_wkt, start_date, end_date, product_type)
+            expires = time.time() + SEARCH_TTL_SECONDS
+            path = self._search_path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + ".tmp", "w") as f:
+                json.dump({"expires": expires, "products": products}, f)
+            os.replace(path + ".tmp", path)
+            with self._search_lock:
+                self._searches[key] = (expires, products)
+            future.set_result(products)
+            return products
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._search_lock:
+                self._searching.pop(key, None)
+
+    def _query(self, aoi_wkt, start_date, end_date, product_type):
+        odata_filter = (
+            "Collection/Name eq 'SENTINEL-1'"
+            f" and OData.CSC.Intersects(area=geography'SRID=4326;{normalize_wkt(aoi_wkt)}')"
+            f" and ContentDate/Start ge {iso_date(start_date)}T00:00:00.000Z"
+            f" and ContentDate/Start le {iso_date(end_date)}T23:59:59.999Z"
+            f" and contains(Name,'_{product_type}')"
+        )
+        url = f"{SENTINEL_CATALOGUE_URL}/Products"
+        params = {"$filter": odata_filter, "$orderby": "ContentDate/Start desc", "$top": SEARCH_PAGE_SIZE}
+        products = {}
+        while url:
+            response = self.session.get(url, params=params, timeout=60)
+            response.raise_for_status()
+            data = response.json()
+            for item in data.get("value", []):
+                products.setdefault(item["Id"], self._product(item))
+            url, params = data.get("@odata.nextLink"), None
+        return list(products.values())
+
+    @staticmethod
+    def _product(item):
+        checksum = None
+        checksums = {c.get("Algorithm", "").upper(): c.get("Value") for c in item.get("Checksum") or []}
+        for algorithm in HASHES:
+            if checksums.get(algorithm):
+                checksum = (algorithm, checksums[algorithm])
+                break
+        return {
+            "id": item["Id"],
+            "name": item.get("Name"),
+            "size": item.get("ContentLength"),
+            "checksum": checksum,
+            "date": (item.get("ContentDate") or {}).get("Start"),
+            "url": f"{SENTINEL_DOWNLOAD_URL}/Products({item['Id']})/$value"
+        }
+
+    def get_product(self, product_id):
+        response = self.session.get(f"{SENTINEL_CATALOGUE_URL}/Products({product_id})", timeout=60)
+        response.raise_for_status()
+        return self._product(response.json())
+
+    def download_product(self, product):
+        """
+        Download a product (search result or product ID) into the local cache; returns its path.
+        Cached products are returned without touching the network.
+        """
+        if isinstance(product, str):
+            cached = self.downloads.cache.get(product)
+            if cached is not None:
+                return cached
+            product = self.get_product(product)
+        print(f"Downloading product: {product['name'] or product['id']}")
+        return self.downloads.download(product)
+
+    def download_products(self, products):
         """
-        Download product by ID.
+        Downloads several products concurrently. Returns {product id: path or exception}.
         """
-        print(f"Downloading product: {product_id}")
-        # self.api.download(product_id)
+        return self.downloads.download_many(products)
 
 if __name__ == "__main__":
     loader = SentinelLoader()
-    loader.search_satellite_imagery("POLYGON((...))", "20230101", "20230110")
+    loader.search_satellite_imagery("POLYGON((76.6 11.3, 76.8 11.3, 76.8 11.5, 76.6 11.5, 76.6 11.3))", "20230101", "20230110")
@@ -0,0 +1,228 @@
+import json
+import math
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+TERRAIN_STORE_DIR = os.getenv("TERRAIN_STORE_DIR", os.path.join("data", "terrain"))
+INDEX_FILE = "index.json"
+BANDS = ("elevation", "slope")
+
+# Metres per degree of latitude (longitude scales with cos(lat))
+METERS_PER_DEGREE = 111320.0
+
+
+def _origin(value, width):
+    # Whole degrees zero-padded as in SRTM names; a fractional part follows after "p" (11.5 -> 11p5)
+    value = round(abs(value), 6)
+    whole, fraction = f"{value:.6f}".split(".")
+    fraction = fraction.rstrip("0")
+    return whole.zfill(width) + (f"p{fraction}" if fraction else "")
+
+
+def tile_name(lat, lon, tile_deg=1.0):
+    """
+    SRTM-style tile name of the tile whose south-west corner contains (lat, lon), e.g. N11E076,
+    or N11p5E076p25 when tiles are smaller than a degree.
+    """
+    # The tolerance keeps corners produced by float arithmetic (e.g. 3 * 0.1) in their own tile
+    south = math.floor(lat / tile_deg + 1e-9) * tile_deg
+    west = math.floor(lon / tile_deg + 1e-9) * tile_deg
+    return f"{'N' if south >= 0 else 'S'}{_origin(south, 2)}{'E' if west >= 0 else 'W'}{_origin(west, 3)}"
+
+
+def compute_slope(elevation, res_x, res_y, lat):
+    """
+    Slope in degrees from an elevation grid in geographic coordinates, using central differences.
+    `elevation` should carry a one-pixel halo; the returned grid is trimmed to the interior.
+    """
+    dx = res_x * METERS_PER_DEGREE * math.cos(math.radians(lat))
+    dy = res_y * METERS_PER_DEGREE
+    dz_dy, dz_dx = np.gradient(elevation.astype(np.float64), dy, dx)
+    slope = np.degrees(np.arctan(np.hypot(dz_dx, dz_dy)))
+    return slope[1:-1, 1:-1].astype(np.float32)
+
+
+class TerrainRasterStore:
+    """
+    Local tiled elevation/slope store.
+    Each tile is a (2, rows, cols) float32 .npy file holding [elevation, slope] that is memory-mapped
+    on first use; an LRU bounds the number of open tiles. Missing data is stored as NaN.
+    """
+    def __init__(self, root=TERRAIN_STORE_DIR, max_open_tiles=16):
+        self.root = root
+        self.max_open_tiles = max_open_tiles
+        self._open = OrderedDict()
+        self._lock = threading.Lock()
+        self.index = self._load_index()
+
+    def _load_index(self):
+        path = os.path.join(self.root, INDEX_FILE)
+        if not os.path.exists(path):
+            return {"tile_deg": 1.0, "tiles": {}}
+        with open(path) as f:
+            return json.load(f)
+
+    @property
+    def available(self):
+        return bool(self.index["tiles"])
+
+    def _tile(self, name):
+        with self._lock:
+            tile = self._open.get(name)
+            if tile is not None:
+                self._open.move_to_end(name)
+                return tile
+        if name not in self.index["tiles"]:
+            return None
+
+        tile = np.load(os.path.join(self.root, f"{name}.npy"), mmap_mode="r")
+        with self._lock:
+            self._open[name] = tile
+            self._open.move_to_end(name)
+            while len(self._open) > self.max_open_tiles:
+                self._open.popitem(last=False)
+        return tile
+
+    def _pixel(self, meta, lat, lon):
+        row = np.floor((meta["north"] - lat) / meta["res_y"]).astype(np.intp)
+        col = np.floor((lon - meta["west"]) / meta["res_x"]).astype(np.intp)
+        return row, col
+
+    def get_point(self, lat, lon):
+        """
+        Returns {"elevation", "slope"} at a point, or None if the point is not covered.
+        """
+        name = tile_name(lat, lon, self.index["tile_deg"])
+        tile = self._tile(name)
+        if tile is None:
+            return None
+
+        meta = self.index["tiles"][name]
+        row, col = self._pixel(meta, lat, lon)
+        if not (0 <= row < tile.shape[1] and 0 <= col < tile.shape[2]):
+            return None
+        elevation, slope = tile[:, row, col]
+        if np.isnan(elevation) or np.isnan(slope):
+            return None
+        return {"elevation": float(elevation), "slope": float(slope)}
+
+    def sample(self, lats, lons):
+        """
+        Vectorized point lookup.
+        Returns (elevation, slope) float32 arrays; uncovered points are NaN.
+        """
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        out = np.full((2,) + lats.shape, np.nan, dtype=np.float32)
+
+        tile_deg = self.index["tile_deg"]
+        south = np.floor(lats / tile_deg).astype(np.int64)
+        west = np.floor(lons / tile_deg).astype(np.int64)
+        cells = np.stack([south.ravel(), west.ravel()], axis=1)
+        unique, inverse = np.unique(cells, axis=0, return_inverse=True)
+        inverse = inverse.reshape(lats.shape)
+
+        for i, (s, w) in enumerate(unique):
+            name = tile_name(s * tile_deg, w * tile_deg, tile_deg)
+            tile = self._tile(name)
+            if tile is None:
+                continue
+            meta = self.index["tiles"][name]
+            mask = inverse == i
+            row, col = self._pixel(meta, lats[mask], lons[mask])
+            valid = (row >= 0) & (row < tile.shape[1]) & (col >= 0) & (col < tile.shape[2])
+            values = np.full((2, mask.sum()), np.nan, dtype=np.float32)
+            values[:, valid] = tile[:, row[valid], col[valid]]
+            out[:, mask] = values
+        return out[0], out[1]
+
+    def read_window(self, min_lat, min_lon, max_lat, max_lon):
+        """
+        Returns the (2, rows, cols) [elevation, slope] window covering a bounding box.
+        Windows inside a single tile are zero-copy views of the memory map; windows spanning
+        several tiles are not supported and return None.
+        """
+        tile_deg = self.index["tile_deg"]
+        name = tile_name(min_lat, min_lon, tile_deg)
+        if name != tile_name(max_lat - 1e-9, max_lon - 1e-9, tile_deg):
+            return None
+        tile = self._tile(name)
+        if tile is None:
+            return None
+
+        meta = self.index["tiles"][name]
+        row0, col0 = self._pixel(meta, max_lat, min_lon)
+        row1, col1 = self._pixel(meta, min_lat, max_lon)
+        row0, col0 = max(int(row0), 0), max(int(col0), 0)
+        return tile[:, row0:int(row1) + 1, col0:int(col1) + 1]
+
+
+def build_terrain_store(src_paths, out_dir=TERRAIN_STORE_DIR, tile_deg=1.0):
+    """
+    Cuts geographic (EPSG:4326) DEM GeoTIFFs into memory-mappable [elevation, slope] tiles.
+    """
+    import rasterio
+    from rasterio.windows import Window, from_bounds
+
+    os.makedirs(out_dir, exist_ok=True)
+    index_path = os.path.join(out_dir, INDEX_FILE)
+    index = {"tile_deg": tile_deg, "tiles": {}}
+    if os.path.exists(index_path):
+        with open(index_path) as f:
+            index = json.load(f)
+        if index["tile_deg"] != tile_deg:
+            raise ValueError(f"{out_dir} holds {index['tile_deg']} degree tiles; cannot add {tile_deg} degree tiles")
+
+    for src_path in src_paths:
+        with rasterio.open(src_path) as src:
+            res_x, res_y = src.res
+            left, bottom, right, top = src.bounds
+            for south in np.arange(math.floor(bottom / tile_deg) * tile_deg, top, tile_deg):
+                for west in np.arange(math.floor(left / tile_deg) * tile_deg, right, tile_deg):
+                    window = from_bounds(west, south, west + tile_deg, south + tile_deg, src.transform)
+                    window = window.round_offsets().round_lengths()
+                    # One-pixel halo so slope is defined on the tile edges
+                    halo = Window(window.col_off - 1, window.row_off - 1, window.width + 2, window.height + 2)
+                    elevation = src.read(1, window=halo, boundless=True, masked=True).astype(np.float32)
+                    elevation = elevation.filled(np.nan)
+                    if np.isnan(elevation[1:-1, 1:-1]).all():
+                        continue
+
+                    slope = compute_slope(elevation, res_x, res_y, south + tile_deg / 2)
+                    name = tile_name(south, west, tile_deg)
+                    tile = np.lib.format.open_memmap(
+                        os.path.join(out_dir, f"{name}.npy"), mode="w+", dtype=np.float32,
+                        shape=(2,) + slope.shape
+                    )
+                    tile[0] = elevation[1:-1, 1:-1]
+                    tile[1] = slope
+                    tile.flush()
+                    del tile
+
+                    transform = src.window_transform(window)
+                    index["tiles"][name] = {
+                        "west": transform.c,
+                        "north": transform.f,
+                        "res_x": res_x,
+                        "res_y": res_y
+                    }
+                    print(f"Wrote terrain tile {name} {slope.shape}")
+
+    with open(index_path, "w") as f:
+        json.dump(index, f, indent=2)
+    return index
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build the offline terrain store from DEM GeoTIFFs.")
+    parser.add_argument("sources", nargs="+", help="EPSG:4326 DEM GeoTIFFs (e.g. SRTM 1 arc-second)")
+    parser.add_argument("--out", default=TERRAIN_STORE_DIR)
+    parser.add_argument("--tile-deg", type=float, default=1.0)
+    args = parser.parse_args()
+
+    build_terrain_store(args.sources, args.out, args.tile_deg)
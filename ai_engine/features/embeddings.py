@@ -0,0 +1,195 @@
+import contextlib
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+from ..data_loaders.raster_tiler import OVERLAP, PATCH_SIZE, batched, iter_patches, raster_grid, tile_id
+from .feature_store import CNN_DIM
+
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", os.path.join("data", "embeddings"))
+EMBED_BATCH_SIZE = 32
+
+
+def patch_digest(patch):
+    return hashlib.blake2b(np.ascontiguousarray(patch).tobytes(), digest_size=16).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Disk cache of 128-d CNN embeddings keyed by (tile id, acquisition date).
+
+    <root>/<date>/embeddings.f32  raw float32 rows, appended one batch at a time
+    <root>/<date>/index.jsonl     one {"tile", "digest"} line per row
+    <root>/<date>/grid.json       patch grid of the source raster (for point lookups)
+
+    The content digest of each tile's latest embedding is remembered, so a tile whose
+    pixels did not change in a new scene reuses its embedding instead of re-running the CNN.
+    """
+    def __init__(self, root=EMBEDDING_CACHE_DIR, dim=CNN_DIM):
+        self.root = root
+        self.dim = dim
+        self._rows = {}     # date -> {tile id: row}
+        self._latest = {}   # tile id -> (digest, date, row)
+        self._lock = threading.Lock()
+        self._load()
+
+    def _dir(self, date):
+        return os.path.join(self.root, date)
+
+    def _load(self):
+        if not os.path.isdir(self.root):
+            return
+        for date in sorted(os.listdir(self.root)):
+            index_path = os.path.join(self._dir(date), "index.jsonl")
+            if not os.path.exists(index_path):
+                continue
+            rows = self._rows.setdefault(date, {})
+            with open(index_path) as f:
+                for row, line in enumerate(f):
+                    entry = json.loads(line)
+                    rows[entry["tile"]] = row
+                    self._latest[entry["tile"]] = (entry["digest"], date, row)
+
+    def _matrix(self, date):
+        path = os.path.join(self._dir(date), "embeddings.f32")
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return np.empty((0, self.dim), dtype=np.float32)
+        return np.memmap(path, dtype=np.float32, mode="r").reshape(-1, self.dim)
+
+    def has(self, tile, date):
+        return tile in self._rows.get(date, {})
+
+    def get(self, tile, date):
+        row = self._rows.get(date, {}).get(tile)
+        return None if row is None else np.array(self._matrix(date)[row])
+
+    def reusable(self, tile, digest):
+        """
+        Returns the latest embedding of `tile` if it was computed from identical pixels.
+        """
+        latest = self._latest.get(tile)
+        if latest is None or latest[0] != digest:
+            return None
+        return np.array(self._matrix(latest[1])[latest[2]])
+
+    def put_batch(self, date, tiles, digests, vectors):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(len(tiles), self.dim)
+        with self._lock:
+            os.makedirs(self._dir(date), exist_ok=True)
+            rows = self._rows.setdefault(date, {})
+            data_path = os.path.join(self._dir(date), "embeddings.f32")
+            first_row = os.path.getsize(data_path) // (4 * self.dim) if os.path.exists(data_path) else 0
+            with open(data_path, "ab") as f:
+                f.write(vectors.tobytes())
+            with open(os.path.join(self._dir(date), "index.jsonl"), "a") as f:
+                for row, (tile, digest) in enumerate(zip(tiles, digests), start=first_row):
+                    rows[tile] = row
+                    self._latest[tile] = (digest, date, row)
+                    f.write(json.dumps({"tile": tile, "digest": digest}) + "\n")
+
+    def save_grid(self, date, grid):
+        os.makedirs(self._dir(date), exist_ok=True)
+        with open(os.path.join(self._dir(date), "grid.json"), "w") as f:
+            json.dump(grid, f)
+
+    def lookup_points(self, date, points):
+        """
+        Embeddings of the patches whose centres are nearest to each (lat, lon) point.
+        Returns (n, dim) float32, or None when no scene for `date` has been embedded.
+        Points outside the scene get zero rows. Points are reprojected to the raster CRS
+        (e.g. UTM for SAR scenes); grids saved without a CRS are taken as lon/lat.
+        """
+        grid_path = os.path.join(self._dir(date), "grid.json")
+        if not os.path.exists(grid_path):
+            return None
+        with open(grid_path) as f:
+            grid = json.load(f)
+
+        from affine import Affine
+
+        transform = Affine(*grid["transform"])
+        inverse = ~transform
+        stride = grid["patch_size"] - grid["overlap"]
+        half = grid["patch_size"] / 2
+        matrix = self._matrix(date)
+        rows = self._rows.get(date, {})
+
+        xs = [float(lon) for _, lon in points]
+        ys = [float(lat) for lat, _ in points]
+        if grid.get("crs") and points:
+            from rasterio.crs import CRS
+            from rasterio.warp import transform as reproject
+
+            crs = CRS.from_user_input(grid["crs"])
+            if crs != CRS.from_epsg(4326):
+                xs, ys = reproject(CRS.from_epsg(4326), crs, xs, ys)
+
+        out = np.zeros((len(points), self.dim), dtype=np.float32)
+        for i, (x, y) in enumerate(zip(xs, ys)):
+            col, row = inverse * (x, y)
+            if not (0 <= col < grid["width"] and 0 <= row < grid["height"]):
+                continue
+            row_off = max(int(round((row - half) / stride)), 0) * stride
+            col_off = max(int(round((col - half) / stride)), 0) * stride
+            r = rows.get(tile_id(transform, row_off, col_off))
+            if r is not None:
+                out[i] = matrix[r]
+        return out
+
+
+def embed_raster(cnn, path, acquisition_date, cache=None, batch_size=EMBED_BATCH_SIZE,
+                 patch_size=PATCH_SIZE, overlap=OVERLAP, bands=(1, 2, 3), normalize=None, device="/CPU:0"):
+    """
+    Embeds every patch of a raster with the CNN feature extractor, in fixed-size batches.
+    Tiles already cached for this date are skipped, and tiles whose pixels match their
+    previous embedding reuse it. Memory is bounded by batch_size patches.
+    Returns counts of {"tiles", "cached", "reused", "embedded"}.
+    """
+    try:
+        import tensorflow as tf
+        on_device = lambda: tf.device(device)
+    except ImportError:
+        on_device = contextlib.nullcontext
+
+    cache = cache or EmbeddingCache()
+    cache.save_grid(acquisition_date, raster_grid(path, patch_size, overlap))
+    stats = {"tiles": 0, "cached": 0, "reused": 0, "embedded": 0}
+
+    pending = []  # (tile id, digest, patch) waiting for the CNN
+
+    def run_cnn():
+        batch = np.stack([patch for _, _, patch in pending])
+        with on_device():
+            vectors = cnn.predict(batch, batch_size=batch_size, verbose=0)
+        cache.put_batch(acquisition_date, [t for t, _, _ in pending], [d for _, d, _ in pending], vectors)
+        stats["embedded"] += len(pending)
+        pending.clear()
+
+    for group in batched(iter_patches(path, patch_size, overlap, bands, normalize), batch_size):
+        reused = ([], [], [])
+        for tile, patch in group:
+            stats["tiles"] += 1
+            if cache.has(tile, acquisition_date):
+                stats["cached"] += 1
+                continue
+            digest = patch_digest(patch)
+            vector = cache.reusable(tile, digest)
+            if vector is not None:
+                reused[0].append(tile)
+                reused[1].append(digest)
+                reused[2].append(vector)
+                continue
+            pending.append((tile, digest, patch))
+            if len(pending) == batch_size:
+                run_cnn()
+        if reused[0]:
+            cache.put_batch(acquisition_date, reused[0], reused[1], np.stack(reused[2]))
+            stats["reused"] += len(reused[0])
+
+    if pending:
+        run_cnn()
+    print(f"Embedded {path} ({acquisition_date}): {stats}")
+    return stats
@@ -0,0 +1,213 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+from .. import metrics
+from ..models.rf_risk_classifier import N_FEATURES
+
+FEATURE_STORE_DIR = os.getenv("FEATURE_STORE_DIR", os.path.join("data", "features"))
+
+# Column layout of the model input: [128 CNN features + 32 LSTM features + slope, elevation]
+CNN_DIM = 128
+LSTM_DIM = 32
+TERRAIN_DIM = 2  # slope, elevation
+CNN_COLS = slice(0, CNN_DIM)
+LSTM_COLS = slice(CNN_DIM, CNN_DIM + LSTM_DIM)
+SLOPE_COL = CNN_DIM + LSTM_DIM
+ELEVATION_COL = SLOPE_COL + 1
+RAIN_SEQUENCE_DAYS = 30
+
+
+def location_key(lat, lon):
+    return f"{float(lat):.5f},{float(lon):.5f}"
+
+
+class FeatureStore:
+    """
+    On-disk store of float32 feature blocks.
+
+    terrain/<block>.npy       (n, 2) [slope, elevation]; computed once per location
+    blocks/<date>/<name>.npy  (n, 162) full model input for a batch of locations on one date
+
+    Every .npy has a <same name>.keys.json listing the location key of each row.
+    Blocks are read back memory-mapped.
+    """
+    def __init__(self, root=FEATURE_STORE_DIR):
+        self.root = root
+        self._terrain_index = None  # location key -> (block path, row)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _write(path, keys, matrix):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        out = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=matrix.shape)
+        out[:] = matrix
+        out.flush()
+        del out
+        with open(path[:-len(".npy")] + ".keys.json", "w") as f:
+            json.dump(list(keys), f)
+
+    @staticmethod
+    def _read(path):
+        with open(path[:-len(".npy")] + ".keys.json") as f:
+            keys = json.load(f)
+        return keys, np.load(path, mmap_mode="r")
+
+    def _terrain_dir(self):
+        return os.path.join(self.root, "terrain")
+
+    def _load_terrain_index(self):
+        index = {}
+        directory = self._terrain_dir()
+        if os.path.isdir(directory):
+            for name in sorted(os.listdir(directory)):
+                if name.endswith(".keys.json"):
+                    path = os.path.join(directory, name[:-len(".keys.json")] + ".npy")
+                    keys, _ = self._read(path)
+                    for row, key in enumerate(keys):
+                        index[key] = (path, row)
+        return index
+
+    @property
+    def terrain_index(self):
+        if self._terrain_index is None:
+            with self._lock:
+                if self._terrain_index is None:
+                    self._terrain_index = self._load_terrain_index()
+        return self._terrain_index
+
+    def get_terrain(self, keys):
+        """
+        Returns (matrix, missing) where matrix is (n, TERRAIN_DIM) and missing flags rows not yet stored.
+        """
+        matrix = np.zeros((len(keys), TERRAIN_DIM), dtype=np.float32)
+        missing = np.ones(len(keys), dtype=bool)
+        by_block = {}  # block path -> ([output rows], [block rows])
+        for i, key in enumerate(keys):
+            entry = self.terrain_index.get(key)
+            if entry is not None:
+                out_rows, block_rows = by_block.setdefault(entry[0], ([], []))
+                out_rows.append(i)
+                block_rows.append(entry[1])
+        for path, (out_rows, block_rows) in by_block.items():
+            matrix[out_rows] = np.load(path, mmap_mode="r")[block_rows]
+            missing[out_rows] = False
+        return matrix, missing
+
+    def put_terrain(self, keys, matrix):
+        index = self.terrain_index
+        with self._lock:
+            block = len({path for path, _ in index.values()})
+            path = os.path.join(self._terrain_dir(), f"{block:06d}.npy")
+            self._write(path, keys, matrix)
+            for row, key in enumerate(keys):
+                index[key] = (path, row)
+
+    def _block_path(self, date, name):
+        return os.path.join(self.root, "blocks", date, f"{name}.npy")
+
+    def write_block(self, date, name, keys, matrix):
+        if matrix.shape[1] != N_FEATURES:
+            raise ValueError(f"Feature blocks must have {N_FEATURES} columns, got {matrix.shape[1]}")
+        self._write(self._block_path(date, name), keys, matrix)
+
+    def read_block(self, date, name):
+        """
+        Returns (keys, memory-mapped (n, 162) float32 matrix).
+        """
+        return self._read(self._block_path(date, name))
+
+    def has_block(self, date, name):
+        return os.path.exists(self._block_path(date, name))
+
+
+class FeatureAssembler:
+    """
+    Builds the 162-dim model input for a batch of locations with one batched call per source:
+    terrain from the local store (GEE for uncovered points), the CNN over image patches and
+    the LSTM over 30-day rainfall sequences. Terrain is cached per location; the CNN columns
+    change with every scene, so they are taken per date (EmbeddingCache keys them by tile and date).
+
+    embedding_provider(points, date) -> (n, 128) precomputed CNN embeddings (e.g. EmbeddingCache) or None
+    patch_provider(points, date) -> (n, 256, 256, 3) array or None when no imagery is available
+    rainfall_provider(points, date) -> (n, 30) daily rainfall; defaults to CHIRPS via GEE
+    """
+    def __init__(self, engine, store=None, patch_provider=None, rainfall_provider=None, batch_size=64,
+                 embedding_provider=None):
+        self.engine = engine
+        self.store = store or FeatureStore()
+        self.embedding_provider = embedding_provider
+        self.patch_provider = patch_provider
+        self.rainfall_provider = rainfall_provider or self._gee_rainfall
+        self.batch_size = batch_size
+
+    def _gee_rainfall(self, points, date):
+        return self.engine.gee_loader.get_rainfall_series_batch(points, date, RAIN_SEQUENCE_DAYS)
+
+    def _terrain(self, points):
+        lats = np.array([p[0] for p in points], dtype=np.float64)
+        lons = np.array([p[1] for p in points], dtype=np.float64)
+        elevation, slope = self.engine.terrain_store.sample(lats, lons)
+
+        uncovered = np.flatnonzero(np.isnan(elevation) | np.isnan(slope))
+        if len(uncovered):
+            fetched = self.engine.gee_loader.get_elevation_batch([points[i] for i in uncovered])
+            for i, terrain in zip(uncovered, fetched):
+                elevation[i] = terrain.get("elevation") or 0.0
+                slope[i] = terrain.get("slope") or 0.0
+        return slope, elevation
+
+    def _cnn_features(self, points, date):
+        if self.embedding_provider is not None:
+            embeddings = self.embedding_provider(points, date)
+            if embeddings is not None:
+                return embeddings
+        cnn = self.engine.cnn
+        patches = self.patch_provider(points, date) if self.patch_provider else None
+        if cnn is None or patches is None:
+            return np.zeros((len(points), CNN_DIM), dtype=np.float32)
+        return cnn.predict(np.asarray(patches, dtype=np.float32), batch_size=self.batch_size, verbose=0)
+
+    def _lstm_features(self, points, date):
+        lstm = self.engine.lstm
+        if lstm is None:
+            return np.zeros((len(points), LSTM_DIM), dtype=np.float32)
+        sequences = np.asarray(self.rainfall_provider(points, date), dtype=np.float32)
+        return lstm.predict(sequences.reshape(len(points), RAIN_SEQUENCE_DAYS, 1), batch_size=self.batch_size, verbose=0)
+
+    def terrain_features(self, points):
+        """
+        Returns (n, 2) [slope, elevation], computing and storing only locations not seen before.
+        """
+        keys = [location_key(lat, lon) for lat, lon in points]
+        matrix, missing = self.store.get_terrain(keys)
+        n_missing = int(missing.sum())
+        metrics.record_cache("feature_terrain", True, len(keys) - n_missing)
+        metrics.record_cache("feature_terrain", False, n_missing)
+        if n_missing:
+            todo = [points[i] for i in np.flatnonzero(missing)]
+            slope, elevation = self._terrain(todo)
+            fresh = np.stack([slope, elevation], axis=1).astype(np.float32)
+            self.store.put_terrain([keys[i] for i in np.flatnonzero(missing)], fresh)
+            matrix[missing] = fresh
+        return matrix
+
+    def assemble(self, points, date, name):
+        """
+        Assembles and writes the (n, 162) block for `points` on `date` ('YYYY-MM-DD').
+        Returns the block as stored.
+        """
+        points = [(float(lat), float(lon)) for lat, lon in points]
+        metrics.record_batch("feature_assembly", len(points))
+        terrain = self.terrain_features(points)
+
+        features = np.empty((len(points), N_FEATURES), dtype=np.float32)
+        features[:, CNN_COLS] = self._cnn_features(points, date)
+        features[:, LSTM_COLS] = self._lstm_features(points, date)
+        features[:, SLOPE_COL] = terrain[:, 0]
+        features[:, ELEVATION_COL] = terrain[:, 1]
+
+        self.store.write_block(date, name, [location_key(lat, lon) for lat, lon in points], features)
+        return self.store.read_block(date, name)
@@ -0,0 +1,223 @@
+import json
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+SAR_STATE_PATH = os.getenv("SAR_STATE_PATH", os.path.join("data", "sar", "change_state.json"))
+# Reference period for each point's baseline, ending where the monitored window begins
+SAR_BASELINE_DAYS = int(os.getenv("SAR_BASELINE_DAYS", 365))
+# Recent acquisitions kept (and returned) per point
+SAR_SERIES_DAYS = int(os.getenv("SAR_SERIES_DAYS", 90))
+# Points checked more recently than this are answered from the cache without a GEE call
+SAR_REFRESH_HOURS = float(os.getenv("SAR_REFRESH_HOURS", 6))
+MIN_BASELINE_ACQUISITIONS = 5
+BANDS = ("VH", "VV")
+
+
+def point_key(lat, lon):
+    # ~1 m: the same monitored point always maps to the same entry
+    return f"{float(lat):.5f},{float(lon):.5f}"
+
+
+def _ms(dt):
+    return int(dt.timestamp() * 1000)
+
+
+def baseline_stats(series):
+    """
+    Per-band mean, std, p5 (dry reference) and p95 (wet reference) of a series, in dB.
+    """
+    stats = {"n": len(series)}
+    if not series:
+        return stats
+    for band in BANDS:
+        values = np.array([row[band] for row in series], dtype=np.float64)
+        p5, p95 = np.percentile(values, (5, 95))
+        stats[band] = {
+            "mean": round(float(values.mean()), 3),
+            "std": round(float(values.std()), 3),
+            "p5": round(float(p5), 3),
+            "p95": round(float(p95), 3)
+        }
+    return stats
+
+
+def change_scores(baseline, row):
+    """
+    Change of one acquisition against the baseline.
+    delta_*: dB above the baseline mean; z_*: the same in baseline standard deviations.
+    wetness: VV scaled between the dry (p5) and wet (p95) references, clipped to 0-1
+             (change-detection soil moisture index; VV responds most to soil moisture).
+    change_score: mean of the z-scores; positive means wetter than usual.
+    """
+    if baseline.get("n", 0) < MIN_BASELINE_ACQUISITIONS:
+        return None
+    scores = {}
+    for band in BANDS:
+        ref = baseline[band]
+        delta = row[band] - ref["mean"]
+        scores[f"delta_{band.lower()}"] = round(delta, 3)
+        scores[f"z_{band.lower()}"] = round(delta / max(ref["std"], 0.1), 3)
+    dry, wet = baseline["VV"]["p5"], baseline["VV"]["p95"]
+    scores["wetness"] = round(float(np.clip((row["VV"] - dry) / max(wet - dry, 0.1), 0.0, 1.0)), 3)
+    scores["change_score"] = round((scores["z_vh"] + scores["z_vv"]) / 2, 3)
+    return scores
+
+
+class SARChangeTracker:
+    """
+    Sentinel-1 VH/VV change detection for many points.
+
+    The first request for a point fetches its baseline period once and stores the
+    statistics; later requests fetch only acquisitions newer than the last one seen,
+    with every stale point of a request sharing one batched GEE query. State is kept in
+    one JSON file so baselines survive restarts.
+    """
+    def __init__(self, get_loader, path=SAR_STATE_PATH, baseline_days=SAR_BASELINE_DAYS,
+                 series_days=SAR_SERIES_DAYS, refresh_hours=SAR_REFRESH_HOURS):
+        self.get_loader = get_loader
+        self.path = path
+        self.baseline_days = baseline_days
+        self.series_days = series_days
+        self.refresh_hours = refresh_hours
+        self._points = {}
+        self._in_flight = {}  # point key -> Event set when the call fetching it finishes
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self._points = json.load(f)
+
+    def _save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self._points, f, separators=(",", ":"))
+        os.replace(tmp, self.path)
+
+    def _initialize(self, loader, keys, points, now):
+        # One fetch covers the baseline period and the monitored window after it
+        window_start = now - timedelta(days=self.series_days)
+        fetched = loader.get_sentinel1_series_batch(
+            points, window_start - timedelta(days=self.baseline_days), now
+        )
+        cut = _ms(window_start)
+        entries = {}
+        for key, (lat, lon), series in zip(keys, points, fetched):
+            if series is None:
+                continue
+            entries[key] = {
+                "lat": lat,
+                "lon": lon,
+                "baseline": baseline_stats([r for r in series if r["time"] < cut]),
+                "series": [r for r in series if r["time"] >= cut],
+                "checked": _ms(now)
+            }
+        return entries
+
+    def _refresh(self, loader, entries, now):
+        # Only acquisitions after the oldest "last seen" among these points are requested
+        keys = list(entries)
+        last_seen = [entries[k]["series"][-1]["time"] if entries[k]["series"]
+                     else entries[k]["checked"] - self.series_days * 86400000 for k in keys]
+        since = datetime.fromtimestamp(min(last_seen) / 1000 + 0.001, tz=timezone.utc)
+        fetched = loader.get_sentinel1_series_batch([(entries[k]["lat"], entries[k]["lon"]) for k in keys], since, now)
+        cut = _ms(now - timedelta(days=self.series_days))
+        updated = {}
+        for key, seen, series in zip(keys, last_seen, fetched):
+            if series is None:
+                continue
+            entry = entries[key]
+            updated[key] = {
+                **entry,
+                "series": [r for r in entry["series"] if r["time"] >= cut] + [r for r in series if r["time"] > seen],
+                "checked": _ms(now)
+            }
+        return updated
+
+    def _claim(self, keys, points, now):
+        """
+        Splits the points into new and stale ones this call fetches, marking them in flight,
+        and returns (new {key: point}, stale {key: entry copy}, the event this call sets when
+        done or None, events of fetches by other calls).
+        """
+        fresh_after = _ms(now) - self.refresh_hours * 3600000
+        new, stale, done, waiting = {}, {}, None, set()
+        with self._lock:
+            for key, point in zip(keys, points):
+                if key in new or key in stale:
+                    continue
+                if key in self._in_flight:
+                    waiting.add(self._in_flight[key])
+                    continue
+                entry = self._points.get(key)
+                if entry is None:
+                    new[key] = point
+                elif entry["checked"] >= fresh_after:
+                    continue
+                elif entry["baseline"]["n"] < MIN_BASELINE_ACQUISITIONS:
+                    # Too little baseline data last time (e.g. no coverage yet): try again
+                    new[key] = point
+                else:
+                    stale[key] = {**entry, "series": list(entry["series"])}
+            if new or stale:
+                done = threading.Event()
+                for key in list(new) + list(stale):
+                    self._in_flight[key] = done
+        return new, stale, done, waiting
+
+    def update(self, points, now=None):
+        """
+        Brings every point up to date and returns, in input order:
+        {"lat", "lon", "baseline", "series", "latest", "change"}
+        series lists the acquisitions of the last series_days, oldest first; change scores
+        the latest acquisition against the baseline (None without enough baseline data).
+
+        GEE is queried without holding the tracker lock; a point already being fetched by
+        another call is waited for rather than fetched twice.
+        """
+        now = now or datetime.now(timezone.utc)
+        points = [(float(lat), float(lon)) for lat, lon in points]
+        keys = [point_key(lat, lon) for lat, lon in points]
+
+        new, stale, done, waiting = self._claim(keys, points, now)
+        if done is not None:
+            try:
+                loader = self.get_loader()
+                fetched = self._initialize(loader, list(new), list(new.values()), now) if new else {}
+                if stale:
+                    fetched.update(self._refresh(loader, stale, now))
+                with self._lock:
+                    self._points.update(fetched)
+                    self._save()
+            finally:
+                with self._lock:
+                    for key in list(new) + list(stale):
+                        del self._in_flight[key]
+                done.set()
+        for event in waiting:
+            event.wait()
+
+        with self._lock:
+            results = []
+            for key, (lat, lon) in zip(keys, points):
+                entry = self._points.get(key)
+                if entry is None:
+                    results.append({"lat": lat, "lon": lon, "baseline": None, "series": [], "latest": None, "change": None})
+                    continue
+                latest = entry["series"][-1] if entry["series"] else None
+                results.append({
+                    "lat": lat,
+                    "lon": lon,
+                    "baseline": entry["baseline"],
+                    "series": list(entry["series"]),
+                    "latest": latest,
+                    "change": change_scores(entry["baseline"], latest) if latest else None
+                })
+            return results
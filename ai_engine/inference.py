@@ -1,38 +1,146 @@
 import numpy as np
+import importlib.util
+import os
+import threading
+import time
 import warnings
 
-# Try importing TensorFlow, mock if missing (for Python 3.13 support)
-try:
-    import tensorflow as tf
-    TF_AVAILABLE = True
-    from .models.cnn_feature_extractor import build_cnn_extractor
-    from .models.lstm_rainfall import build_lstm_model
-except ImportError:
-    TF_AVAILABLE = False
-    print("TensorFlow not available (Python 3.13?). Running in Mock Mode.")
+# TensorFlow is imported on first use of the CNN/LSTM; mock if missing (for Python 3.13 support)
+TF_AVAILABLE = importlib.util.find_spec("tensorflow") is not None
 
 from .models.rf_risk_classifier import LandslideRiskClassifier
 
 from .data_loaders.gee_loader import GEELoader
+from .data_loaders.terrain_store import TerrainRasterStore
+from .features.feature_store import FeatureStore
+from . import metrics
+
+RISK_LABELS = ("Low", "Medium", "High")
+# Slope (degrees) thresholds of the historical vulnerability rule in predict_risk
+VULNERABILITY_HIGH_SLOPE = 35
+VULNERABILITY_MEDIUM_SLOPE = 15
+# Trained risk forest, as written by ai_engine.training.rf_pipeline --out
+RF_MODEL_PATH = os.getenv("RF_MODEL_PATH", "rf_model.joblib")
+
+
+def _tf_unavailable(e):
+    # An installed but broken TensorFlow falls back to mock mode like a missing one
+    global TF_AVAILABLE
+    TF_AVAILABLE = False
+    print(f"TensorFlow failed to import ({e}). Running in Mock Mode.")
+
+
+def _build_cnn():
+    if not TF_AVAILABLE:
+        print("TensorFlow not available (Python 3.13?). Running in Mock Mode.")
+        return None
+    try:
+        from .models.cnn_feature_extractor import build_cnn_extractor
+    except ImportError as e:
+        _tf_unavailable(e)
+        return None
+    return build_cnn_extractor()
+
+
+def _build_rf():
+    rf = LandslideRiskClassifier()
+    if os.path.exists(RF_MODEL_PATH):
+        rf.load_model(RF_MODEL_PATH)
+    else:
+        print(f"No trained risk forest at {RF_MODEL_PATH}; full-model predictions are unavailable.")
+    return rf
+
+
+def _build_lstm():
+    if not TF_AVAILABLE:
+        return None
+    try:
+        from .models.lstm_rainfall import build_lstm_model
+    except ImportError as e:
+        _tf_unavailable(e)
+        return None
+    return build_lstm_model()
+
 
 class LandslideInferenceEngine:
+    """
+    Inference engine whose components are built lazily on first use.
+    Construction is cheap; call load() to build components ahead of time.
+    """
+    COMPONENTS = {
+        "terrain_store": TerrainRasterStore,
+        "gee_loader": GEELoader,
+        "rf": _build_rf,
+        "cnn": _build_cnn,
+        "lstm": _build_lstm,
+    }
+
     def __init__(self):
-        self.gee_loader = GEELoader()
-        self.rf = LandslideRiskClassifier()
+        self._components = {}
+        self._lock = threading.Lock()
+        # component name -> seconds spent building it
+        self.component_timings = {}
 
-        if TF_AVAILABLE:
-            self.cnn = build_cnn_extractor()
-            self.lstm = build_lstm_model()
-        else:
-            self.cnn = None
-            self.lstm = None
+    def _component(self, name):
+        if name in self._components:
+            return self._components[name]
+        with self._lock:
+            if name not in self._components:
+                start = time.perf_counter()
+                self._components[name] = self.COMPONENTS[name]()
+                self.component_timings[name] = time.perf_counter() - start
+        return self._components[name]
+
+    def load(self, names=None):
+        """
+        Builds the given components (all by default) and returns their build timings.
+        """
+        for name in names or self.COMPONENTS:
+            self._component(name)
+        return dict(self.component_timings)
+
+    def is_loaded(self, name):
+        return name in self._components
+
+    @property
+    def terrain_store(self):
+        return self._component("terrain_store")
+
+    @property
+    def gee_loader(self):
+        return self._component("gee_loader")
+
+    @property
+    def rf(self):
+        return self._component("rf")
+
+    @property
+    def cnn(self):
+        return self._component("cnn")
+
+    @property
+    def lstm(self):
+        return self._component("lstm")
+
+    def rainfall_features(self, buffer, batch_size=256):
+        """
+        Runs the LSTM once over every region of a RainfallRingBuffer.
+        Returns (regions, 32) temporal features (zeros in mock mode).
+        """
+        metrics.record_batch("lstm_regions", len(buffer.region_names))
+        lstm = self.lstm
+        if lstm is None:
+            return np.zeros((len(buffer.region_names), 32), dtype=np.float32)
+        return lstm.predict(buffer.lstm_batch(), batch_size=batch_size, verbose=0)
 
     def predict_risk(self, lat, lon):
         print(f"Analyzing historical vulnerability for location: {lat}, {lon}")
         
-        # 1. Get Static Data (Slope)
+        # 1. Get Static Data (Slope): local terrain store first, GEE as the fallback
         try:
-            geo_data = self.gee_loader.get_elevation_data(lat, lon)
+            geo_data = self.terrain_store.get_point(lat, lon)
+            if geo_data is None:
+                geo_data = self.gee_loader.get_elevation_data(lat, lon)
             slope = geo_data.get('slope', 0)
         except Exception as e:
             print(f"GEE Error: {e}")
@@ -44,9 +152,9 @@ class LandslideInferenceEngine:
         # Thresholds (Historical/Static)
         # Steep slopes in TN (Nilgiris) are historically high risk
         
-        if slope > 35:
+        if slope > VULNERABILITY_HIGH_SLOPE:
             result = "High" # Historically prone
-        elif slope > 15:
+        elif slope > VULNERABILITY_MEDIUM_SLOPE:
             result = "Medium" # Moderately prone
         else:
             result = "Low" # Low probability
@@ -54,6 +162,22 @@ class LandslideInferenceEngine:
         print(f"Slope: {slope:.2f}, Vulnerability: {result}")
         return result
 
+    def predict_block(self, date, name, store=None):
+        """
+        Full-model inference over a feature block written by FeatureAssembler:
+        one memory-mapped matrix read plus one predict call.
+        Returns {location key: risk label}.
+        """
+        if not self.rf.is_fitted:
+            raise RuntimeError(
+                f"No trained risk forest loaded: set RF_MODEL_PATH to a model written by "
+                f"ai_engine.training.rf_pipeline (looked for {RF_MODEL_PATH})"
+            )
+        keys, features = (store or FeatureStore()).read_block(date, name)
+        metrics.record_batch("rf_block", len(keys))
+        predictions = self.rf.predict(features)
+        return {key: RISK_LABELS[int(p)] for key, p in zip(keys, predictions)}
+
 
 if __name__ == "__main__":
     engine = LandslideInferenceEngine()
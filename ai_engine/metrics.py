@@ -0,0 +1,171 @@
+"""
+Process-wide Prometheus metrics for the hot paths.
+
+Label sets are small and fixed (route templates, method names, cache names), and the
+per-label children are resolved once and reused, so recording a sample is a lock-free
+dict lookup plus one atomic update. When prometheus_client is not installed every metric
+is a no-op and /metrics reports that it is unavailable.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+    PROMETHEUS_AVAILABLE = True
+except ImportError:
+    PROMETHEUS_AVAILABLE = False
+    CONTENT_TYPE_LATEST = "text/plain; charset=utf-8"
+
+# Seconds; covers cached lookups (sub-ms) up to slow Earth Engine aggregations
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+BATCH_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 20000)
+
+
+class _NoopMetric:
+    def labels(self, *args, **kwargs):
+        return self
+
+    def inc(self, *args):
+        pass
+
+    def dec(self, *args):
+        pass
+
+    def set(self, *args):
+        pass
+
+    def observe(self, *args):
+        pass
+
+
+if PROMETHEUS_AVAILABLE:
+    registry = CollectorRegistry(auto_describe=True)
+
+    def _counter(name, doc, labels=()):
+        return Counter(name, doc, labels, registry=registry)
+
+    def _gauge(name, doc, labels=()):
+        return Gauge(name, doc, labels, registry=registry)
+
+    def _histogram(name, doc, labels=(), buckets=LATENCY_BUCKETS):
+        return Histogram(name, doc, labels, buckets=buckets, registry=registry)
+else:
+    registry = None
+
+    def _counter(name, doc, labels=()):
+        return _NoopMetric()
+
+    _gauge = _counter
+
+    def _histogram(name, doc, labels=(), buckets=None):
+        return _NoopMetric()
+
+
+# HTTP
+http_request_duration = _histogram("landslidex_http_request_duration_seconds", "HTTP request latency", ("method", "route", "status"))
+http_requests_in_progress = _gauge("landslidex_http_requests_in_progress", "HTTP requests being served", ("method",))
+http_request_size = _histogram("landslidex_http_request_size_bytes", "HTTP request body size", ("route",), SIZE_BUCKETS)
+http_response_size = _histogram("landslidex_http_response_size_bytes", "HTTP response body size", ("route",), SIZE_BUCKETS)
+
+# Upstream services
+gee_calls = _counter("landslidex_gee_calls_total", "Earth Engine round trips", ("method", "outcome"))
+gee_latency = _histogram("landslidex_gee_call_duration_seconds", "Earth Engine round-trip latency", ("method",))
+openweather_calls = _counter("landslidex_openweather_calls_total", "OpenWeather HTTP calls", ("endpoint", "status"))
+openweather_retries = _counter("landslidex_openweather_retries_total", "OpenWeather retries", ("endpoint", "reason"))
+openweather_latency = _histogram("landslidex_openweather_call_duration_seconds", "OpenWeather call latency", ("endpoint",))
+
+# Simulation and inference
+simulator_tick = _histogram("landslidex_simulator_tick_duration_seconds", "Simulation tick duration")
+inference_batch_size = _histogram("landslidex_inference_batch_size", "Locations per inference batch", ("stage",), BATCH_BUCKETS)
+
+# Caches
+cache_requests = _counter("landslidex_cache_requests_total", "Cache lookups", ("cache", "result"))
+
+
+class _LabelCache:
+    """
+    Memoizes metric.labels(...) children; the label sets used here are small and bounded.
+    """
+    def __init__(self, metric):
+        self.metric = metric
+        self._children = {}
+
+    def __call__(self, *labels):
+        child = self._children.get(labels)
+        if child is None:
+            child = self._children[labels] = self.metric.labels(*labels)
+        return child
+
+
+_cache_results = _LabelCache(cache_requests)
+_batch_sizes = _LabelCache(inference_batch_size)
+_gee_calls = _LabelCache(gee_calls)
+_gee_latency = _LabelCache(gee_latency)
+
+
+def record_cache(cache, hit, count=1):
+    _cache_results(cache, "hit" if hit else "miss").inc(count)
+
+
+def record_batch(stage, size):
+    _batch_sizes(stage).observe(size)
+
+
+@contextmanager
+def timed(histogram):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - start)
+
+
+def render():
+    """
+    Returns (body bytes, content type) for the /metrics endpoint.
+    """
+    if not PROMETHEUS_AVAILABLE:
+        return b"# prometheus_client is not installed\n", CONTENT_TYPE_LATEST
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+_ee_depth = threading.local()
+
+
+def _instrumented(original, method):
+    def wrapper(self, *args, **kwargs):
+        # Subclass overrides (e.g. Image.getInfo) call the base method; count only the outer call
+        depth = getattr(_ee_depth, "value", 0)
+        if depth:
+            return original(self, *args, **kwargs)
+        _ee_depth.value = 1
+        start = time.perf_counter()
+        outcome = "ok"
+        try:
+            return original(self, *args, **kwargs)
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            _ee_depth.value = 0
+            _gee_latency(method).observe(time.perf_counter() - start)
+            _gee_calls(method, outcome).inc()
+
+    wrapper.__metrics_original__ = original
+    return wrapper
+
+
+def instrument_ee(ee_module=None):
+    """
+    Counts and times every getInfo/getMapId made through the `ee` client. Safe to call twice.
+    """
+    if ee_module is None:
+        import ee as ee_module
+    classes = [c for c in vars(ee_module).values() if isinstance(c, type)]
+    for cls in {base for c in classes for base in c.__mro__}:
+        for method in ("getInfo", "getMapId"):
+            original = cls.__dict__.get(method)
+            if original is not None and not hasattr(original, "__metrics_original__"):
+                setattr(cls, method, _instrumented(original, method))
@@ -1,10 +1,19 @@
 from sklearn.ensemble import RandomForestClassifier
-import pickle
+import joblib
 import numpy as np
 
+# 128 CNN features + 32 LSTM features + 2 Static (Slope, Elevation) = 162 total features
+N_FEATURES = 162
+RISK_CLASSES = (0, 1, 2)  # Low, Medium, High
+
 class LandslideRiskClassifier:
-    def __init__(self):
-        self.model = RandomForestClassifier(n_estimators=100, random_state=42)
+    def __init__(self, n_estimators=100, n_jobs=-1):
+        # n_jobs=-1 builds trees and predicts on all cores
+        self.model = RandomForestClassifier(n_estimators=n_estimators, random_state=42, n_jobs=n_jobs)
+
+    @property
+    def is_fitted(self):
+        return hasattr(self.model, "estimators_")
 
     def train(self, X, y):
         """
@@ -14,6 +23,17 @@ class LandslideRiskClassifier:
         self.model.fit(X, y)
         print("Model trained successfully.")
 
+    def grow(self, X, y, n_new_trees=10):
+        """
+        Adds n_new_trees trees fitted on (X, y) to the existing forest, keeping the old trees.
+        Every batch must contain each class in RISK_CLASSES so all trees agree on classes_.
+        """
+        if not self.is_fitted:
+            self.model.set_params(n_estimators=n_new_trees, warm_start=True)
+        else:
+            self.model.set_params(n_estimators=len(self.model.estimators_) + n_new_trees, warm_start=True)
+        self.model.fit(X, y)
+
     def predict(self, features):
         """
         Predicts risk level.
@@ -22,18 +42,22 @@ class LandslideRiskClassifier:
         prediction = self.model.predict(features)
         return prediction
 
-    def save_model(self, path="rf_model.pkl"):
-        with open(path, "wb") as f:
-            pickle.dump(self.model, f)
-            
-    def load_model(self, path="rf_model.pkl"):
-        with open(path, "rb") as f:
-            self.model = pickle.load(f)
+    def save_model(self, path="rf_model.joblib"):
+        """
+        Saves uncompressed so the tree arrays can be memory-mapped on load.
+        """
+        joblib.dump(self.model, path, compress=0)
+
+    def load_model(self, path="rf_model.joblib", mmap_mode="r"):
+        """
+        Loads a saved model; with mmap_mode="r" the tree arrays stay on disk and are paged in on use.
+        Legacy pickle files load too (without memory mapping).
+        """
+        self.model = joblib.load(path, mmap_mode=mmap_mode)
 
 if __name__ == "__main__":
     # Mock training
     clf = LandslideRiskClassifier()
-    # 128 CNN features + 32 LSTM features + 2 Static (Slope, Elevation) = 162 total features
-    X_mock = np.random.rand(100, 162)
+    X_mock = np.random.rand(100, N_FEATURES)
     y_mock = np.random.randint(0, 3, 100)
     clf.train(X_mock, y_mock)
@@ -0,0 +1,183 @@
+"""
+Out-of-core training pipeline for LandslideRiskClassifier.
+
+Labelled feature rows live on disk as pairs of .npy files, <name>.X.npy (rows, 162) and
+<name>.y.npy (rows,). They are memory-mapped and streamed in fixed-size chunks, and
+the forest grows by a few trees per chunk, so memory stays bounded by the chunk size.
+
+    python -m ai_engine.training.rf_pipeline data/features --out rf_model.joblib
+"""
+import glob
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from ..models.rf_risk_classifier import LandslideRiskClassifier, N_FEATURES, RISK_CLASSES
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+CHUNK_ROWS = 50000
+TREES_PER_CHUNK = 10
+
+
+def _process_peak_rss_mb():
+    """
+    Peak RSS of the whole process so far (it never goes down), or None where unavailable.
+    """
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is bytes on macOS, kilobytes elsewhere
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / (1024 * 1024)  # Windows peak working set
+    except (ImportError, AttributeError):
+        return None
+
+
+class StageProfiler:
+    """
+    Records wall time and peak traced allocation per pipeline stage. The process peak RSS
+    at the end of each stage is reported too; it is cumulative, so a stage only raised it
+    when it is higher than the previous stage's value.
+    """
+    def __init__(self):
+        self.stages = []
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+    def report(self):
+        for s in self.stages:
+            rss = "n/a" if s["process_peak_rss_mb"] is None else f"{s['process_peak_rss_mb']:.1f} MB"
+            print(f"{s['stage']:<12} {s['wall_s']:>9.2f}s  peak alloc {s['peak_alloc_mb']:>9.1f} MB  process peak RSS {rss:>12}")
+        return self.stages
+
+
+class _Stage:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self._was_tracing = tracemalloc.is_tracing()
+        if not self._was_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self._start
+        _, peak = tracemalloc.get_traced_memory()
+        if not self._was_tracing:
+            tracemalloc.stop()
+        self.profiler.stages.append({
+            "stage": self.name,
+            "wall_s": wall,
+            "peak_alloc_mb": peak / (1024 * 1024),
+            "process_peak_rss_mb": _process_peak_rss_mb()
+        })
+        return False
+
+
+def find_feature_files(data_dir):
+    """
+    Returns [(X_path, y_path)] for every <name>.X.npy with a matching <name>.y.npy.
+    """
+    pairs = []
+    for x_path in sorted(glob.glob(os.path.join(data_dir, "*.X.npy"))):
+        y_path = x_path[:-len(".X.npy")] + ".y.npy"
+        if os.path.exists(y_path):
+            pairs.append((x_path, y_path))
+    return pairs
+
+
+def iter_feature_chunks(pairs, chunk_rows=CHUNK_ROWS):
+    """
+    Streams (X, y) chunks of at most chunk_rows rows from memory-mapped feature files.
+    Only the current chunk is materialized in memory.
+    """
+    for x_path, y_path in pairs:
+        X = np.load(x_path, mmap_mode="r")
+        y = np.load(y_path, mmap_mode="r")
+        if X.ndim != 2 or X.shape[1] != N_FEATURES:
+            raise ValueError(f"{x_path}: expected (rows, {N_FEATURES}) features, got {X.shape}")
+        if len(X) != len(y):
+            raise ValueError(f"{x_path}: {len(X)} feature rows but {len(y)} labels")
+        for start in range(0, len(X), chunk_rows):
+            yield np.asarray(X[start:start + chunk_rows], dtype=np.float32), np.asarray(y[start:start + chunk_rows])
+
+
+def train_incremental(clf, chunks, trees_per_chunk=TREES_PER_CHUNK, classes=RISK_CLASSES):
+    """
+    Grows the forest chunk by chunk. Chunks missing a class are carried over and merged
+    with the next one so every batch of trees sees all classes.
+    Returns the number of rows used.
+    """
+    pending_X, pending_y = [], []
+    used = 0
+    for X, y in chunks:
+        pending_X.append(X)
+        pending_y.append(y)
+        y_all = np.concatenate(pending_y)
+        if not set(classes).issubset(np.unique(y_all).tolist()):
+            continue
+        clf.grow(np.concatenate(pending_X), y_all, trees_per_chunk)
+        used += len(y_all)
+        pending_X, pending_y = [], []
+
+    if pending_y:
+        print(f"Skipped {sum(len(y) for y in pending_y)} trailing rows that do not cover every class")
+    return used
+
+
+def run_pipeline(data_dir, out_path="rf_model.joblib", base_model=None, chunk_rows=CHUNK_ROWS, trees_per_chunk=TREES_PER_CHUNK):
+    """
+    Trains (or, given base_model, extends) a forest from the feature files in data_dir and saves it.
+    Returns the per-stage profile.
+    """
+    profiler = StageProfiler()
+    clf = LandslideRiskClassifier()
+
+    with profiler.stage("discover"):
+        pairs = find_feature_files(data_dir)
+        if not pairs:
+            raise FileNotFoundError(f"No <name>.X.npy/<name>.y.npy pairs in {data_dir}")
+
+    if base_model:
+        with profiler.stage("load_base"):
+            # The existing trees are memory-mapped; new trees are appended alongside them
+            clf.load_model(base_model)
+
+    with profiler.stage("train"):
+        rows = train_incremental(clf, iter_feature_chunks(pairs, chunk_rows), trees_per_chunk)
+
+    with profiler.stage("save"):
+        clf.save_model(out_path)
+
+    with profiler.stage("load_mmap"):
+        LandslideRiskClassifier().load_model(out_path, mmap_mode="r")
+
+    print(f"Trained on {rows} rows from {len(pairs)} files; forest has {len(clf.model.estimators_)} trees.")
+    return profiler.report()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Train the landslide risk forest from on-disk feature chunks.")
+    parser.add_argument("data_dir", help="Directory of <name>.X.npy / <name>.y.npy pairs")
+    parser.add_argument("--out", default="rf_model.joblib")
+    parser.add_argument("--base-model", help="Existing model to grow with the new rows")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--trees-per-chunk", type=int, default=TREES_PER_CHUNK)
+    args = parser.parse_args()
+
+    run_pipeline(args.data_dir, args.out, args.base_model, args.chunk_rows, args.trees_per_chunk)
@@ -1,8 +1,18 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Header, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from ai_engine.inference import LandslideInferenceEngine
-from backend.services.gee_service import get_satellite_layer_url, get_sar_layer_url
-# from backend.services.notification_service import NotificationService
+from typing import Optional
+from backend.services.gee_service import get_layer_url, LAYER_ALIASES
+from backend.services.engine_registry import get_engine
+from backend.services.history_store import history_store, MAX_PAGE_SIZE
+from backend.services.prediction_service import PredictionExecutor, MAX_BATCH_POINTS
+from backend.services.spatial_index import region_index
+from backend.services.tile_service import tile_service, LOCAL_LAYERS, MAX_ZOOM
+from backend.api.response_cache import ResponseCache, etag_matches
+from ai_engine.features.sar_change import SARChangeTracker
+from backend.services.notification_service import notification_service
+import json
 
 router = APIRouter()
 
@@ -11,88 +21,180 @@ class RiskRequest(BaseModel):
     lon: float
 
 # Initialize services
-ai_engine = LandslideInferenceEngine()
-
-# Shared in-memory storage for alerts
-# Shared in-memory storage for alerts (Static Historical Data) with XAI metrics
-risk_history = [
-    {
-        "timestamp": 1700000000, 
-        "region": "Nilgiris (Ooty)", 
-        "risk": "High", 
-        "type": "Debris Flow",
-        "confidence": "98%",
-        "lat": 11.4102, "lon": 76.6950, 
-        "details": "Steep slope > 40°",
-        "metrics": {"slope": 85, "rain": 90, "twi": 70, "ndvi": 40} # Normalized 0-100 scores
-    },
-    {
-        "timestamp": 1700000000, 
-        "region": "Kodaikanal", 
-        "risk": "Medium", 
-        "type": "Rockfall",
-         "confidence": "85%",
-        "lat": 10.2381, "lon": 77.4892, 
-        "details": "Unstable cliffs",
-        "metrics": {"slope": 75, "rain": 50, "twi": 30, "ndvi": 60}
-    },
-    {
-        "timestamp": 1700000000, 
-        "region": "Valparai", 
-        "risk": "Medium", 
-        "type": "Mudslide",
-         "confidence": "75%",
-        "lat": 10.3204, "lon": 76.9554, 
-        "details": "High rainfall history",
-         "metrics": {"slope": 45, "rain": 95, "twi": 80, "ndvi": 85}
-    },
-    {
-        "timestamp": 1700000000, 
-        "region": "Chennai", 
-        "risk": "Low", 
-        "type": "N/A",
-         "confidence": "99%",
-        "lat": 13.0827, "lon": 80.2707, 
-        "details": "Flat terrain",
-         "metrics": {"slope": 5, "rain": 60, "twi": 90, "ndvi": 20}
-    }
-]
+ai_engine = get_engine()
+predictor = PredictionExecutor(ai_engine)
+# Encoded /history pages, keyed by the table's latest event id and the query; a write from any worker invalidates them
+history_responses = ResponseCache("history_response", max_entries=256)
+sar_tracker = SARChangeTracker(lambda: ai_engine.gee_loader)
 
 @router.post("/predict")
 async def predict_risk(request: RiskRequest, background_tasks: BackgroundTasks):
-    pass # Implementation omitted for brevity
+    risk = await predictor.predict(request.lat, request.lon)
+    # Monitored zone the point falls in (nearest within REGION_MATCH_KM), if any
+    region = region_index.match(request.lat, request.lon)
+    if risk == "High":
+        name = region["name"] if region else f"{request.lat:.4f}, {request.lon:.4f}"
+        background_tasks.add_task(notification_service.alert_high_risk, [name])
+    return {"lat": request.lat, "lon": request.lon, "risk": risk, "region": region}
+
+@router.post("/predict/batch")
+async def predict_risk_batch(requests: list[RiskRequest]):
+    """
+    Scores a survey grid of points.
+    Results are streamed back as newline-delimited JSON in completion order; each line
+    carries the index of the input point it answers.
+    """
+    if len(requests) > MAX_BATCH_POINTS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_POINTS} points per batch")
+
+    async def stream():
+        async for result in predictor.predict_many([(r.lat, r.lon) for r in requests]):
+            yield json.dumps(result) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@router.post("/sar/series")
+async def get_sar_series(requests: list[RiskRequest]):
+    """
+    Sentinel-1 VH/VV series, cached baseline and change scores for many points.
+    Baselines are computed once per point; later calls only fetch new acquisitions.
+    """
+    if len(requests) > MAX_BATCH_POINTS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_POINTS} points per batch")
+    return await run_in_threadpool(sar_tracker.update, [(r.lat, r.lon) for r in requests])
 
 @router.get("/history")
-async def get_history():
-    return risk_history
+async def get_history(
+    request: Request,
+    start: Optional[int] = None,
+    end: Optional[int] = None,
+    region: Optional[str] = None,
+    risk: Optional[str] = None,
+    bbox: Optional[str] = Query(None, description="min_lon,min_lat,max_lon,max_lat"),
+    limit: int = Query(500, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    near_lat: Optional[float] = Query(None, ge=-90, le=90),
+    near_lon: Optional[float] = Query(None, ge=-180, le=180),
+    radius_km: float = Query(10.0, gt=0, le=500)
+):
+    """
+    Returns one page of risk history, newest first unless order=asc. When more records
+    match, the cursor for the next page is sent in the X-Next-Cursor header.
+    near_lat/near_lon/radius_km restrict the page to events within radius_km of a point.
+    Pages are encoded once per table revision and revalidated with ETags.
+    """
+    box = _parse_bbox(bbox)
+    if (near_lat is None) != (near_lon is None):
+        raise HTTPException(status_code=422, detail="near_lat and near_lon must be given together")
+    near = (near_lat, near_lon, radius_km) if near_lat is not None else None
+
+    def page():
+        items, next_cursor = history_store.query(
+            start=start, end=end, region=region, risk=risk,
+            bbox=box, limit=limit, cursor=cursor, descending=(order == "desc"), near=near
+        )
+        return items, {"X-Next-Cursor": next_cursor} if next_cursor else {}
+
+    def cached_page():
+        # Keyed on the database, not this process, so rows inserted by other workers show up.
+        # Flushing first keeps read-your-writes; with nothing buffered it does not touch the database.
+        history_store.flush()
+        key = (history_store.revision(), start, end, region, risk, box, limit, cursor, order, near)
+        return history_responses.get_or_build(key, page)
+
+    try:
+        encoded = await run_in_threadpool(cached_page)
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Invalid cursor")
+    return encoded.respond(request)
+
+@router.get("/history/nearest")
+async def get_nearest_history(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    k: int = Query(10, ge=1, le=1000),
+    max_km: Optional[float] = Query(None, gt=0)
+):
+    """
+    The k recorded events closest to a point, closest first.
+    """
+    return await run_in_threadpool(history_store.nearest, lat, lon, k, max_km)
+
+def _parse_bbox(bbox):
+    try:
+        box = tuple(float(v) for v in bbox.split(",")) if bbox else None
+        if box is not None and len(box) != 4:
+            raise ValueError
+    except ValueError:
+        raise HTTPException(status_code=422, detail="bbox must be min_lon,min_lat,max_lon,max_lat")
+    return box
+
+@router.get("/regions")
+async def get_regions(bbox: Optional[str] = Query(None, description="min_lon,min_lat,max_lon,max_lat")):
+    """
+    Monitored regions, optionally limited to a map viewport.
+    """
+    box = _parse_bbox(bbox)
+    if box is None:
+        box = (-180.0, -90.0, 180.0, 90.0)
+    return region_index.within_bbox(*box)
+
+@router.get("/regions/nearest")
+async def get_nearest_regions(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    k: int = Query(1, ge=1, le=100),
+    radius_km: Optional[float] = Query(None, gt=0, description="Return every region within this distance instead of the k nearest")
+):
+    """
+    Nearest monitored regions to a point, closest first, with distance_km.
+    """
+    if radius_km is not None:
+        return region_index.within_radius(lat, lon, radius_km)
+    return region_index.nearest(lat, lon, k)
+
+@router.get("/tiles/{layer}/{z}/{x}/{y}.png")
+async def get_tile(layer: str, z: int, x: int, y: int, if_none_match: Optional[str] = Header(None)):
+    """
+    Locally rendered XYZ tile ('risk' or 'slope') from the disk tile cache; renders on a miss.
+    """
+    if layer not in LOCAL_LAYERS or not (0 <= z <= MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise HTTPException(status_code=404, detail="Tile not found")
+    headers = {"Cache-Control": "public, max-age=3600"}
+    etag = tile_service.etag(layer, z, x, y)
+    if etag is None or not etag_matches(if_none_match, etag):
+        data, etag = await run_in_threadpool(tile_service.get_tile, layer, z, x, y)
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={**headers, "ETag": etag})
+    return Response(data, media_type="image/png", headers={**headers, "ETag": etag})
 
 class MapLayerRequest(BaseModel):
     districts: list[str] = ["All"]
     layer_type: str = "satellite" # 'risk', 'slope', 'twi', 'ndvi', 'infrastructure'
 
 @router.post("/map-layer")
-async def get_map_layer(request: MapLayerRequest):
-    """
-    Returns a Google Earth Engine tile URL.
-    """
-    from backend.services.gee_service import get_satellite_layer_url, get_slope_layer_url, get_twi_layer_url, get_ndvi_layer_url
-    
-    layer_map = {
-        "slope": get_slope_layer_url,
-        "twi": get_twi_layer_url,
-        "ndvi": get_ndvi_layer_url,
-        "risk": get_satellite_layer_url,
-        "satellite": get_satellite_layer_url
-    }
-    
+async def get_map_layer(request: MapLayerRequest, http_request: Request):
+    """
+    Returns a tile URL for the layer.
+    Risk and slope come from the local tile renderer when the terrain store is built, so
+    panning does not depend on GEE; other layers (or no local terrain) use a GEE tile URL.
+    Cached GEE layers are answered from memory; cache misses run off the event loop.
+    """
+    layer = LAYER_ALIASES.get(request.layer_type, request.layer_type)
+    if layer in LOCAL_LAYERS and tile_service.terrain_store.available:
+        base = str(http_request.url.replace(query="")).rsplit("/map-layer", 1)[0]
+        return {"tileUrl": f"{base}/tiles/{layer}/{{z}}/{{x}}/{{y}}.png"}
+
     try:
-        generator = layer_map.get(request.layer_type, get_satellite_layer_url)
-        url = generator(request.districts)
-        
+        url = await run_in_threadpool(get_layer_url, request.layer_type, request.districts)
+
         if not url:
             raise HTTPException(status_code=500, detail="Failed to generate map layer")
-            
+
         return {"tileUrl": url}
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Endpoint Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,75 @@
+import time
+
+from fastapi import APIRouter, Response
+
+from ai_engine import metrics
+
+router = APIRouter()
+
+
+@router.get("/metrics", include_in_schema=False)
+def get_metrics():
+    body, content_type = metrics.render()
+    return Response(body, headers={"Content-Type": content_type})
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording per-route latency, in-flight requests and body sizes.
+    Routes are labelled by their path template ("/api/v1/history"), never the raw URL, so
+    label cardinality stays bounded. Plain ASGI (not BaseHTTPMiddleware) so streaming
+    responses pass through untouched.
+    """
+    def __init__(self, app):
+        self.app = app
+        self._routes = None   # endpoint -> path template
+        self._children = {}   # route -> (request size, response size)
+
+    def _route(self, scope):
+        if self._routes is None:
+            self._routes = {
+                getattr(r, "endpoint", None): r.path
+                for r in scope["app"].routes if hasattr(r, "path")
+            }
+        return self._routes.get(scope.get("endpoint"), "unmatched")
+
+    def _sizes(self, route):
+        children = self._children.get(route)
+        if children is None:
+            children = self._children[route] = (
+                metrics.http_request_size.labels(route),
+                metrics.http_response_size.labels(route)
+            )
+        return children
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        status = 500
+        response_bytes = 0
+
+        async def send_wrapper(message):
+            nonlocal status, response_bytes
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                response_bytes += len(message.get("body", b""))
+            await send(message)
+
+        # The route is only known once routing has run, so in-flight requests are counted per method
+        in_flight = metrics.http_requests_in_progress.labels(scope["method"])
+        in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_flight.dec()
+            route = self._route(scope)
+            request_size, response_size = self._sizes(route)
+            for name, value in scope.get("headers", ()):
+                if name == b"content-length":
+                    request_size.observe(int(value))
+                    break
+            response_size.observe(response_bytes)
+            metrics.http_request_duration.labels(scope["method"], route, str(status)).observe(time.perf_counter() - start)
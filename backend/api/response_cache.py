@@ -0,0 +1,150 @@
+"""
+Serialize-once JSON responses for polled endpoints.
+
+A payload is encoded to bytes once per snapshot (orjson when installed), compressed lazily
+per content-coding (brotli when installed, gzip otherwise) and kept in a small LRU keyed by
+whatever identifies the snapshot (simulation tick, history revision + query). Every client
+polling the same snapshot gets the same bytes; clients that send the ETag back get a 304.
+"""
+import gzip
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from fastapi import Response
+
+from ai_engine import metrics
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this are not worth a compression header
+MIN_COMPRESS_BYTES = 512
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def dumps(payload):
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def _accepted_encodings(request):
+    accepted = set()
+    for part in request.headers.get("accept-encoding", "").split(","):
+        coding, *params = [p.strip() for p in part.split(";")]
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if q > 0:
+            accepted.add(coding.lower())
+    return accepted
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    base = etag.strip('"')
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        # Encoded representations carry a -gzip/-br suffix; any of them validates the snapshot
+        if candidate.strip('"').split("-")[0] == base:
+            return True
+    return False
+
+
+class EncodedResponse:
+    """
+    One JSON payload serialized to bytes, with lazily built compressed variants.
+    """
+    def __init__(self, payload, headers=None):
+        self.body = dumps(payload)
+        self.headers = dict(headers or {})
+        self.etag = '"' + hashlib.blake2b(self.body, digest_size=12).hexdigest() + '"'
+        self._encoded = {}
+        self._lock = threading.Lock()
+
+    def encoded(self, coding):
+        body = self._encoded.get(coding)
+        if body is None:
+            with self._lock:
+                body = self._encoded.get(coding)
+                if body is None:
+                    if coding == "br":
+                        body = brotli.compress(self.body, quality=BROTLI_QUALITY)
+                    else:
+                        body = gzip.compress(self.body, compresslevel=GZIP_LEVEL, mtime=0)
+                    self._encoded[coding] = body
+        return body
+
+    def respond(self, request, cache_control="no-cache"):
+        """
+        304 when the client already has this snapshot, otherwise the best encoding it accepts.
+        no-cache lets clients keep the body but revalidate on every poll.
+        """
+        coding = None
+        if len(self.body) >= MIN_COMPRESS_BYTES:
+            accepted = _accepted_encodings(request)
+            if brotli is not None and "br" in accepted:
+                coding = "br"
+            elif "gzip" in accepted:
+                coding = "gzip"
+        # The 304 carries the ETag of the representation a 200 would have sent
+        etag = self.etag if coding is None else f'{self.etag[:-1]}-{coding}"'
+        headers = {**self.headers, "Cache-Control": cache_control, "Vary": "Accept-Encoding", "ETag": etag}
+        if etag_matches(request.headers.get("if-none-match"), self.etag):
+            return Response(status_code=304, headers=headers)
+
+        if coding is None:
+            return Response(self.body, media_type="application/json", headers=headers)
+        return Response(
+            self.encoded(coding), media_type="application/json", headers={**headers, "Content-Encoding": coding}
+        )
+
+
+class ResponseCache:
+    """
+    Small LRU of EncodedResponse objects keyed by snapshot identity.
+    """
+    def __init__(self, name, max_entries=128):
+        self.name = name
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key, build):
+        """
+        build() returns (payload, headers); it runs only when `key` is not cached.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        metrics.record_cache(self.name, entry is not None)
+        if entry is not None:
+            return entry
+
+        payload, headers = build()
+        entry = EncodedResponse(payload, headers)
+        with self._lock:
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
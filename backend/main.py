@@ -1,11 +1,17 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Query, Request, WebSocket
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from .api import endpoints
+from .api.metrics import MetricsMiddleware, router as metrics_router
+from .api.response_cache import ResponseCache
 import asyncio
-from ai_engine.inference import LandslideInferenceEngine
-from .api.endpoints import risk_history  # Import shared history
-import ee
+from .services.history_store import history_store  # Shared history
+from .services.engine_registry import registry
+from .services.gee_service import prewarm_layer_cache
 import os
+from typing import Optional
+import numpy as np
 
 app = FastAPI(title="LandslideX API", version="1.0.0")
 
@@ -18,10 +24,14 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-route latency, in-flight requests and payload sizes, exported on /metrics
+app.add_middleware(MetricsMiddleware)
+
 app.include_router(endpoints.router, prefix="/api/v1")
+app.include_router(metrics_router)
 
 # Specialized Background Monitor
-ai_engine = LandslideInferenceEngine()
+ai_engine = registry.get_engine()
 MONITORED_REGIONS = [
     {"name": "Nilgiris (Ooty)", "lat": 11.4102, "lon": 76.6950},
     {"name": "Kodaikanal (Dindigul)", "lat": 10.2381, "lon": 77.4892},
@@ -30,27 +40,75 @@ MONITORED_REGIONS = [
 
 # Initialize Simulator
 # Initialize Simulator
-from .services.simulator_service import LandslideSimulator
+from .services.simulator_service import LandslideSimulator, ENSEMBLE_MEMBERS
+from .services.simulation_stream import SimulationBroadcaster
+from .services.shared_state import open_shared_table
+from .services.spatial_index import region_index
+from .services.notification_service import notification_service
 simulator = LandslideSimulator()
+# Nearest-region / viewport lookups follow the simulator's region table
+region_index.track(simulator)
+
+# Simulate for 10 major zones in Tamil Nadu
+SIMULATED_ZONES = [
+    "Nilgiris (Ooty)",
+    "Kodaikanal (Dindigul)",
+    "Valparai (Coimbatore)",
+    "Yercaud (Salem)",
+    "Kolli Hills (Namakkal)",
+    "Megamalai (Theni)",
+    "Javadi Hills (Tirupattur)",
+    "Yelagiri (Tirupattur)",
+    "Courtallam (Tenkasi)",
+    "Coonoor (Nilgiris)"
+]
+
+# One tick scheduler shared by every viewer; with several uvicorn workers one of them
+# simulates and the rest serve its state from the shared region table
+broadcaster = SimulationBroadcaster(
+    simulator, SIMULATED_ZONES, shared=open_shared_table(), on_high_risk=notification_service.alert_high_risk
+)
+# Each tick is encoded (and compressed) once, however many dashboards poll it
+simulate_responses = ResponseCache("simulate_response", max_entries=4)
 
 @app.get("/api/v1/simulate")
-async def get_simulation():
-    # Simulate for 10 major zones in Tamil Nadu
-    locations = [
-        "Nilgiris (Ooty)",
-        "Kodaikanal (Dindigul)",
-        "Valparai (Coimbatore)",
-        "Yercaud (Salem)",
-        "Kolli Hills (Namakkal)",
-        "Megamalai (Theni)",
-        "Javadi Hills (Tirupattur)",
-        "Yelagiri (Tirupattur)",
-        "Courtallam (Tenkasi)",
-        "Coonoor (Nilgiris)"
-    ]
-    
-    results = [simulator.simulate_landslide_risk(loc) for loc in locations]
-    return results
+async def get_simulation(request: Request):
+    # Serve the latest tick; polling no longer advances the simulation
+    snapshot = broadcaster.latest()
+    encoded = simulate_responses.get_or_build(broadcaster.sequence, lambda: (snapshot, None))
+    return encoded.respond(request)
+
+@app.get("/api/v1/simulate/ensemble")
+async def get_simulation_ensemble(
+    members: int = Query(ENSEMBLE_MEMBERS, ge=10, le=20000),
+    horizon: int = Query(1, ge=1, le=72, description="Steps ahead; probabilities are of the worst level reached"),
+    seed: Optional[int] = Query(None, ge=0, description="Same seed and state give the same result")
+):
+    """
+    Risk exceedance probabilities and percentile bands from a Monte Carlo ensemble,
+    starting from the state currently being served.
+    """
+    if seed is None:
+        seed = int(np.random.SeedSequence().entropy % 2 ** 32)
+    result = await run_in_threadpool(
+        simulator.simulate_ensemble, SIMULATED_ZONES, members, horizon, seed, broadcaster.moisture(SIMULATED_ZONES)
+    )
+    return {"seed": seed, "members": members, "horizon": horizon, "regions": result.records()}
+
+@app.get("/api/v1/simulate/stream")
+async def stream_simulation(request: Request):
+    """
+    Server-Sent Events: a full snapshot on connect, then changed regions per tick.
+    """
+    return StreamingResponse(
+        broadcaster.sse_events(request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.websocket("/api/v1/simulate/ws")
+async def simulation_websocket(websocket: WebSocket):
+    await broadcaster.serve_websocket(websocket)
 
 # Background task removed for Historical Static Mode
 # async def monitor_regions(): ...
@@ -59,26 +117,35 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+def _background_startup():
+    # Initialize Earth Engine once for the whole process
+    ee_ready = registry.initialize_earth_engine()
+
+    # Build models ahead of the first prediction
+    registry.warm_up()
+
+    # Pre-warm the map-layer cache
+    if ee_ready and os.getenv("GEE_PREWARM", "1") != "0":
+        registry.timed("layer_prewarm", prewarm_layer_cache)
+
 @app.on_event("startup")
 async def startup_event():
-    # Only initialize GEE, no background loop
-
-    # Initialize Earth Engine
-    project_id = os.getenv("EE_PROJECT_ID")
-    try:
-        if project_id:
-            ee.Initialize(project=project_id)
-        else:
-            ee.Initialize() # Try default
-        print(f"Google Earth Engine initialized successfully with project: {project_id}")
-    except Exception as e:
-        print(f"Failed to initialize Google Earth Engine: {e}")
-        print("Trying to authenticate...")
-        try:
-            ee.Authenticate()
-            ee.Initialize(project=project_id)
-        except Exception as auth_e:
-            print(f"Authentication failed: {auth_e}")
+    # Start serving immediately; initialization and warm-up continue in the background
+    asyncio.get_running_loop().run_in_executor(None, _background_startup)
+    broadcaster.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await broadcaster.stop()
+    # Send queued alerts and close the SMTP sessions
+    await run_in_threadpool(notification_service.stop)
+    # Write any buffered history records
+    history_store.flush()
+
+@app.get("/api/v1/ready")
+def readiness():
+    status = registry.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
 
 @app.get("/")
 def read_root():
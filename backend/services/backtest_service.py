@@ -0,0 +1,296 @@
+"""
+Backtest of the risk rules against a landslide inventory.
+
+Daily rainfall for every region (or slope unit) lives in a memory-mapped archive, one row
+per day, and is streamed a year at a time. Each chunk replays the moisture accumulation
+of simulator_service and applies the threshold rules to all days x regions at once; any
+number of threshold sets is scored in the same pass, so a sweep costs one read of the archive.
+
+Scoring (per region-day, against events mapped to (region, day)):
+    hit          an event with an alarm on its day or up to lead_days before
+    false alarm  an alarm day with no event in the following lead_days
+
+    python -m backend.services.backtest_service data/backtest/tn --sweep heavy_rain=30,40,50 --sweep steep_slope=25,30
+"""
+import itertools
+import json
+import os
+import time
+from datetime import date, datetime, timezone
+
+import numpy as np
+
+from ai_engine.inference import VULNERABILITY_HIGH_SLOPE, VULNERABILITY_MEDIUM_SLOPE
+from backend.services.simulator_service import DEFAULT_MOISTURE, RISK_LEVELS, classify_risk, update_moisture
+from backend.services.spatial_index import REGION_MATCH_KM, SpatialIndex
+
+BACKTEST_DIR = os.getenv("BACKTEST_DIR", os.path.join("data", "backtest"))
+CHUNK_DAYS = 365
+LEAD_DAYS = 3
+# Slope used where the terrain store has no data (same as the offline terrain fallback)
+DEFAULT_SLOPE = 25.0
+
+MOISTURE_PARAMS = ("wet_rain", "gain", "drying")
+RISK_PARAMS = ("steep_slope", "heavy_rain", "saturated", "tremor", "medium_slope", "medium_rain", "medium_moisture")
+TERRAIN_PARAMS = ("high_slope", "medium_slope")
+
+
+def write_archive(path, start_date, names, lats, lons, rainfall_chunks, slopes=None):
+    """
+    Streams daily rainfall (mm/day) into <path>/rainfall.f32, day-major, so a backtest reads
+    contiguous blocks of days. rainfall_chunks: iterable of (days, regions) arrays.
+    Slopes default to the local terrain store (DEFAULT_SLOPE where it has no data).
+    """
+    os.makedirs(path, exist_ok=True)
+    n = len(names)
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    if slopes is None:
+        from ai_engine.data_loaders.terrain_store import TerrainRasterStore
+        _, slopes = TerrainRasterStore().sample(lats, lons)
+    slopes = np.where(np.isnan(np.asarray(slopes, dtype=np.float64)), DEFAULT_SLOPE, slopes)
+
+    days = 0
+    with open(os.path.join(path, "rainfall.f32"), "wb") as f:
+        for chunk in rainfall_chunks:
+            chunk = np.asarray(chunk, dtype=np.float32).reshape(-1, n)
+            # Missing days count as dry
+            f.write(np.ascontiguousarray(np.nan_to_num(chunk)).tobytes())
+            days += len(chunk)
+
+    meta = {
+        "start": str(start_date)[:10],
+        "days": days,
+        "names": list(names),
+        "lat": lats.tolist(),
+        "lon": lons.tolist(),
+        "slope": np.asarray(slopes, dtype=np.float64).tolist()
+    }
+    with open(os.path.join(path, "meta.json.tmp"), "w") as f:
+        json.dump(meta, f)
+    os.replace(os.path.join(path, "meta.json.tmp"), os.path.join(path, "meta.json"))
+    return RainfallArchive(path)
+
+
+class RainfallArchive:
+    """
+    Read side of write_archive: (days, regions) float32 memmap plus region metadata.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        self.start = date.fromisoformat(meta["start"])
+        self.names = meta["names"]
+        self.lat = np.asarray(meta["lat"], dtype=np.float64)
+        self.lon = np.asarray(meta["lon"], dtype=np.float64)
+        self.slope = np.asarray(meta["slope"], dtype=np.float64)
+        self.rainfall = np.memmap(
+            os.path.join(path, "rainfall.f32"), dtype=np.float32, mode="r", shape=(meta["days"], len(self.names))
+        )
+
+    @property
+    def days(self):
+        return self.rainfall.shape[0]
+
+    @property
+    def regions(self):
+        return self.rainfall.shape[1]
+
+    def day_index(self, timestamp):
+        return (datetime.fromtimestamp(timestamp, tz=timezone.utc).date() - self.start).days
+
+    def iter_chunks(self, chunk_days=CHUNK_DAYS):
+        """
+        Yields (first day, (days, regions) float64 block); only one block is in memory at a time.
+        """
+        for start in range(0, self.days, chunk_days):
+            yield start, np.asarray(self.rainfall[start:start + chunk_days], dtype=np.float64)
+
+
+def match_events(archive, records, max_km=REGION_MATCH_KM):
+    """
+    Maps inventory records ({"timestamp", "region", "lat", "lon"}) onto (region, day) indices.
+    Region names match exactly; otherwise the nearest archive region within max_km is used.
+    Returns an (n, 2) int array; records outside the archive period or area are dropped.
+    """
+    by_name = {name: i for i, name in enumerate(archive.names)}
+    index = None
+    events = []
+    for record in records:
+        region = by_name.get(record.get("region"))
+        if region is None and record.get("lat") is not None and record.get("lon") is not None:
+            if index is None:
+                index = SpatialIndex(archive.lat, archive.lon)
+            ids, _ = index.nearest(record["lat"], record["lon"], 1, max_km)
+            region = int(ids[0]) if len(ids) else None
+        day = archive.day_index(record["timestamp"])
+        if region is not None and 0 <= day < archive.days:
+            events.append((region, day))
+    return np.asarray(events, dtype=np.int64).reshape(-1, 2)
+
+
+def history_events(archive, store=None, types=None, max_km=REGION_MATCH_KM):
+    """
+    Landslide inventory from the risk history: every record with a recorded landslide type
+    (anything but "N/A"), or only the given `types`.
+    """
+    from backend.services.history_store import MAX_PAGE_SIZE, history_store
+
+    store = store or history_store
+    records, cursor = [], None
+    while True:
+        page, cursor = store.query(limit=MAX_PAGE_SIZE, cursor=cursor)
+        records.extend(
+            r for r in page
+            if (r.get("type") in types if types else r.get("type") not in (None, "", "N/A"))
+        )
+        if cursor is None:
+            break
+    return match_events(archive, records, max_km)
+
+
+class RuleSet:
+    """
+    One set of thresholds to score.
+    kind "simulator": moisture replay + classify_risk; parameters are the keywords of
+                      update_moisture/classify_risk, defaults are the live rules. No vibration
+                      is archived, so the tremor rule never fires.
+    kind "terrain":   the slope-only vulnerability rule of LandslideInferenceEngine.predict_risk.
+    """
+    def __init__(self, name=None, kind="simulator", **params):
+        allowed = MOISTURE_PARAMS + RISK_PARAMS if kind == "simulator" else TERRAIN_PARAMS
+        unknown = set(params) - set(allowed)
+        if kind not in ("simulator", "terrain") or unknown:
+            raise ValueError(f"Unknown {kind} rule parameters: {sorted(unknown) or kind}")
+        self.kind = kind
+        self.params = params
+        self.name = name or (",".join(f"{k}={v}" for k, v in sorted(params.items())) or kind)
+        self.moisture_key = tuple(sorted((k, v) for k, v in params.items() if k in MOISTURE_PARAMS)) \
+            if kind == "simulator" else None
+
+    def classify(self, slope, rainfall, moisture):
+        if self.kind == "terrain":
+            high = self.params.get("high_slope", VULNERABILITY_HIGH_SLOPE)
+            medium = self.params.get("medium_slope", VULNERABILITY_MEDIUM_SLOPE)
+            levels = np.where(slope > high, 2, np.where(slope > medium, 1, 0)).astype(np.int8)
+            return np.broadcast_to(levels, rainfall.shape)
+        risk_params = {k: v for k, v in self.params.items() if k in RISK_PARAMS}
+        return classify_risk(slope, rainfall, moisture, 0.0, **risk_params)
+
+
+def threshold_grid(kind="simulator", **ranges):
+    """
+    One RuleSet per combination, e.g. threshold_grid(heavy_rain=[30, 40, 50], steep_slope=[25, 30]).
+    """
+    names = sorted(ranges)
+    return [RuleSet(kind=kind, **dict(zip(names, values))) for values in itertools.product(*(ranges[n] for n in names))]
+
+
+def run_backtest(archive, events, rule_sets=None, alarm_level="High", lead_days=LEAD_DAYS,
+                 chunk_days=CHUNK_DAYS, initial_moisture=DEFAULT_MOISTURE):
+    """
+    Scores every rule set over the whole archive in one streaming pass.
+    events: (n, 2) array of (region, day), e.g. from history_events/match_events.
+    Returns {"days", "regions", "events", "elapsed_s", "results": [per rule set scores]}.
+    """
+    started = time.perf_counter()
+    rule_sets = rule_sets or [RuleSet("live")]
+    level = RISK_LEVELS.index(alarm_level)
+    events = np.asarray(events, dtype=np.int64).reshape(-1, 2)
+    event_region, event_day = events[:, 0], events[:, 1]
+    slope = archive.slope[None, :]
+
+    # One moisture replay per distinct set of moisture parameters
+    moisture_state = {
+        rules.moisture_key: np.full(archive.regions, float(initial_moisture))
+        for rules in rule_sets if rules.moisture_key is not None
+    }
+    counts = np.zeros((len(rule_sets), 3), dtype=np.int64)  # hit alarm days, false alarm days, quiet days
+    hits = np.zeros((len(rule_sets), len(events)), dtype=bool)
+
+    for start, rain in archive.iter_chunks(chunk_days):
+        n_days = len(rain)
+        # Region-days on which an alarm counts as a hit (an event within the next lead_days)
+        windows = []
+        near = np.zeros(rain.shape, dtype=bool)
+        for offset in range(lead_days + 1):
+            day = event_day - offset - start
+            inside = (day >= 0) & (day < n_days)
+            windows.append((inside, day[inside], event_region[inside]))
+            near[day[inside], event_region[inside]] = True
+        quiet = near.size - np.count_nonzero(near)
+
+        moisture = {}
+        for key, state in moisture_state.items():
+            params = dict(key)
+            series = np.empty_like(rain)
+            for t in range(n_days):
+                state = update_moisture(state, rain[t], **params)
+                series[t] = state
+            moisture_state[key] = state
+            moisture[key] = series
+
+        for i, rules in enumerate(rule_sets):
+            alarms = rules.classify(slope, rain, moisture.get(rules.moisture_key)) >= level
+            alarm_days = np.count_nonzero(alarms)
+            hit_days = np.count_nonzero(alarms & near)
+            counts[i] += (hit_days, alarm_days - hit_days, quiet - (alarm_days - hit_days))
+            for inside, day, region in windows:
+                hits[i, inside] |= alarms[day, region]
+
+    region_years = archive.regions * archive.days / 365.25
+    results = []
+    for i, rules in enumerate(rule_sets):
+        hit_days, false_days, quiet_days = (int(c) for c in counts[i])
+        n_hits = int(hits[i].sum())
+        pod = n_hits / len(events) if len(events) else None
+        pofd = false_days / (false_days + quiet_days) if false_days + quiet_days else 0.0
+        results.append({
+            "name": rules.name,
+            "kind": rules.kind,
+            "params": rules.params,
+            "hits": n_hits,
+            "misses": len(events) - n_hits,
+            "alarm_days": hit_days + false_days,
+            "false_alarm_days": false_days,
+            # probability of detection, false alarm ratio, true skill statistic
+            "pod": None if pod is None else round(pod, 4),
+            "far": round(false_days / (hit_days + false_days), 4) if hit_days + false_days else 0.0,
+            "tss": None if pod is None else round(pod - pofd, 4),
+            "false_alarms_per_region_year": round(false_days / region_years, 4) if region_years else 0.0
+        })
+    return {
+        "days": archive.days,
+        "regions": archive.regions,
+        "events": len(events),
+        "elapsed_s": round(time.perf_counter() - started, 3),
+        "results": results
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Score the risk rules against the landslide inventory.")
+    parser.add_argument("archive", nargs="?", default=os.path.join(BACKTEST_DIR, "default"))
+    parser.add_argument("--sweep", action="append", default=[], help="name=v1,v2,... (repeatable)")
+    parser.add_argument("--alarm-level", default="High", choices=RISK_LEVELS[1:])
+    parser.add_argument("--lead-days", type=int, default=LEAD_DAYS)
+    parser.add_argument("--with-terrain", action="store_true", help="also score the predict_risk slope rule")
+    args = parser.parse_args()
+
+    archive = RainfallArchive(args.archive)
+    ranges = {}
+    for item in args.sweep:
+        name, values = item.split("=", 1)
+        ranges[name] = [float(v) for v in values.split(",")]
+    rule_sets = threshold_grid(**ranges) if ranges else [RuleSet("live")]
+    if args.with_terrain:
+        rule_sets.append(RuleSet("terrain", kind="terrain"))
+
+    report = run_backtest(archive, history_events(archive), rule_sets, args.alarm_level, args.lead_days)
+    print(f"{report['days']} days x {report['regions']} regions, {report['events']} events, {report['elapsed_s']} s")
+    for r in sorted(report["results"], key=lambda r: -(r["tss"] or 0)):
+        print(f"{r['name']:<40} POD {r['pod']}  FAR {r['far']}  TSS {r['tss']}  "
+              f"false alarms/region-year {r['false_alarms_per_region_year']}")
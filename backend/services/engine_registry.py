@@ -0,0 +1,82 @@
+import threading
+import time
+
+from ai_engine.inference import LandslideInferenceEngine
+from ai_engine.data_loaders.gee_loader import initialize_earth_engine
+
+
+class EngineRegistry:
+    """
+    Process-wide home of the inference engine.
+    Every router shares the same engine; its models are built lazily on first use
+    or by a background warm-up once the app is serving.
+    """
+    def __init__(self):
+        self._engine = None
+        self._lock = threading.Lock()
+        self.created_at = time.time()
+        # startup step -> seconds (e.g. earth_engine, layer_prewarm)
+        self.startup_timings = {}
+        self.warmup_state = "pending"  # pending -> running -> done | failed
+        self.warmup_error = None
+
+    def get_engine(self):
+        if self._engine is None:
+            with self._lock:
+                if self._engine is None:
+                    self._engine = LandslideInferenceEngine()
+        return self._engine
+
+    def timed(self, step, func, *args, **kwargs):
+        """
+        Runs one startup step and records how long it took.
+        """
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.startup_timings[step] = time.perf_counter() - start
+
+    def initialize_earth_engine(self):
+        return self.timed("earth_engine", initialize_earth_engine, authenticate=True)
+
+    def warm_up(self):
+        """
+        Builds every engine component. Safe to call more than once.
+        """
+        self.warmup_state = "running"
+        try:
+            self.get_engine().load()
+            self.warmup_state = "done"
+        except Exception as e:
+            self.warmup_error = str(e)
+            self.warmup_state = "failed"
+            print(f"Engine warm-up failed: {e}")
+
+    @property
+    def ready(self):
+        return self.warmup_state == "done"
+
+    def status(self):
+        engine = self.get_engine()
+        return {
+            "ready": self.ready,
+            "warmup": self.warmup_state,
+            "error": self.warmup_error,
+            "uptime_s": round(time.time() - self.created_at, 3),
+            "startup_s": {step: round(t, 4) for step, t in self.startup_timings.items()},
+            "components": {
+                name: {
+                    "loaded": engine.is_loaded(name),
+                    "load_s": round(engine.component_timings[name], 4) if name in engine.component_timings else None
+                }
+                for name in engine.COMPONENTS
+            }
+        }
+
+
+registry = EngineRegistry()
+
+
+def get_engine():
+    return registry.get_engine()
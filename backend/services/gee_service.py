@@ -1,201 +1,326 @@
 import ee
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from ai_engine import metrics
+
+# GEE MapIds stop serving tiles after a few hours; refresh well before that.
+LAYER_TTL_SECONDS = float(os.getenv("GEE_LAYER_TTL", 3 * 3600))
+LAYER_CACHE_SIZE = int(os.getenv("GEE_LAYER_CACHE_SIZE", 128))
+PREWARM_LAYERS = ("risk", "slope", "twi", "ndvi")
+# Locks shared by hash of the layer key; bounded however many distinct keys callers send
+LAYER_LOCK_STRIPES = 64
+
+_base_lock = threading.Lock()
+_base_graph = None
+
+
+def get_base_graph():
+    """
+    Returns the shared Tamil Nadu boundary, SRTM clip and slope objects.
+    They are built once and reused by every layer.
+    """
+    global _base_graph
+    if _base_graph is None:
+        with _base_lock:
+            if _base_graph is None:
+                # 1. Load Tamil Nadu Boundary
+                tamil_nadu = ee.FeatureCollection("FAO/GAUL/2015/level1") \
+                    .filter(ee.Filter.eq('ADM1_NAME', 'Tamil Nadu'))
+
+                # 2. Topography: Calculate Slope from SRTM Elevation
+                dem = ee.Image('USGS/SRTMGL1_003').clip(tamil_nadu)
+                slope = ee.Terrain.slope(dem)
+
+                _base_graph = {"tamil_nadu": tamil_nadu, "dem": dem, "slope": slope}
+    return _base_graph
+
+
+class LayerCache:
+    """
+    Thread-safe LRU of tile URLs with per-entry expiry.
+    Expired entries are dropped on lookup and whenever a new entry is stored.
+    """
+    def __init__(self, ttl=LAYER_TTL_SECONDS, max_entries=LAYER_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, url)
+        self._lock = threading.Lock()
+        self._key_locks = [threading.Lock() for _ in range(LAYER_LOCK_STRIPES)]
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, record=True):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                if record:
+                    self.misses += 1
+                    metrics.record_cache("gee_layer", False)
+                return None
+            self._entries.move_to_end(key)
+            if record:
+                self.hits += 1
+                metrics.record_cache("gee_layer", True)
+            return entry[1]
+
+    def put(self, key, url, ttl=None):
+        now = time.monotonic()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            for stale in [k for k, (exp, _) in self._entries.items() if exp <= now]:
+                del self._entries[stale]
+            self._entries[key] = (expires_at, url)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def key_lock(self, key):
+        """
+        Lock for a key, so concurrent misses for the same layer share one getMapId call.
+        Keys are striped over a fixed pool; unrelated keys rarely share a lock.
+        """
+        return self._key_locks[hash(key) % len(self._key_locks)]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+layer_cache = LayerCache()
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _risk_layer(risk_districts):
+    """
+    Historical Risk Heatmap (Red/Yellow/Green) based on Slope and Historical Rainfall.
+    """
+    base = get_base_graph()
+    tamil_nadu = base["tamil_nadu"]
+    slope = base["slope"]
+
+    # 3. Historical Rainfall: CHIRPS Daily (Peak intensity over last 10 years)
+    # Using 10-year max daily rainfall as a proxy for "historically heavy rain zones"
+    rainfall = ee.ImageCollection('UCSB-CHG/CHIRPS/DAILY') \
+        .filterDate('2015-01-01', '2025-12-31') \
+        .max() \
+        .clip(tamil_nadu)
+
+    # 4. Reclassification Logic
+    # Base: Low (Green) - Slope < 15
+    risk_map = ee.Image(0)
+
+    # Medium (Yellow): Slope 15-30
+    risk_map = risk_map.where(slope.gt(15).And(slope.lte(30)), 1)
+
+    # High (Red): Slope > 30
+    risk_map = risk_map.where(slope.gt(30), 2)
+
+    # Combined Risk: Moderate Slope (>25) AND High Historical Rain (>50mm peak) -> High Risk
+    high_risk_condition = slope.gt(25).And(rainfall.gt(50))
+    risk_map = risk_map.where(high_risk_condition, 2)
+
+    return risk_map.clip(tamil_nadu)
+
+
+def _slope_layer(risk_districts):
+    """
+    Visual Slope Intensity Layer (Causative Factor).
+    """
+    slope = get_base_graph()["slope"]
+    # Mask flat areas to focus on relief
+    return slope.updateMask(slope.gt(5))
+
+
+def _twi_layer(risk_districts):
+    """
+    Topographic Wetness Index (TWI) Layer.
+    TWI = ln(a / tan(b))
+    """
+    base = get_base_graph()
+
+    # 1. Slope (b)
+    slope_rad = base["slope"].multiply(3.14159 / 180)  # Convert to radians
+
+    # 2. Flow Accumulation (a) - Using HydroSHEDS
+    flow = ee.Image("WWF/HydroSHEDS/15ACC").clip(base["tamil_nadu"])
+
+    # 3. Calculate TWI
+    # TWI = ln(Flow / tan(Slope))
+    # Add small epsilon to avoid divide by zero
+    return flow.divide(slope_rad.tan().add(0.001)).log()
+
+
+def _ndvi_layer(risk_districts):
+    """
+    NDVI (Vegetation Health) Layer.
+    """
+    tamil_nadu = get_base_graph()["tamil_nadu"]
+
+    # Sentinel-2
+    s2 = ee.ImageCollection('COPERNICUS/S2_SR') \
+        .filterBounds(tamil_nadu) \
+        .filterDate('2023-01-01', '2023-12-31') \
+        .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', 10)) \
+        .median() \
+        .clip(tamil_nadu)
+
+    # NDVI = (NIR - Red) / (NIR + Red)
+    return s2.normalizedDifference(['B8', 'B4'])
+
+
+def _sar_layer(risk_districts):
+    """
+    Sentinel-1 SAR layer for the specified districts.
+    """
+    districts = ee.FeatureCollection("FAO/GAUL/2015/level2") \
+        .filter(ee.Filter.eq('ADM0_NAME', 'India')) \
+        .filter(ee.Filter.eq('ADM1_NAME', 'Tamil Nadu'))
+
+    priority_areas = districts.filter(ee.Filter.inList('ADM2_NAME', list(risk_districts)))
+
+    # Sentinel-1 SAR (Radar) - Good for cloud penetration
+    return ee.ImageCollection('COPERNICUS/S1_GRD') \
+        .filterBounds(priority_areas) \
+        .filter(ee.Filter.listContains('transmitterReceiverPolarisation', 'VV')) \
+        .filter(ee.Filter.eq('instrumentMode', 'IW')) \
+        .filterDate('2023-01-01', '2023-12-31') \
+        .first() \
+        .clip(priority_areas)
+
+
+# layer_type -> (image builder, default vis params, whether the image depends on the districts)
+LAYERS = {
+    "risk": (_risk_layer, {
+        # 5. Color Palette: Green, Yellow, Red
+        'min': 0,
+        'max': 2,
+        'palette': ['#2ecc71', '#f1c40f', '#e74c3c'],
+        'opacity': 0.7
+    }, False),
+    "slope": (_slope_layer, {
+        # Simple Grayscale for structure
+        'min': 0,
+        'max': 50,
+        'palette': ['white', 'black'],
+        'opacity': 0.6
+    }, False),
+    "twi": (_twi_layer, {
+        # Palette: Blue (Wet) to White/Brown (Dry)
+        'min': 3,
+        'max': 12,
+        'palette': ['brown', 'white', 'blue'],
+        'opacity': 0.7
+    }, False),
+    "ndvi": (_ndvi_layer, {
+        # Palette: Red (Barren) to Green (Lush)
+        'min': 0,
+        'max': 0.8,
+        'palette': ['red', 'yellow', 'green'],
+        'opacity': 0.6
+    }, False),
+    "sar": (_sar_layer, {
+        'min': -25,
+        'max': 5,
+    }, True),
+}
+LAYER_ALIASES = {"satellite": "risk"}
+
+
+def get_layer_url(layer_type, risk_districts, vis_params=None):
+    """
+    Returns the tile URL for a map layer, served from the layer cache while the MapId is fresh.
+    The cache key is (layer_type, districts, vis params); districts are only part of the key
+    for layers that actually depend on them.
+    """
+    layer_type = LAYER_ALIASES.get(layer_type, layer_type)
+    if layer_type not in LAYERS:
+        layer_type = "risk"
+    builder, default_vis, uses_districts = LAYERS[layer_type]
+    vis_params = default_vis if vis_params is None else vis_params
+
+    districts_key = tuple(sorted(risk_districts or [])) if uses_districts else None
+    key = (layer_type, districts_key, _freeze(vis_params))
+
+    url = layer_cache.get(key)
+    if url is not None:
+        return url
+
+    with layer_cache.key_lock(key):
+        # Another request may have filled the entry while we waited
+        url = layer_cache.get(key, record=False)
+        if url is not None:
+            return url
+        try:
+            image = builder(risk_districts or [])
+            map_id_dict = image.getMapId(vis_params)
+            url = map_id_dict['tile_fetcher'].url_format
+        except Exception as e:
+            print(f"Error generating {layer_type} layer: {e}")
+            return None
+        layer_cache.put(key, url)
+        return url
+
+
+def prewarm_layer_cache(layer_types=PREWARM_LAYERS, risk_districts=("All",)):
+    """
+    Fills the layer cache so the first dashboard map switch is a memory hit.
+    """
+    warmed = {}
+    for layer_type in layer_types:
+        start = time.perf_counter()
+        url = get_layer_url(layer_type, list(risk_districts))
+        warmed[layer_type] = url is not None
+        print(f"Pre-warmed {layer_type} layer in {time.perf_counter() - start:.2f}s (ok={url is not None})")
+    return warmed
+
 
 def get_satellite_layer_url(risk_districts):
     """
     Generates a Historical Risk Heatmap (Red/Yellow/Green) based on Slope and Historical Rainfall.
     """
-    try:
-        # 1. Load Tamil Nadu Boundary
-        tamil_nadu = ee.FeatureCollection("FAO/GAUL/2015/level1") \
-            .filter(ee.Filter.eq('ADM1_NAME', 'Tamil Nadu'))
-
-        # 2. Topography: Calculate Slope from SRTM Elevation
-        dem = ee.Image('USGS/SRTMGL1_003').clip(tamil_nadu)
-        slope = ee.Terrain.slope(dem)
-
-        # 3. Historical Rainfall: CHIRPS Daily (Peak intensity over last 10 years)
-        # Using 10-year max daily rainfall as a proxy for "historically heavy rain zones"
-        rainfall = ee.ImageCollection('UCSB-CHG/CHIRPS/DAILY') \
-            .filterDate('2015-01-01', '2025-12-31') \
-            .max() \
-            .clip(tamil_nadu)
-
-        # 4. Reclassification Logic
-        # Base: Low (Green) - Slope < 15
-        risk_map = ee.Image(0)
-        
-        # Medium (Yellow): Slope 15-30
-        risk_map = risk_map.where(slope.gt(15).And(slope.lte(30)), 1)
-        
-        # High (Red): Slope > 30
-        risk_map = risk_map.where(slope.gt(30), 2)
-        
-        # Combined Risk: Moderate Slope (>25) AND High Historical Rain (>50mm peak) -> High Risk
-        high_risk_condition = slope.gt(25).And(rainfall.gt(50))
-        risk_map = risk_map.where(high_risk_condition, 2)
-        
-        risk_map = risk_map.clip(tamil_nadu)
+    return get_layer_url("risk", risk_districts)
 
-        # 5. Color Palette: Green, Yellow, Red
-        vis_params = {
-            'min': 0,
-            'max': 2,
-            'palette': ['#2ecc71', '#f1c40f', '#e74c3c'],
-            'opacity': 0.7
-        }
-
-        # 6. Get the MapID
-        map_id_dict = risk_map.getMapId(vis_params)
-        tile_url = map_id_dict['tile_fetcher'].url_format
-        
-        return tile_url
-    
-    except Exception as e:
-        print(f"Error generating GEE layer: {e}")
-        return None
 
 def get_slope_layer_url(risk_districts):
     """
     Generates a visual Slope Intensity Layer (Causative Factor).
     """
-    try:
-        tamil_nadu = ee.FeatureCollection("FAO/GAUL/2015/level1") \
-            .filter(ee.Filter.eq('ADM1_NAME', 'Tamil Nadu'))
-
-        dem = ee.Image('USGS/SRTMGL1_003').clip(tamil_nadu)
-        slope = ee.Terrain.slope(dem)
-        
-        # Mask flat areas to focus on relief
-        slope_masked = slope.updateMask(slope.gt(5))
-
-        # Palette: White (Low Slope) to Dark Brown/Black (Steep)
-        vis_params = {
-            'min': 0,
-            'max': 60,
-            'palette': ['ffffff', 'ce7e45', 'df923d', 'f1b555', 'fcd163', '99b718', '74a901', '66a000', '529400', '3e8601', '207401', '056201', '004c00', '023b01', '012e01', '011d01', '011301'],
-            'opacity': 0.8
-        }
-        # Better topographic palette
-        vis_params = {
-            'min': 0,
-            'max': 50,
-            'palette': ['white', 'black'], # Simple Grayscale for structure
-            'opacity': 0.6
-        }
-
-        map_id_dict = slope_masked.getMapId(vis_params)
-        return map_id_dict['tile_fetcher'].url_format
-
-    except Exception as e:
-        print(f"Error generating slope layer: {e}")
-        return None
-
-        return map_id_dict['tile_fetcher'].url_format
-
-    except Exception as e:
-        print(f"Error generating slope layer: {e}")
-        return None
+    return get_layer_url("slope", risk_districts)
+
 
 def get_twi_layer_url(risk_districts):
     """
     Generates Topographic Wetness Index (TWI) Layer.
-    TWI = ln(a / tan(b))
     """
-    try:
-        tamil_nadu = ee.FeatureCollection("FAO/GAUL/2015/level1") \
-            .filter(ee.Filter.eq('ADM1_NAME', 'Tamil Nadu'))
-
-        # 1. Slope (b)
-        dem = ee.Image('USGS/SRTMGL1_003').clip(tamil_nadu)
-        slope_rad = ee.Terrain.slope(dem).multiply(3.14159 / 180) # Convert to radians
-        
-        # 2. Flow Accumulation (a) - Using HydroSHEDS
-        flow = ee.Image("WWF/HydroSHEDS/15ACC").clip(tamil_nadu)
-        
-        # 3. Calculate TWI
-        # TWI = ln(Flow / tan(Slope))
-        # Add small epsilon to avoid divide by zero
-        twi = flow.divide(slope_rad.tan().add(0.001)).log()
-        
-        # Palette: Blue (Wet) to White/Brown (Dry)
-        vis_params = {
-            'min': 3,
-            'max': 12,
-            'palette': ['brown', 'white', 'blue'],
-            'opacity': 0.7
-        }
-
-        map_id_dict = twi.getMapId(vis_params)
-        return map_id_dict['tile_fetcher'].url_format
+    return get_layer_url("twi", risk_districts)
 
-    except Exception as e:
-        print(f"Error generating TWI layer: {e}")
-        return None
 
 def get_ndvi_layer_url(risk_districts):
     """
     Generates NDVI (Vegetation Health) Layer.
     """
-    try:
-        tamil_nadu = ee.FeatureCollection("FAO/GAUL/2015/level1") \
-            .filter(ee.Filter.eq('ADM1_NAME', 'Tamil Nadu'))
-
-        # Sentinel-2
-        s2 = ee.ImageCollection('COPERNICUS/S2_SR') \
-            .filterBounds(tamil_nadu) \
-            .filterDate('2023-01-01', '2023-12-31') \
-            .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', 10)) \
-            .median() \
-            .clip(tamil_nadu)
-
-        # NDVI = (NIR - Red) / (NIR + Red)
-        ndvi = s2.normalizedDifference(['B8', 'B4'])
-        
-        # Palette: Red (Barren) to Green (Lush)
-        vis_params = {
-            'min': 0,
-            'max': 0.8,
-            'palette': ['red', 'yellow', 'green'],
-            'opacity': 0.6
-        }
-
-        map_id_dict = ndvi.getMapId(vis_params)
-        return map_id_dict['tile_fetcher'].url_format
+    return get_layer_url("ndvi", risk_districts)
 
-    except Exception as e:
-        print(f"Error generating NDVI layer: {e}")
-        return None
 
 def get_sar_layer_url(risk_districts):
     """
     Generates a Sentinel-1 SAR layer URL for the specified districts.
     """
-    try:
-        districts = ee.FeatureCollection("FAO/GAUL/2015/level2") \
-            .filter(ee.Filter.eq('ADM0_NAME', 'India')) \
-            .filter(ee.Filter.eq('ADM1_NAME', 'Tamil Nadu'))
-
-        priority_areas = districts.filter(ee.Filter.inList('ADM2_NAME', risk_districts))
-
-        # Sentinel-1 SAR (Radar) - Good for cloud penetration
-        sar_imagery = ee.ImageCollection('COPERNICUS/S1_GRD') \
-            .filterBounds(priority_areas) \
-            .filter(ee.Filter.listContains('transmitterReceiverPolarisation', 'VV')) \
-            .filter(ee.Filter.eq('instrumentMode', 'IW')) \
-            .filterDate('2023-01-01', '2023-12-31') \
-            .first() \
-            .clip(priority_areas)
-        
-        vis_params = {
-            'min': -25,
-            'max': 5,
-        }
-
-        map_id_dict = sar_imagery.getMapId(vis_params)
-        tile_url = map_id_dict['tile_fetcher'].url_format
-        
-        return tile_url
-        
-    except Exception as e:
-        print(f"Error generating SAR layer: {e}")
-        return None
+    return get_layer_url("sar", risk_districts)
@@ -0,0 +1,297 @@
+import os
+import threading
+import time
+
+from sqlalchemy import JSON, Column, Float, Index, Integer, String, bindparam, create_engine, event, func, insert, select, tuple_
+from sqlalchemy.orm import declarative_base
+
+from .spatial_index import GrowingSpatialIndex
+
+HISTORY_DB_URL = os.getenv("HISTORY_DB_URL", "sqlite:///data/risk_history.db")
+WRITE_BATCH_SIZE = 500
+WRITE_FLUSH_SECONDS = 1.0
+MAX_PAGE_SIZE = 5000
+
+Base = declarative_base()
+
+# Static Historical Data with XAI metrics, loaded into an empty store
+SEED_HISTORY = [
+    {
+        "timestamp": 1700000000,
+        "region": "Nilgiris (Ooty)",
+        "risk": "High",
+        "type": "Debris Flow",
+        "confidence": "98%",
+        "lat": 11.4102, "lon": 76.6950,
+        "details": "Steep slope > 40°",
+        "metrics": {"slope": 85, "rain": 90, "twi": 70, "ndvi": 40} # Normalized 0-100 scores
+    },
+    {
+        "timestamp": 1700000000,
+        "region": "Kodaikanal",
+        "risk": "Medium",
+        "type": "Rockfall",
+        "confidence": "85%",
+        "lat": 10.2381, "lon": 77.4892,
+        "details": "Unstable cliffs",
+        "metrics": {"slope": 75, "rain": 50, "twi": 30, "ndvi": 60}
+    },
+    {
+        "timestamp": 1700000000,
+        "region": "Valparai",
+        "risk": "Medium",
+        "type": "Mudslide",
+        "confidence": "75%",
+        "lat": 10.3204, "lon": 76.9554,
+        "details": "High rainfall history",
+        "metrics": {"slope": 45, "rain": 95, "twi": 80, "ndvi": 85}
+    },
+    {
+        "timestamp": 1700000000,
+        "region": "Chennai",
+        "risk": "Low",
+        "type": "N/A",
+        "confidence": "99%",
+        "lat": 13.0827, "lon": 80.2707,
+        "details": "Flat terrain",
+        "metrics": {"slope": 5, "rain": 60, "twi": 90, "ndvi": 20}
+    }
+]
+
+FIELDS = ("timestamp", "region", "risk", "type", "confidence", "lat", "lon", "details", "metrics")
+
+
+class RiskEvent(Base):
+    __tablename__ = "risk_events"
+
+    id = Column(Integer, primary_key=True)
+    timestamp = Column(Integer, nullable=False)  # Unix seconds
+    region = Column(String(128), nullable=False)
+    risk = Column(String(16), nullable=False)
+    type = Column(String(64))
+    confidence = Column(String(16))
+    lat = Column(Float)
+    lon = Column(Float)
+    details = Column(String(512))
+    metrics = Column(JSON)
+
+    __table_args__ = (
+        Index("ix_risk_events_timestamp_id", "timestamp", "id"),
+        Index("ix_risk_events_region_timestamp", "region", "timestamp"),
+        Index("ix_risk_events_risk_timestamp", "risk", "timestamp"),
+        Index("ix_risk_events_lat_lon", "lat", "lon"),
+    )
+
+
+def encode_cursor(timestamp, event_id):
+    return f"{timestamp}:{event_id}"
+
+
+def decode_cursor(cursor):
+    timestamp, event_id = cursor.split(":")
+    return int(timestamp), int(event_id)
+
+
+class RiskHistoryStore:
+    """
+    SQLAlchemy-backed risk history.
+    Writes are buffered and inserted in batches; reads flush the buffer first so
+    callers always see their own writes.
+    """
+    def __init__(self, url=HISTORY_DB_URL, batch_size=WRITE_BATCH_SIZE, flush_seconds=WRITE_FLUSH_SECONDS, seed=SEED_HISTORY):
+        self.url = url
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.seed = seed
+        self._engine = None
+        self._buffer = []
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        # In-memory spatial index of event locations, synced from the table on demand
+        self._spatial = None
+        self._spatial_max_id = 0
+        self._spatial_lock = threading.Lock()
+
+    @property
+    def engine(self):
+        """
+        Connects and creates the schema on first use.
+        """
+        if self._engine is None:
+            with self._lock:
+                if self._engine is None:
+                    self._engine = self._connect()
+        return self._engine
+
+    def _connect(self):
+        if self.url.startswith("sqlite:///") and not self.url.startswith("sqlite:///:memory:"):
+            directory = os.path.dirname(self.url[len("sqlite:///"):])
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+        engine = create_engine(self.url)
+        if engine.dialect.name == "sqlite":
+            @event.listens_for(engine, "connect")
+            def _sqlite_pragmas(dbapi_connection, connection_record):
+                cursor = dbapi_connection.cursor()
+                cursor.execute("PRAGMA journal_mode=WAL")
+                cursor.execute("PRAGMA synchronous=NORMAL")
+                cursor.close()
+
+        Base.metadata.create_all(engine)
+        with engine.begin() as conn:
+            if self.seed and conn.execute(select(func.count()).select_from(RiskEvent)).scalar() == 0:
+                conn.execute(insert(RiskEvent), [self._row(r) for r in self.seed])
+        return engine
+
+    @staticmethod
+    def _row(record):
+        row = {field: record.get(field) for field in FIELDS}
+        if row["timestamp"] is None:
+            row["timestamp"] = int(time.time())
+        return row
+
+    @staticmethod
+    def _record(row):
+        record = {field: getattr(row, field) for field in FIELDS}
+        record["id"] = row.id
+        return record
+
+    def add(self, record):
+        """
+        Buffers one record; the buffer is written when it is full or older than flush_seconds.
+        """
+        with self._lock:
+            self._buffer.append(self._row(record))
+            due = len(self._buffer) >= self.batch_size or time.monotonic() - self._last_flush >= self.flush_seconds
+        if due:
+            self.flush()
+
+    def add_many(self, records):
+        with self._lock:
+            self._buffer.extend(self._row(r) for r in records)
+        self.flush()
+
+    def flush(self):
+        with self._lock:
+            rows, self._buffer = self._buffer, []
+            self._last_flush = time.monotonic()
+        if not rows:
+            return 0
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(insert(RiskEvent), rows)
+        except Exception:
+            # Put the batch back in front of anything buffered since, so it is retried
+            with self._lock:
+                self._buffer[:0] = rows
+            raise
+        return len(rows)
+
+    def revision(self):
+        """
+        Highest event id in the table. Events are only ever appended, so this changes with
+        every write from any process sharing the database; one primary-key lookup.
+        """
+        with self.engine.connect() as conn:
+            return conn.execute(select(func.max(RiskEvent.id))).scalar() or 0
+
+    @property
+    def spatial(self):
+        """
+        GrowingSpatialIndex over (id, lat, lon) of every event with a location.
+        The first access loads the whole table; later accesses only read rows added since.
+        """
+        self.flush()
+        with self._spatial_lock:
+            if self._spatial is None:
+                self._spatial = GrowingSpatialIndex()
+            stmt = select(RiskEvent.id, RiskEvent.lat, RiskEvent.lon) \
+                .where(RiskEvent.id > self._spatial_max_id, RiskEvent.lat.is_not(None), RiskEvent.lon.is_not(None)) \
+                .order_by(RiskEvent.id)
+            with self.engine.connect() as conn:
+                rows = conn.execute(stmt).all()
+            if rows:
+                ids, lats, lons = zip(*rows)
+                self._spatial.add(ids, lats, lons)
+                self._spatial_max_id = ids[-1]
+            return self._spatial
+
+    def nearest(self, lat, lon, k=10, max_km=None):
+        """
+        The k events closest to (lat, lon), closest first, each with a distance_km field.
+        """
+        ids, distances = self.spatial.nearest(lat, lon, k, max_km)
+        if not len(ids):
+            return []
+        with self.engine.connect() as conn:
+            rows = {r.id: r for r in conn.execute(select(RiskEvent).where(self._id_filter(ids))).all()}
+        return [
+            {**self._record(rows[i]), "distance_km": round(float(d), 3)}
+            for i, d in zip(ids.tolist(), distances) if i in rows
+        ]
+
+    @staticmethod
+    def _id_filter(ids):
+        # Inlined as literals: id lists from the spatial index can exceed SQLite's bound-parameter limit
+        return RiskEvent.id.in_(bindparam("spatial_ids", [int(i) for i in ids], expanding=True, literal_execute=True))
+
+    def query(self, start=None, end=None, region=None, risk=None, bbox=None, limit=100, cursor=None, descending=False,
+              near=None):
+        """
+        Returns (records, next_cursor) ordered by (timestamp, id).
+        start/end: Unix seconds (inclusive)
+        bbox: (min_lon, min_lat, max_lon, max_lat)
+        near: (lat, lon, radius_km); matched through the in-memory spatial index
+        cursor: next_cursor from the previous page; None once the last page is reached
+        """
+        self.flush()
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+
+        stmt = select(RiskEvent)
+        if start is not None:
+            stmt = stmt.where(RiskEvent.timestamp >= start)
+        if end is not None:
+            stmt = stmt.where(RiskEvent.timestamp <= end)
+        if region is not None:
+            stmt = stmt.where(RiskEvent.region == region)
+        if risk is not None:
+            stmt = stmt.where(RiskEvent.risk == risk)
+        if bbox is not None:
+            min_lon, min_lat, max_lon, max_lat = bbox
+            stmt = stmt.where(
+                RiskEvent.lat.between(min_lat, max_lat),
+                RiskEvent.lon.between(min_lon, max_lon)
+            )
+        if near is not None:
+            ids, _ = self.spatial.within_radius(*near)
+            if not len(ids):
+                return [], None
+            stmt = stmt.where(self._id_filter(ids))
+
+        key = tuple_(RiskEvent.timestamp, RiskEvent.id)
+        if cursor is not None:
+            position = tuple_(*decode_cursor(cursor))
+            stmt = stmt.where(key < position if descending else key > position)
+        if descending:
+            stmt = stmt.order_by(RiskEvent.timestamp.desc(), RiskEvent.id.desc())
+        else:
+            stmt = stmt.order_by(RiskEvent.timestamp, RiskEvent.id)
+        stmt = stmt.limit(limit + 1)
+
+        with self.engine.connect() as conn:
+            rows = conn.execute(stmt).all()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1].timestamp, rows[-1].id)
+        return [self._record(r) for r in rows], next_cursor
+
+    def count(self):
+        self.flush()
+        with self.engine.connect() as conn:
+            return conn.execute(select(func.count()).select_from(RiskEvent)).scalar()
+
+
+history_store = RiskHistoryStore()
@@ -1,39 +1,300 @@
+import queue
 import smtplib
+import threading
+import time
 from email.mime.text import MIMEText
 import os
 
+from dotenv import load_dotenv
+
+# Credentials and recipients usually live in .env; read it before the settings below
+load_dotenv()
+
+SMTP_WORKERS = int(os.getenv("SMTP_WORKERS", 2))
+# Set SMTP_STARTTLS=0 for a local plaintext SMTP stand-in (e.g. `python -m aiosmtpd -n -l localhost:1025`)
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "1") != "0"
+# Servers drop idle sessions after a few minutes; close ours first and reconnect on demand
+SMTP_IDLE_SECONDS = float(os.getenv("SMTP_IDLE_SECONDS", 120))
+MAX_RECIPIENTS_PER_MESSAGE = 100
+
+# The same (region, level) alert is not repeated within this window...
+ALERT_DEDUPE_SECONDS = float(os.getenv("ALERT_DEDUPE_SECONDS", 1800))
+# ...and at most this many alerts per (region, level) go out per hour
+ALERT_MAX_PER_HOUR = int(os.getenv("ALERT_MAX_PER_HOUR", 4))
+# Alerts arriving within this window are dispatched together
+ALERT_BATCH_SECONDS = float(os.getenv("ALERT_BATCH_SECONDS", 2.0))
+# More regions than this in one batch are sent as a single digest
+DIGEST_THRESHOLD = int(os.getenv("ALERT_DIGEST_THRESHOLD", 3))
+ALERT_QUEUE_SIZE = 10000
+# Comma-separated addresses that receive High risk alerts; none configured means no alerts
+ALERT_RECIPIENTS = [r.strip() for r in os.getenv("ALERT_RECIPIENTS", "").split(",") if r.strip()]
+
+
+class AlertThrottle:
+    """
+    Per (region, level) deduplication and hourly rate limit.
+    """
+    def __init__(self, dedupe_seconds=ALERT_DEDUPE_SECONDS, max_per_hour=ALERT_MAX_PER_HOUR):
+        self.dedupe_seconds = dedupe_seconds
+        self.max_per_hour = max_per_hour
+        self._sent = {}  # (region, level) -> [send times within the last hour]
+        self._lock = threading.Lock()
+
+    def allow(self, region, level, now=None):
+        now = time.time() if now is None else now
+        key = (region, level)
+        with self._lock:
+            recent = [t for t in self._sent.get(key, ()) if now - t < 3600]
+            if recent and now - recent[-1] < self.dedupe_seconds:
+                self._sent[key] = recent
+                return False
+            if len(recent) >= self.max_per_hour:
+                self._sent[key] = recent
+                return False
+            recent.append(now)
+            self._sent[key] = recent
+            return True
+
+
+class _SMTPWorker(threading.Thread):
+    """
+    Sends queued messages over one persistent SMTP session (STARTTLS + login once),
+    reconnecting when the server drops it and closing it after SMTP_IDLE_SECONDS idle.
+    """
+    def __init__(self, service, outbox):
+        super().__init__(daemon=True, name="smtp-worker")
+        self.service = service
+        self.outbox = outbox
+        self.server = None
+
+    def _connect(self):
+        s = self.service
+        server = s.smtp_factory(s.smtp_server, s.smtp_port)
+        if s.starttls:
+            server.starttls()
+        if s.email_user and s.email_pass:
+            server.login(s.email_user, s.email_pass)
+        s.count("connections")
+        return server
+
+    def _close(self):
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except Exception:
+                pass
+            self.server = None
+
+    def _send(self, sender, recipients, message):
+        for attempt in range(2):
+            try:
+                if self.server is None:
+                    self.server = self._connect()
+                self.server.sendmail(sender, recipients, message)
+                return True
+            except (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, ConnectionError, OSError) as e:
+                # Stale session: reconnect once, then give up on this message
+                self._close()
+                if attempt:
+                    print(f"Failed to send email: {e}")
+            except smtplib.SMTPException as e:
+                print(f"Failed to send email: {e}")
+                return False
+        return False
+
+    def run(self):
+        while True:
+            try:
+                item = self.outbox.get(timeout=SMTP_IDLE_SECONDS)
+            except queue.Empty:
+                self._close()
+                continue
+            try:
+                if item is None:
+                    self._close()
+                    return
+                sender, recipients, message = item
+                if self._send(sender, recipients, message):
+                    self.service.count("sent")
+                    self.service.count("recipients", len(recipients))
+                else:
+                    self.service.count("failed")
+            finally:
+                self.outbox.task_done()
+
+
 class NotificationService:
-    def __init__(self):
+    """
+    Queued alert dispatch. Callers only enqueue (never block on SMTP):
+
+        alerts -> dispatcher thread (dedupe, rate limit, batching, digests)
+               -> outbox -> SMTP worker threads, each with one persistent session
+
+    Each message goes to up to MAX_RECIPIENTS_PER_MESSAGE recipients, so thousands of
+    recipients cost a few sends on already-open connections instead of one TLS handshake each.
+    smtp_factory(host, port) makes the connection; pass a stand-in for tests.
+    """
+    def __init__(self, smtp_factory=smtplib.SMTP, workers=SMTP_WORKERS, starttls=SMTP_STARTTLS, throttle=None,
+                 batch_seconds=ALERT_BATCH_SECONDS, digest_threshold=DIGEST_THRESHOLD, recipients=None):
         self.smtp_server = os.getenv("SMTP_SERVER", "smtp.gmail.com")
         self.smtp_port = int(os.getenv("SMTP_PORT", 587))
         self.email_user = os.getenv("EMAIL_USER")
         self.email_pass = os.getenv("EMAIL_PASS")
+        self.smtp_factory = smtp_factory
+        self.starttls = starttls
+        self.n_workers = workers
+        self.throttle = throttle or AlertThrottle()
+        self.batch_seconds = batch_seconds
+        self.digest_threshold = digest_threshold
+        self.recipients = list(ALERT_RECIPIENTS if recipients is None else recipients)
+
+        self._alerts = queue.Queue(maxsize=ALERT_QUEUE_SIZE)
+        self._outbox = queue.Queue()
+        self._threads = []
+        self._start_lock = threading.Lock()
+        self.stats = {"queued": 0, "dropped": 0, "suppressed": 0, "sent": 0, "recipients": 0,
+                      "failed": 0, "digests": 0, "connections": 0}
+        self._stats_lock = threading.Lock()
+
+    def count(self, name, n=1):
+        with self._stats_lock:
+            self.stats[name] += n
+
+    def _credentials_missing(self):
+        # A plaintext local stand-in needs no login; a real STARTTLS relay does
+        return self.starttls and (not self.email_user or not self.email_pass)
+
+    def start(self):
+        with self._start_lock:
+            if self._threads:
+                return
+            dispatcher = threading.Thread(target=self._dispatch_loop, daemon=True, name="alert-dispatcher")
+            self._threads = [dispatcher] + [_SMTPWorker(self, self._outbox) for _ in range(self.n_workers)]
+            for thread in self._threads:
+                thread.start()
+
+    def queue_alert(self, recipients, region, risk_level):
+        """
+        Enqueues an alert for many recipients. Returns False when it was not accepted.
+        """
+        if isinstance(recipients, str):
+            recipients = [recipients]
+        if self._credentials_missing():
+            print("Email credentials not set. Skipping email alert.")
+            return False
+        self.start()
+        try:
+            self._alerts.put_nowait((region, risk_level, list(recipients)))
+        except queue.Full:
+            self.count("dropped")
+            print(f"Alert queue full; dropping alert for {region}")
+            return False
+        self.count("queued")
+        return True
+
+    def alert_high_risk(self, regions):
+        """
+        Queues High risk alerts for `regions` to the configured recipients.
+        """
+        if not self.recipients:
+            return
+        for region in regions:
+            self.queue_alert(self.recipients, region, "High")
 
     def send_email_alert(self, to_email, region, risk_level):
         """
-        Sends an email alert.
+        Sends an email alert (queued; returns immediately).
         """
-        subject = f"URGENT: Landslide Risk Alert for {region}"
-        body = f"A {risk_level} risk of landslide has been detected in {region}. Please take necessary precautions."
-        
+        return self.queue_alert([to_email], region, risk_level)
+
+    def _message(self, subject, body, recipients):
         msg = MIMEText(body)
         msg['Subject'] = subject
         msg['From'] = self.email_user
-        msg['To'] = to_email
+        # Recipients go in the envelope only, so one message can serve many of them
+        msg['To'] = recipients[0] if len(recipients) == 1 else "undisclosed-recipients:;"
+        return msg.as_string()
 
-        try:
-            if not self.email_user or not self.email_pass:
-                print("Email credentials not set. Skipping email alert.")
-                return
+    def _post(self, subject, body, recipients):
+        recipients = sorted(set(recipients))
+        for start in range(0, len(recipients), MAX_RECIPIENTS_PER_MESSAGE):
+            chunk = recipients[start:start + MAX_RECIPIENTS_PER_MESSAGE]
+            self._outbox.put((self.email_user, chunk, self._message(subject, body, chunk)))
 
-            server = smtplib.SMTP(self.smtp_server, self.smtp_port)
-            server.starttls()
-            server.login(self.email_user, self.email_pass)
-            server.sendmail(self.email_user, to_email, msg.as_string())
-            server.quit()
-            print(f"Email sent to {to_email}")
-        except Exception as e:
-            print(f"Failed to send email: {e}")
+    def _dispatch(self, batch):
+        alerts = {}  # (region, level) -> recipients
+        for region, level, recipients in batch:
+            alerts.setdefault((region, level), set()).update(recipients)
+        allowed = {}
+        for (region, level), recipients in alerts.items():
+            if self.throttle.allow(region, level):
+                allowed[(region, level)] = recipients
+            else:
+                self.count("suppressed")
+        if not allowed:
+            return
+
+        if len(allowed) > self.digest_threshold:
+            # Storm: one digest per recipient listing every region instead of a flood of emails
+            by_recipient = {}
+            for (region, level), recipients in allowed.items():
+                for r in recipients:
+                    by_recipient.setdefault(r, []).append((region, level))
+            by_content = {}
+            for r, items in by_recipient.items():
+                by_content.setdefault(tuple(sorted(items)), []).append(r)
+            for items, recipients in by_content.items():
+                lines = "\n".join(f"- {region}: {level} risk" for region, level in items)
+                subject = f"URGENT: Landslide Risk Alert for {len(items)} regions"
+                body = f"Landslide risk has been raised in the following regions:\n{lines}\nPlease take necessary precautions."
+                self._post(subject, body, recipients)
+                self.count("digests")
+            return
+
+        for (region, level), recipients in allowed.items():
+            subject = f"URGENT: Landslide Risk Alert for {region}"
+            body = f"A {level} risk of landslide has been detected in {region}. Please take necessary precautions."
+            self._post(subject, body, recipients)
+
+    def _dispatch_loop(self):
+        while True:
+            first = self._alerts.get()
+            if first is None:
+                break
+            batch = [first]
+            deadline = time.monotonic() + self.batch_seconds
+            stop = False
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._alerts.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            try:
+                self._dispatch(batch)
+            except Exception as e:
+                print(f"Alert dispatch failed: {e}")
+            if stop:
+                break
+        for _ in range(self.n_workers):
+            self._outbox.put(None)
+
+    def stop(self, timeout=10.0):
+        """
+        Dispatches what is queued, sends it, and closes the SMTP sessions.
+        """
+        if not self._threads:
+            return
+        self._alerts.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
 
     def send_sms_alert(self, phone_number, region, risk_level):
         """
@@ -41,6 +302,10 @@ class NotificationService:
         """
         print(f"SMS Alert to {phone_number}: High Risk in {region}!")
 
+# Shared by the API and the simulation scheduler; threads start with the first alert
+notification_service = NotificationService()
+
 if __name__ == "__main__":
     service = NotificationService()
     service.send_email_alert("admin@example.com", "Kerala_Idukki", "High")
+    service.stop()
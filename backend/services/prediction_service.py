@@ -0,0 +1,69 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from ai_engine import metrics
+
+PREDICT_WORKERS = int(os.getenv("PREDICT_WORKERS", 8))
+MAX_BATCH_POINTS = int(os.getenv("PREDICT_MAX_BATCH", 20000))
+# Coordinates are coalesced at ~0.1 m precision
+COORD_DECIMALS = 6
+
+
+class PredictionExecutor:
+    """
+    Runs blocking LandslideInferenceEngine.predict_risk calls on a bounded thread pool,
+    keeping the event loop free for other requests.
+    """
+    def __init__(self, engine, max_workers=PREDICT_WORKERS):
+        self.engine = engine
+        self.max_workers = max_workers
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="predict")
+
+    async def predict(self, lat, lon):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.pool, self.engine.predict_risk, lat, lon)
+
+    async def predict_many(self, points):
+        """
+        Async generator yielding one result dict per input point, in completion order.
+        Duplicate coordinates are evaluated once, and at most 2 * max_workers lookups are
+        queued at a time so an abandoned stream stops scheduling new work.
+        """
+        groups = {}
+        for i, (lat, lon) in enumerate(points):
+            key = (round(lat, COORD_DECIMALS), round(lon, COORD_DECIMALS))
+            groups.setdefault(key, []).append(i)
+        metrics.record_batch("predict_batch", len(groups))
+
+        loop = asyncio.get_running_loop()
+        pending = {}
+        todo = iter(groups.items())
+        window = 2 * self.max_workers
+
+        def submit_next():
+            for key, indices in todo:
+                future = loop.run_in_executor(self.pool, self.engine.predict_risk, key[0], key[1])
+                pending[future] = (key, indices)
+                if len(pending) >= window:
+                    return
+
+        submit_next()
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    (lat, lon), indices = pending.pop(future)
+                    try:
+                        result = {"lat": lat, "lon": lon, "risk": future.result()}
+                    except Exception as e:
+                        result = {"lat": lat, "lon": lon, "error": str(e)}
+                    for i in indices:
+                        yield {"index": i, **result}
+                submit_next()
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
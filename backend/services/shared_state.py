@@ -0,0 +1,276 @@
+"""
+Simulation state shared by every uvicorn worker through one mmap'd file.
+
+One worker holds an exclusive flock on "<path>.lock" and is the only writer: it advances
+the simulator and publishes each tick into the region table. The other workers map the
+same file and copy the table out under a seqlock, so readers never block the
+writer or each other. When the writer exits its flock is released and the next worker to
+poll takes over, continuing from the moisture already in the table.
+
+The file outlives the server, so the header records which run is using it. Every worker
+holds a shared flock on "<path>.run" while it lives; a worker that finds that lock free at
+startup is the first of a new run, so it draws a fresh random run id and clears the header.
+Workers joining (or restarted into) a live run read the id instead. A table left by an
+earlier run reads as empty and is overwritten by the first publish.
+
+    header  int64[16]           magic, layout, seqlock, tick, count, capacity, names version, timestamp,
+                                run id, (reserved)
+    block   float64[FIELDS, C]  one row per field, one column per region
+    names   bytes[C, NAME_BYTES]
+"""
+import os
+import mmap
+import time
+
+import numpy as np
+
+from backend.services.simulator_service import SimulationBatch
+
+try:
+    import fcntl
+except ImportError:  # Windows: every worker keeps its own simulator
+    fcntl = None
+
+# Set SIM_SHARED_STATE=0 to keep per-process state
+SIM_SHARED_STATE = os.getenv("SIM_SHARED_STATE", os.path.join("data", "sim_state.mmap"))
+SIM_SHARED_CAPACITY = int(os.getenv("SIM_SHARED_CAPACITY", 4096))
+# How often non-writer workers look for a new tick (and for a vacant writer slot)
+SIM_SHARED_POLL_SECONDS = float(os.getenv("SIM_SHARED_POLL_SECONDS", 0.5))
+
+MAGIC = 0x4C4E4453494D3031  # "LNDSIM01"
+LAYOUT = 2
+NAME_BYTES = 64
+FIELDS = ("lat", "lon", "slope", "rainfall", "moisture", "vibration", "twi", "ndvi", "risk")
+_MAGIC, _LAYOUT, _SEQ, _TICK, _COUNT, _CAPACITY, _NAMES_VERSION, _TIMESTAMP, _RUN = range(9)
+HEADER_FIELDS = 16
+HEADER_BYTES = HEADER_FIELDS * 8
+
+
+def shared_state_supported():
+    return fcntl is not None
+
+
+class SharedRegionTable:
+    """
+    Fixed-capacity region table in a memory-mapped file with a single elected writer.
+    run_id identifies the run sharing the table: drawn by the first worker to start while
+    no other worker holds the run lock, and read from the header by the rest.
+    """
+    def __init__(self, path=SIM_SHARED_STATE, capacity=SIM_SHARED_CAPACITY):
+        if fcntl is None:
+            raise RuntimeError("Shared simulation state needs POSIX file locks")
+        self.path = path
+        self.capacity = capacity
+        self.size = HEADER_BYTES + capacity * (len(FIELDS) * 8 + NAME_BYTES)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        # Size (and reset) the file and join the run once, serialized across workers starting together
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size != self.size:
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, self.size)
+            self._map = mmap.mmap(self._fd, self.size)
+            self._header = np.frombuffer(self._map, dtype=np.int64, count=HEADER_FIELDS)
+            self.run_id = self._join_run()
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+        self._timestamp = np.frombuffer(self._map, dtype=np.float64, count=1, offset=_TIMESTAMP * 8)
+        self._block = np.frombuffer(
+            self._map, dtype=np.float64, count=len(FIELDS) * capacity, offset=HEADER_BYTES
+        ).reshape(len(FIELDS), capacity)
+        self._names = np.frombuffer(
+            self._map, dtype=f"S{NAME_BYTES}", count=capacity, offset=HEADER_BYTES + self._block.nbytes
+        )
+
+        self._lock_fd = None
+        self._written_names = None
+        self._read_names = (None, [])  # (names version, names)
+        self.last_read_tick = 0
+
+    def _join_run(self):
+        """
+        Takes a shared hold on the run lock for the life of the process and returns the run id.
+        Called under the file's exclusive flock, so starting workers see each other's ids.
+        """
+        fd = os.open(self.path + ".run", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            pass  # live workers hold it: join their run
+        else:
+            # No worker of any run is alive, so whatever the table holds is stale
+            self._header[:] = 0
+            self._header[_RUN] = int.from_bytes(os.urandom(8), "little") >> 1
+        fcntl.flock(fd, fcntl.LOCK_SH)
+        self._run_fd = fd
+        return int(self._header[_RUN])
+
+    # Writer election
+
+    def try_become_writer(self):
+        """
+        True when this process is (or just became) the writer. Non-blocking.
+        """
+        if self._lock_fd is not None:
+            return True
+        fd = os.open(self.path + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        return True
+
+    @property
+    def is_writer(self):
+        return self._lock_fd is not None
+
+    def close(self):
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)  # releases the flock; another worker takes over
+            self._lock_fd = None
+
+    def _current(self):
+        """
+        True when the table holds state published by this run.
+        """
+        return self._header[_MAGIC] == MAGIC and self._header[_RUN] == self.run_id
+
+    # Writer side
+
+    def publish(self, batch, step=-1):
+        """
+        Writes one timestep of a SimulationBatch as the new current state. Returns the tick number.
+        """
+        if not self.is_writer:
+            raise RuntimeError("Only the elected writer may publish")
+        n = len(batch.names)
+        if n > self.capacity:
+            raise ValueError(f"{n} regions exceed the shared table capacity {self.capacity}")
+        columns = {
+            "lat": batch.lat, "lon": batch.lon, "slope": batch.slope[step], "rainfall": batch.rainfall[step],
+            "moisture": batch.moisture[step], "vibration": batch.vibration[step], "twi": batch.twi[step],
+            "ndvi": batch.ndvi[step], "risk": batch.risk[step]
+        }
+        h = self._header
+        current = self._current()
+        tick = int(h[_TICK]) + 1 if current else 1
+
+        h[_SEQ] += 1  # odd: write in progress
+        for row, field in enumerate(FIELDS):
+            self._block[row, :n] = columns[field]
+        if batch.names != self._written_names or not current:
+            self._names[:n] = [name.encode()[:NAME_BYTES] for name in batch.names]
+            h[_NAMES_VERSION] += 1
+            self._written_names = list(batch.names)
+        h[_COUNT] = n
+        h[_CAPACITY] = self.capacity
+        h[_TICK] = tick
+        self._timestamp[0] = time.time()
+        h[_RUN] = self.run_id
+        h[_LAYOUT] = LAYOUT
+        h[_MAGIC] = MAGIC
+        h[_SEQ] += 1  # even: consistent again
+        self.last_read_tick = tick
+        return tick
+
+    # Reader side (lock-free)
+
+    @property
+    def tick(self):
+        return int(self._header[_TICK]) if self._current() else 0
+
+    def read(self, retries=1000):
+        """
+        Consistent copy of the table: (tick, timestamp, names, block[:, :count]), or None when
+        empty or left by an earlier run.
+        """
+        h = self._header
+        for _ in range(retries):
+            seq = int(h[_SEQ])
+            if seq % 2:
+                time.sleep(0)
+                continue
+            if not self._current():
+                return None
+            n = int(h[_COUNT])
+            tick = int(h[_TICK])
+            timestamp = float(self._timestamp[0])
+            names_version = int(h[_NAMES_VERSION])
+            block = self._block[:, :n].copy()
+            cached_version, names = self._read_names
+            if cached_version != names_version:
+                names = [raw.decode() for raw in self._names[:n]]
+            if int(h[_SEQ]) == seq:
+                self._read_names = (names_version, names)
+                return tick, timestamp, names, block
+        raise RuntimeError("Shared simulation state kept changing while being read")
+
+    def read_batch(self, known_tick=None):
+        """
+        Current state as a one-timestep SimulationBatch; None when empty or still at `known_tick`.
+        """
+        if known_tick is not None and self.tick == known_tick:
+            return None
+        state = self.read()
+        if state is None:
+            return None
+        tick, timestamp, names, block = state
+        self.last_read_tick = tick
+        rows = dict(zip(FIELDS, block))
+        return SimulationBatch(
+            names=names,
+            lat=rows["lat"],
+            lon=rows["lon"],
+            slope=rows["slope"][None],
+            rainfall=rows["rainfall"][None],
+            moisture=rows["moisture"][None],
+            vibration=rows["vibration"][None],
+            twi=rows["twi"][None],
+            ndvi=rows["ndvi"][None],
+            risk=rows["risk"][None].astype(np.int8),
+            timestamp=time.strftime("%H:%M:%S", time.localtime(timestamp))
+        )
+
+    def adopt_into(self, simulator, locations):
+        """
+        Loads the shared moisture of `locations` into a simulator, so a newly elected writer
+        carries on from the previous writer's state instead of restarting it. Regions the
+        table holds but this worker does not simulate are ignored.
+        """
+        state = self.read()
+        if state is None:
+            return 0
+        _, _, names, block = state
+        wanted = set(locations)
+        columns = [i for i, name in enumerate(names) if name in wanted]
+        if not columns:
+            return 0
+        names = [names[i] for i in columns]
+        rows = dict(zip(FIELDS, block[:, columns]))
+        simulator.add_regions(names, rows["lat"], rows["lon"], rows["moisture"])
+        idx = [simulator.region_index[name] for name in names]
+        simulator.moisture[idx] = rows["moisture"]
+        return len(names)
+
+
+def open_shared_table(path=SIM_SHARED_STATE):
+    """
+    The process-shared table, or None when disabled or unsupported on this platform.
+    """
+    if not path or path == "0":
+        return None
+    if not shared_state_supported():
+        print("Shared simulation state needs POSIX file locks; using per-process state.")
+        return None
+    try:
+        return SharedRegionTable(path)
+    except OSError as e:
+        print(f"Shared simulation state unavailable ({e}); using per-process state.")
+        return None
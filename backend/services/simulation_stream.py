@@ -0,0 +1,217 @@
+import asyncio
+import json
+import os
+
+from ai_engine import metrics
+from backend.services.shared_state import SIM_SHARED_POLL_SECONDS
+
+SIM_TICK_SECONDS = float(os.getenv("SIM_TICK_SECONDS", 12))
+SUBSCRIBER_QUEUE_SIZE = 8
+# A region is re-sent when its risk level changes or any metric moves by at least this much
+DELTA_TOLERANCE = 0.5
+KEEPALIVE_SECONDS = 15.0
+
+
+def region_changed(old, new, tolerance=DELTA_TOLERANCE):
+    if old is None or old["risk"] != new["risk"]:
+        return True
+    return any(abs(new["metrics"][k] - old["metrics"].get(k, 0)) >= tolerance for k in new["metrics"])
+
+
+class Subscriber:
+    """
+    One connected client. Messages wait in a bounded queue; when a slow consumer lets it
+    fill up, the backlog is dropped and replaced by a single full snapshot.
+    """
+    def __init__(self, broadcaster, queue_size=SUBSCRIBER_QUEUE_SIZE):
+        self.broadcaster = broadcaster
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+
+    def offer(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+                self.dropped += 1
+            self.queue.put_nowait(self.broadcaster.snapshot_message())
+
+    async def get(self, timeout=None):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+
+class SimulationBroadcaster:
+    """
+    Advances the simulator once per interval and fans the result out to every client.
+    Clients receive a full snapshot when they subscribe and only changed regions afterwards,
+    so simulation work per tick is independent of the number of viewers.
+
+    With a SharedRegionTable (multi-worker deployments) only the elected writer worker
+    simulates; the others serve the table it publishes, so every worker reports the same state.
+
+    on_high_risk(region names) is called with the regions that just rose to High risk; only
+    the simulating worker calls it, so each transition is reported once.
+    """
+    def __init__(self, simulator, locations, interval=SIM_TICK_SECONDS, shared=None, poll_interval=SIM_SHARED_POLL_SECONDS,
+                 on_high_risk=None):
+        self.simulator = simulator
+        self.locations = list(locations)
+        self.interval = interval
+        self.shared = shared
+        self.poll_interval = poll_interval
+        self.on_high_risk = on_high_risk
+        self.sequence = 0
+        self.snapshot = []
+        self._by_region = {}
+        self._subscribers = set()
+        self._task = None
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    @property
+    def is_writer(self):
+        if self.shared is None:
+            return True
+        if not self.shared.is_writer and self.shared.try_become_writer():
+            # Taking over from a writer that exited: continue from its state
+            self.shared.adopt_into(self.simulator, self.locations)
+        return self.shared.is_writer
+
+    def tick(self):
+        """
+        Advances the simulation one step (or, as a non-writer worker, picks up the writer's
+        latest step) and returns the list of changed regions.
+        """
+        if not self.is_writer:
+            batch = self.shared.read_batch(known_tick=self.sequence if self.snapshot else None)
+            if batch is None:
+                return []
+            return self._apply(batch.records(), self.shared.last_read_tick)
+
+        with metrics.timed(metrics.simulator_tick):
+            batch = self.simulator.simulate_batch(self.locations)
+            sequence = self.shared.publish(batch) if self.shared is not None else self.sequence + 1
+            records = batch.records()
+            raised = [r["region"] for r in records
+                      if r["risk"] == "High" and (self._by_region.get(r["region"]) or {}).get("risk") != "High"]
+            changed = self._apply(records, sequence)
+        if raised and self.on_high_risk is not None:
+            try:
+                self.on_high_risk(raised)
+            except Exception as e:
+                print(f"High risk alert failed: {e}")
+        return changed
+
+    def _apply(self, records, sequence):
+        changed = [r for r in records if region_changed(self._by_region.get(r["region"]), r)]
+        for r in changed:
+            self._by_region[r["region"]] = r
+        self.snapshot = records
+        self.sequence = sequence
+        return changed
+
+    def snapshot_message(self):
+        return {"type": "snapshot", "seq": self.sequence, "regions": self.snapshot}
+
+    def publish(self, changed):
+        message = {"type": "delta", "seq": self.sequence, "regions": changed}
+        for subscriber in list(self._subscribers):
+            subscriber.offer(message)
+
+    async def _run(self):
+        while True:
+            try:
+                changed = self.tick()
+                if changed:
+                    self.publish(changed)
+            except Exception as e:
+                print(f"Simulation tick failed: {e}")
+            await asyncio.sleep(self.interval if self.is_writer else self.poll_interval)
+
+    def start(self):
+        if not self.running:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.shared is not None:
+            self.shared.close()
+
+    def latest(self):
+        """
+        Current snapshot; ticks once if the scheduler has not produced one yet.
+        """
+        if not self.snapshot:
+            self.tick()
+        return self.snapshot
+
+    def moisture(self, names):
+        """
+        Served moisture for `names` (the writer's state in multi-worker mode), or None before the first tick.
+        """
+        served = {r["region"]: r["metrics"]["moisture"] for r in self.snapshot}
+        if not all(name in served for name in names):
+            return None
+        return [served[name] for name in names]
+
+    def subscribe(self):
+        subscriber = Subscriber(self)
+        if self.snapshot:
+            subscriber.offer(self.snapshot_message())
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self._subscribers.discard(subscriber)
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    async def sse_events(self, request):
+        """
+        Server-Sent Events stream for one HTTP client.
+        """
+        subscriber = self.subscribe()
+        try:
+            while not await request.is_disconnected():
+                try:
+                    message = await subscriber.get(timeout=KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"id: {message['seq']}\nevent: {message['type']}\ndata: {json.dumps(message['regions'])}\n\n"
+        finally:
+            self.unsubscribe(subscriber)
+
+    async def serve_websocket(self, websocket):
+        """
+        Pushes snapshot/delta messages to one WebSocket client until it disconnects.
+        """
+        async def wait_for_disconnect():
+            while (await websocket.receive())["type"] != "websocket.disconnect":
+                pass
+
+        await websocket.accept()
+        subscriber = self.subscribe()
+        disconnected = asyncio.ensure_future(wait_for_disconnect())
+        try:
+            while True:
+                message = asyncio.ensure_future(subscriber.get())
+                done, _ = await asyncio.wait({message, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+                if disconnected in done:
+                    message.cancel()
+                    break
+                await websocket.send_json(message.result())
+        finally:
+            disconnected.cancel()
+            self.unsubscribe(subscriber)
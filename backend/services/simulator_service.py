@@ -1,10 +1,216 @@
-import random
+import numpy as np
+import os
 import time
 
+RISK_LEVELS = ("Low", "Medium", "High")
+RISK_CONFIDENCE = ("85%", "92%", "98%")
+
+DEFAULT_MOISTURE = 20.0
+DEFAULT_COORDS = {"lat": 11.0, "lon": 77.0}
+
+ENSEMBLE_MEMBERS = int(os.getenv("SIM_ENSEMBLE_MEMBERS", 1000))
+ENSEMBLE_PERCENTILES = (5, 50, 95)
+# Upper bound on members x regions drawn at once, keeping ensemble memory at a few tens of MB
+ENSEMBLE_CHUNK_CELLS = 1_000_000
+
+
+def draw_rainfall(rng, size):
+    """
+    Weighted Rainfall Simulation (Probability of storm events).
+    Logic: 80% chance of no/light rain, 15% moderate, 5% extreme storm
+    This reduces the frequency of "High" alerts everywhere at once
+    """
+    roll = rng.random(size)
+    low = np.where(roll < 0.80, 0.0, np.where(roll < 0.95, 10.0, 50.0))
+    high = np.where(roll < 0.80, 5.0, np.where(roll < 0.95, 35.0, 120.0))
+    return low + (high - low) * rng.random(size)
+
+
+def draw_vibration(rng, size):
+    """
+    Vibration Triggers (Simulate passing heavy vehicle or minor tremor), in mm/s.
+    5% chance of a tremor.
+    """
+    tremor = rng.random(size) < 0.05
+    low = np.where(tremor, 15.0, 0.0)
+    high = np.where(tremor, 30.0, 5.0)
+    return low + (high - low) * rng.random(size)
+
+
+def update_moisture(moisture, rainfall, wet_rain=10.0, gain=0.1, drying=0.5):
+    """
+    Update Soil Moisture (Cumulative Saturation).
+    Increase significantly with rain, decrease slowly with "sun", capped between 0 and 100.
+    The keyword defaults are the live rules; the backtest engine varies them.
+    """
+    delta = np.where(rainfall > wet_rain, rainfall * gain, -drying)
+    return np.clip(moisture + delta, 0.0, 100.0)
+
+
+def compute_twi(moisture, slope):
+    """
+    Topographic Wetness Index (TWI) proxy.
+    High moisture + flat area = High TWI. Steep slope = Low TWI (water runs off)
+    """
+    return np.round(np.clip((moisture / 5.0) + (10.0 / (slope + 1)), 0.0, 20.0), 2)
+
+
+def classify_risk(slope, rainfall, moisture, vibration, steep_slope=30.0, heavy_rain=40.0, saturated=80.0,
+                  tremor=10.0, medium_slope=20.0, medium_rain=15.0, medium_moisture=60.0):
+    """
+    Threshold Warning Logic, applied element-wise with array masks.
+    Returns an int8 array of indices into RISK_LEVELS (0: Low, 1: Medium, 2: High).
+
+    High Risk Conditions:
+    - Steep slope AND Heavy Rain
+    - OR High Soil Moisture AND Vibration
+    """
+    high = ((slope > steep_slope) & (rainfall > heavy_rain)) | ((moisture > saturated) & (vibration > tremor))
+    medium = (slope > medium_slope) | (rainfall > medium_rain) | (moisture > medium_moisture)
+    return np.where(high, 2, np.where(medium, 1, 0)).astype(np.int8)
+
+
+class SimulationBatch:
+    """
+    Struct-of-arrays result of a batch simulation.
+    Every metric array has shape (timesteps, regions).
+    """
+    def __init__(self, names, lat, lon, slope, rainfall, moisture, vibration, twi, ndvi, risk, timestamp):
+        self.names = names
+        self.lat = lat
+        self.lon = lon
+        self.slope = slope
+        self.rainfall = rainfall
+        self.moisture = moisture
+        self.vibration = vibration
+        self.twi = twi
+        self.ndvi = ndvi
+        self.risk = risk
+        self.timestamp = timestamp
+
+    def __len__(self):
+        return len(self.names)
+
+    def records(self, step=-1):
+        """
+        Converts one timestep into the per-region dicts served by /api/v1/simulate.
+        """
+        slope = np.round(self.slope[step], 2).tolist()
+        rain = np.round(self.rainfall[step], 2).tolist()
+        moisture = np.round(self.moisture[step], 2).tolist()
+        vibration = np.round(self.vibration[step], 2).tolist()
+        twi = self.twi[step].tolist()
+        ndvi = np.round(self.ndvi[step] * 100, 1).tolist()  # Convert 0-1 to percentage for frontend
+        risk = self.risk[step].tolist()
+        lat = self.lat.tolist()
+        lon = self.lon.tolist()
+
+        results = []
+        for i, name in enumerate(self.names):
+            results.append({
+                "region": name,
+                "risk": RISK_LEVELS[risk[i]],
+                "lat": lat[i],
+                "lon": lon[i],
+                "metrics": {
+                    "slope": slope[i],
+                    "rain": rain[i],
+                    "twi": twi[i],
+                    "ndvi": ndvi[i],
+                    "moisture": moisture[i],
+                    "vibration": vibration[i]
+                },
+                "details": f"Simulated: Rain {round(rain[i], 1)}mm, Slope {round(slope[i], 1)}°, Moisture {round(moisture[i], 1)}%",
+                "confidence": RISK_CONFIDENCE[risk[i]],
+                "timestamp": self.timestamp
+            })
+        return results
+
+
+def run_ensemble(rng, moisture, members, horizon):
+    """
+    Runs `members` independent futures of `horizon` steps for every region at once, starting
+    from the given moisture (N,). Same draws and rules as simulate_batch, with a member axis.
+    Returns (members, N) arrays: worst risk level reached, peak rainfall, final moisture, final TWI.
+    """
+    shape = (members, len(moisture))
+    current = np.broadcast_to(np.asarray(moisture, dtype=np.float64), shape)
+    worst = np.zeros(shape, dtype=np.int8)
+    peak_rain = np.zeros(shape)
+    for _ in range(horizon):
+        slope = rng.uniform(15.0, 48.0, shape)
+        rainfall = draw_rainfall(rng, shape)
+        vibration = draw_vibration(rng, shape)
+        current = update_moisture(current, rainfall)
+        np.maximum(worst, classify_risk(slope, rainfall, current, vibration), out=worst)
+        np.maximum(peak_rain, rainfall, out=peak_rain)
+    return worst, peak_rain, current, compute_twi(current, slope)
+
+
+class EnsembleResult:
+    """
+    Per-region ensemble summary (struct-of-arrays).
+    probabilities: (3, N) share of members whose worst level is Low / Medium / High
+    percentiles:   {metric: (len(ENSEMBLE_PERCENTILES), N)}
+    """
+    def __init__(self, names, lat, lon, members, horizon, probabilities, percentiles, timestamp):
+        self.names = names
+        self.lat = lat
+        self.lon = lon
+        self.members = members
+        self.horizon = horizon
+        self.probabilities = probabilities
+        self.percentiles = percentiles
+        self.timestamp = timestamp
+
+    def __len__(self):
+        return len(self.names)
+
+    def exceedance(self, level):
+        """
+        P(risk >= level) per region; level is a RISK_LEVELS name or index.
+        """
+        if isinstance(level, str):
+            level = RISK_LEVELS.index(level)
+        return self.probabilities[level:].sum(axis=0)
+
+    def records(self):
+        likely = self.probabilities.argmax(axis=0).tolist()
+        probabilities = np.round(self.probabilities, 4).T.tolist()
+        p_medium = np.round(self.exceedance(1), 4).tolist()
+        p_high = np.round(self.exceedance(2), 4).tolist()
+        bands = {k: np.round(v, 2).T.tolist() for k, v in self.percentiles.items()}
+        lat = self.lat.tolist()
+        lon = self.lon.tolist()
+
+        results = []
+        for i, name in enumerate(self.names):
+            results.append({
+                "region": name,
+                "risk": RISK_LEVELS[likely[i]],
+                "lat": lat[i],
+                "lon": lon[i],
+                "probabilities": dict(zip(RISK_LEVELS, probabilities[i])),
+                "exceedance": {"Medium": p_medium[i], "High": p_high[i]},
+                "percentiles": {
+                    metric: {f"p{q}": v for q, v in zip(ENSEMBLE_PERCENTILES, values[i])}
+                    for metric, values in bands.items()
+                },
+                # Share of members agreeing with the reported level, replacing the fixed strings
+                "confidence": f"{probabilities[i][likely[i]]:.0%}",
+                "members": self.members,
+                "horizon": self.horizon,
+                "timestamp": self.timestamp
+            })
+        return results
+
+
 class LandslideSimulator:
-    def __init__(self):
+    def __init__(self, seed=None):
+        self.rng = np.random.default_rng(seed)
+
         # Store state for "Real-Time Mimic" features
-        self.soil_moisture = {
+        initial_moisture = {
             "Nilgiris (Ooty)": 20.0,
             "Kodaikanal (Dindigul)": 15.0,
             "Valparai (Coimbatore)": 25.0,
@@ -30,84 +236,142 @@ class LandslideSimulator:
             "Coonoor (Nilgiris)": {"lat": 11.3530, "lon": 76.7959}
         }
 
-    def simulate_landslide_risk(self, location_name):
+        # Region table (struct-of-arrays), one slot per region
+        self.region_names = []
+        self.region_index = {}
+        self.moisture = np.empty(0, dtype=np.float64)
+        self.lat = np.empty(0, dtype=np.float64)
+        self.lon = np.empty(0, dtype=np.float64)
+        self.add_regions(list(initial_moisture), moisture=list(initial_moisture.values()))
+
+    @property
+    def soil_moisture(self):
         """
-        Simulates environmental factors based on regional historical logic.
+        Read-only {region: moisture} view of the region table.
         """
-        # 1. Realistic Slope (Historical Constant for the region)
-        # Most landslides in TN happen on slopes between 20-45 degrees
-        slope = random.uniform(15.0, 48.0)
-
-        # 2. Weighted Rainfall Simulation (Probability of storm events)
-        # Logic: 70% chance of no/light rain, 20% moderate, 10% extreme storm
-        roll = random.random()
-        # 2. Weighted Rainfall Simulation (Probability of storm events)
-        # Logic: 80% chance of no/light rain, 15% moderate, 5% extreme storm
-        # This reduces the frequency of "High" alerts everywhere at once
-        roll = random.random()
-        if roll < 0.80:
-            rainfall = random.uniform(0.0, 5.0)    # Low/No Rain
-        elif roll < 0.95:
-            rainfall = random.uniform(10.0, 35.0)  # Moderate Rain
-        else:
-            rainfall = random.uniform(50.0, 120.0) # Extreme Rainfall Event
+        return dict(zip(self.region_names, self.moisture.tolist()))
 
-        # Update Soil Moisture (Cumulative Saturation)
-        # Increase significantly with rain, decrease slowly with "sun"
-        current_moisture = self.soil_moisture.get(location_name, 20.0)
-        if rainfall > 10:
-            current_moisture += (rainfall * 0.1)  # Absorb rain
+    def add_regions(self, names, lats=None, lons=None, moisture=None):
+        """
+        Registers regions (or slope units) in the region table.
+        Regions that already exist are left untouched.
+        """
+        seen = set(self.region_index)
+        new = []
+        for i, name in enumerate(names):
+            if name not in seen:
+                seen.add(name)
+                new.append(i)
+        if not new:
+            return
+
+        new_names = [names[i] for i in new]
+        if lats is None or lons is None:
+            coords = [self.coordinates.get(name, DEFAULT_COORDS) for name in new_names]
+            new_lat = np.array([c["lat"] for c in coords], dtype=np.float64)
+            new_lon = np.array([c["lon"] for c in coords], dtype=np.float64)
         else:
-            current_moisture -= 0.5  # Dry out
-        
-        # Cap moisture between 0 and 100
-        current_moisture = max(0.0, min(100.0, current_moisture))
-        self.soil_moisture[location_name] = current_moisture
-
-        # Vibration Triggers (Simulate passing heavy vehicle or minor tremor)
-        ground_vibration = random.uniform(0.0, 5.0) # mm/s
-        if random.random() < 0.05: # 5% chance of a tremor
-            ground_vibration = random.uniform(15.0, 30.0)
-
-        # Topographic Wetness Index (TWI) & NDVI (Vegetation)
-        # Synthesize these to match the frontend RiskMap requirements
-        # High moisture + flat area = High TWI. Steep slope = Low TWI (water runs off)
-        twi = (current_moisture / 5.0) + (10.0 / (slope + 1)) 
-        twi = round(min(20.0, max(0.0, twi)), 2)
+            new_lat = np.asarray(lats, dtype=np.float64)[new]
+            new_lon = np.asarray(lons, dtype=np.float64)[new]
+        if moisture is None:
+            new_moisture = np.full(len(new), DEFAULT_MOISTURE)
+        else:
+            new_moisture = np.asarray(moisture, dtype=np.float64)[new]
+
+        for name in new_names:
+            self.region_index[name] = len(self.region_names)
+            self.region_names.append(name)
+        self.lat = np.concatenate([self.lat, new_lat])
+        self.lon = np.concatenate([self.lon, new_lon])
+        self.moisture = np.concatenate([self.moisture, new_moisture])
+
+    def _indices(self, location_names):
+        self.add_regions(location_names)
+        return np.fromiter((self.region_index[name] for name in location_names), dtype=np.intp, count=len(location_names))
+
+    def simulate_batch(self, location_names=None, timesteps=1):
+        """
+        Simulates N regions over T timesteps in one vectorized pass.
+        Environmental draws are made for all (T, N) cells at once; only the
+        moisture recurrence steps through time.
+        """
+        if location_names is None:
+            location_names = list(self.region_names)
+        idx = self._indices(location_names)
+        shape = (timesteps, len(idx))
 
+        # 1. Realistic Slope
+        # Most landslides in TN happen on slopes between 20-45 degrees
+        slope = self.rng.uniform(15.0, 48.0, shape)
+        # 2. Weighted Rainfall Simulation
+        rainfall = draw_rainfall(self.rng, shape)
+        ground_vibration = draw_vibration(self.rng, shape)
         # NDVI: Lower after landslides or in urban areas. Randomize slightly.
-        ndvi = random.uniform(0.1, 0.8)
+        ndvi = self.rng.uniform(0.1, 0.8, shape)
 
+        moisture = np.empty(shape)
+        current = self.moisture[idx]
+        for t in range(timesteps):
+            current = update_moisture(current, rainfall[t])
+            moisture[t] = current
+        self.moisture[idx] = current
+
+        twi = compute_twi(moisture, slope)
         # 3. Threshold Warning Logic
-        risk_level = "Low"
-        confidence = "85%"
-
-        # High Risk Conditions:
-        # - Steep slope AND Heavy Rain
-        # - OR High Soil Moisture AND Vibration
-        if (slope > 30 and rainfall > 40) or (current_moisture > 80 and ground_vibration > 10):
-            risk_level = "High"
-            confidence = "98%"
-        elif slope > 20 or rainfall > 15 or current_moisture > 60:
-            risk_level = "Medium"
-            confidence = "92%"
-
-        coords = self.coordinates.get(location_name, {"lat": 11.0, "lon": 77.0})
-
-        return {
-            "region": location_name,
-            "risk": risk_level,
-            "lat": coords["lat"],
-            "lon": coords["lon"],
-            "metrics": {
-                "slope": round(slope, 2),
-                "rain": round(rainfall, 2),
-                "twi": twi,
-                "ndvi": round(ndvi * 100, 1), # Convert 0-1 to percentage for frontend
-                "moisture": round(current_moisture, 2),
-                "vibration": round(ground_vibration, 2)
-            },
-            "details": f"Simulated: Rain {round(rainfall, 1)}mm, Slope {round(slope, 1)}°, Moisture {round(current_moisture, 1)}%",
-            "confidence": confidence,
-            "timestamp": time.strftime("%H:%M:%S")
-        }
+        risk = classify_risk(slope, rainfall, moisture, ground_vibration)
+
+        return SimulationBatch(
+            names=list(location_names),
+            lat=self.lat[idx],
+            lon=self.lon[idx],
+            slope=slope,
+            rainfall=rainfall,
+            moisture=moisture,
+            vibration=ground_vibration,
+            twi=twi,
+            ndvi=ndvi,
+            risk=risk,
+            timestamp=time.strftime("%H:%M:%S")
+        )
+
+    def simulate_ensemble(self, location_names=None, members=ENSEMBLE_MEMBERS, horizon=1, seed=None, moisture=None):
+        """
+        Monte Carlo ensemble from the current state, without advancing it.
+        The same seed always gives the same result; without one the simulator's own
+        generator is used (reproducible when the simulator was seeded).
+        `moisture` overrides the starting moisture per region (e.g. a shared snapshot).
+        """
+        if location_names is None:
+            location_names = list(self.region_names)
+        idx = self._indices(location_names)
+        start = self.moisture[idx] if moisture is None else np.asarray(moisture, dtype=np.float64)
+        rng = self.rng if seed is None else np.random.default_rng(seed)
+
+        n = len(idx)
+        probabilities = np.empty((len(RISK_LEVELS), n))
+        percentiles = {metric: np.empty((len(ENSEMBLE_PERCENTILES), n)) for metric in ("rain", "moisture", "twi")}
+        chunk = max(1, ENSEMBLE_CHUNK_CELLS // members)
+        for lo in range(0, n, chunk):
+            hi = min(n, lo + chunk)
+            worst, peak_rain, final_moisture, twi = run_ensemble(rng, start[lo:hi], members, horizon)
+            for level in range(len(RISK_LEVELS)):
+                probabilities[level, lo:hi] = (worst == level).mean(axis=0)
+            for metric, values in (("rain", peak_rain), ("moisture", final_moisture), ("twi", twi)):
+                percentiles[metric][:, lo:hi] = np.percentile(values, ENSEMBLE_PERCENTILES, axis=0)
+
+        return EnsembleResult(
+            names=list(location_names),
+            lat=self.lat[idx],
+            lon=self.lon[idx],
+            members=members,
+            horizon=horizon,
+            probabilities=probabilities,
+            percentiles=percentiles,
+            timestamp=time.strftime("%H:%M:%S")
+        )
+
+    def simulate_landslide_risk(self, location_name):
+        """
+        Simulates environmental factors based on regional historical logic.
+        """
+        return self.simulate_batch([location_name]).records()[0]
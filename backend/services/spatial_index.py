@@ -0,0 +1,268 @@
+import os
+import threading
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+EARTH_RADIUS_KM = 6371.0088
+# ~5.5 km cells: a district-sized viewport touches a few hundred cells
+GRID_CELL_DEG = float(os.getenv("SPATIAL_GRID_DEG", 0.05))
+# /predict reports the monitored region a point falls in if one is this close
+REGION_MATCH_KM = float(os.getenv("REGION_MATCH_KM", 25))
+
+
+def to_unit_vectors(lats, lons):
+    """
+    (n, 3) points on the unit sphere. Straight-line (chord) distance between them grows
+    monotonically with great-circle distance, so a Euclidean KD-tree answers geodesic queries.
+    """
+    lat = np.radians(np.asarray(lats, dtype=np.float64))
+    lon = np.radians(np.asarray(lons, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.column_stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)])
+
+
+def km_to_chord(km):
+    return 2.0 * np.sin(np.minimum(np.asarray(km, dtype=np.float64) / EARTH_RADIUS_KM, np.pi) / 2.0)
+
+
+def chord_to_km(chord):
+    return 2.0 * EARTH_RADIUS_KM * np.arcsin(np.clip(np.asarray(chord, dtype=np.float64) / 2.0, 0.0, 1.0))
+
+
+def haversine_km(lat, lon, lats, lons):
+    return chord_to_km(np.linalg.norm(to_unit_vectors(lats, lons) - to_unit_vectors([lat], [lon]), axis=1))
+
+
+class SpatialIndex:
+    """
+    Immutable index over n (lat, lon) points carrying integer ids.
+
+    nearest / within_radius: KD-tree over unit vectors, O(log n) per query
+    within_bbox: points sorted by grid cell (row-major); each latitude row of the box is
+                 one contiguous slice found by binary search, so cost is O(rows * log n + hits)
+    """
+    def __init__(self, lats, lons, ids=None, cell_deg=GRID_CELL_DEG):
+        self.lats = np.asarray(lats, dtype=np.float64).reshape(-1)
+        self.lons = np.asarray(lons, dtype=np.float64).reshape(-1)
+        n = len(self.lats)
+        self.ids = np.arange(n, dtype=np.int64) if ids is None else np.asarray(ids, dtype=np.int64).reshape(-1)
+        self.cell_deg = cell_deg
+        self.n_cols = int(np.ceil(360.0 / cell_deg))
+
+        self._tree = cKDTree(to_unit_vectors(self.lats, self.lons)) if n else None
+        cells = self._cell_ids(self.lats, self.lons)
+        self._order = np.argsort(cells, kind="stable")
+        self._cells = cells[self._order]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _rows(self, lats):
+        return np.floor((np.clip(lats, -90.0, 90.0) + 90.0) / self.cell_deg).astype(np.int64)
+
+    def _cols(self, lons):
+        return np.floor(((np.asarray(lons) + 180.0) % 360.0) / self.cell_deg).astype(np.int64)
+
+    def _cell_ids(self, lats, lons):
+        return self._rows(lats) * self.n_cols + self._cols(lons)
+
+    def nearest(self, lat, lon, k=1, max_km=None):
+        """
+        Returns (ids, distances_km) of up to k points nearest to (lat, lon), closest first.
+        """
+        if not len(self):
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        k = min(int(k), len(self))
+        bound = km_to_chord(max_km) if max_km is not None else np.inf
+        chords, positions = self._tree.query(to_unit_vectors([lat], [lon])[0], k=k, distance_upper_bound=bound)
+        chords, positions = np.atleast_1d(chords), np.atleast_1d(positions)
+        found = positions < len(self)
+        return self.ids[positions[found]], chord_to_km(chords[found])
+
+    def within_radius(self, lat, lon, radius_km):
+        """
+        Returns (ids, distances_km) of every point within radius_km, closest first.
+        """
+        if not len(self):
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        center = to_unit_vectors([lat], [lon])[0]
+        positions = np.asarray(self._tree.query_ball_point(center, km_to_chord(radius_km)), dtype=np.int64)
+        if not len(positions):
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        distances = chord_to_km(np.linalg.norm(self._tree.data[positions] - center, axis=1))
+        order = np.argsort(distances, kind="stable")
+        return self.ids[positions[order]], distances[order]
+
+    def within_bbox(self, min_lon, min_lat, max_lon, max_lat):
+        """
+        Returns ids of the points inside the box. A box with min_lon > max_lon wraps the antimeridian.
+        """
+        if not len(self) or min_lat > max_lat:
+            return np.empty(0, dtype=np.int64)
+        if min_lon > max_lon:
+            return np.concatenate([
+                self.within_bbox(min_lon, min_lat, 180.0, max_lat),
+                self.within_bbox(-180.0, min_lat, max_lon, max_lat)
+            ])
+
+        rows = np.arange(self._rows(min_lat), self._rows(max_lat) + 1, dtype=np.int64)
+        first_col = self._cols(min_lon)
+        last_col = self.n_cols - 1 if max_lon >= 180.0 else self._cols(max_lon)
+        starts = np.searchsorted(self._cells, rows * self.n_cols + first_col, side="left")
+        ends = np.searchsorted(self._cells, rows * self.n_cols + last_col, side="right")
+        slices = [self._order[a:b] for a, b in zip(starts, ends) if b > a]
+        if not slices:
+            return np.empty(0, dtype=np.int64)
+
+        # Edge cells extend past the box; keep only points actually inside
+        positions = np.concatenate(slices)
+        lats, lons = self.lats[positions], self.lons[positions]
+        inside = (lats >= min_lat) & (lats <= max_lat) & (lons >= min_lon) & (lons <= max_lon)
+        return self.ids[positions[inside]]
+
+
+class GrowingSpatialIndex:
+    """
+    SpatialIndex that accepts appends (e.g. new history events). New points land in a small
+    tail that is scanned linearly; once the tail exceeds rebuild_fraction of the indexed
+    points it is merged by rebuilding, so appends stay amortized O(log n) and queries
+    never scan more than a bounded tail.
+    """
+    def __init__(self, cell_deg=GRID_CELL_DEG, rebuild_fraction=0.1, min_rebuild=4096):
+        self.cell_deg = cell_deg
+        self.rebuild_fraction = rebuild_fraction
+        self.min_rebuild = min_rebuild
+        self._base = SpatialIndex([], [], cell_deg=cell_deg)
+        self._tail_ids, self._tail_lats, self._tail_lons = [], [], []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._base) + len(self._tail_ids)
+
+    def add(self, ids, lats, lons):
+        with self._lock:
+            self._tail_ids.extend(int(i) for i in ids)
+            self._tail_lats.extend(float(v) for v in lats)
+            self._tail_lons.extend(float(v) for v in lons)
+            if len(self._tail_ids) > max(self.min_rebuild, self.rebuild_fraction * len(self._base)):
+                self._rebuild()
+
+    def _rebuild(self):
+        base = self._base
+        self._base = SpatialIndex(
+            np.concatenate([base.lats, self._tail_lats]),
+            np.concatenate([base.lons, self._tail_lons]),
+            np.concatenate([base.ids, np.asarray(self._tail_ids, dtype=np.int64)]),
+            self.cell_deg
+        )
+        self._tail_ids, self._tail_lats, self._tail_lons = [], [], []
+
+    def _snapshot(self):
+        with self._lock:
+            return (
+                self._base,
+                np.asarray(self._tail_ids, dtype=np.int64),
+                np.asarray(self._tail_lats, dtype=np.float64),
+                np.asarray(self._tail_lons, dtype=np.float64)
+            )
+
+    def nearest(self, lat, lon, k=1, max_km=None):
+        base, tail_ids, tail_lats, tail_lons = self._snapshot()
+        ids, distances = base.nearest(lat, lon, k, max_km)
+        if len(tail_ids):
+            tail_distances = haversine_km(lat, lon, tail_lats, tail_lons)
+            keep = tail_distances <= (np.inf if max_km is None else max_km)
+            ids = np.concatenate([ids, tail_ids[keep]])
+            distances = np.concatenate([distances, tail_distances[keep]])
+            order = np.argsort(distances, kind="stable")[:k]
+            ids, distances = ids[order], distances[order]
+        return ids, distances
+
+    def within_radius(self, lat, lon, radius_km):
+        base, tail_ids, tail_lats, tail_lons = self._snapshot()
+        ids, distances = base.within_radius(lat, lon, radius_km)
+        if len(tail_ids):
+            tail_distances = haversine_km(lat, lon, tail_lats, tail_lons)
+            keep = tail_distances <= radius_km
+            ids = np.concatenate([ids, tail_ids[keep]])
+            distances = np.concatenate([distances, tail_distances[keep]])
+            order = np.argsort(distances, kind="stable")
+            ids, distances = ids[order], distances[order]
+        return ids, distances
+
+    def within_bbox(self, min_lon, min_lat, max_lon, max_lat):
+        base, tail_ids, tail_lats, tail_lons = self._snapshot()
+        ids = base.within_bbox(min_lon, min_lat, max_lon, max_lat)
+        if len(tail_ids):
+            in_lon = (tail_lons >= min_lon) & (tail_lons <= max_lon) if min_lon <= max_lon \
+                else (tail_lons >= min_lon) | (tail_lons <= max_lon)
+            inside = (tail_lats >= min_lat) & (tail_lats <= max_lat) & in_lon
+            ids = np.concatenate([ids, tail_ids[inside]])
+        return ids
+
+
+class RegionIndex:
+    """
+    Spatial index over the simulator's region table (monitored zones and slope units).
+    Rebuilt lazily when regions are added.
+    """
+    def __init__(self, simulator=None, cell_deg=GRID_CELL_DEG):
+        self.simulator = simulator
+        self.cell_deg = cell_deg
+        self._index = None
+        self._names = []
+        self._lock = threading.Lock()
+
+    def track(self, simulator):
+        with self._lock:
+            self.simulator = simulator
+            self._index = None
+
+    def _current(self):
+        sim = self.simulator
+        if sim is None:
+            return None, []
+        if self._index is None or len(self._names) != len(sim.region_names):
+            with self._lock:
+                if self._index is None or len(self._names) != len(sim.region_names):
+                    names = list(sim.region_names)
+                    self._index = SpatialIndex(sim.lat[:len(names)], sim.lon[:len(names)], cell_deg=self.cell_deg)
+                    self._names = names
+        return self._index, self._names
+
+    def _region(self, index, names, i, distance=None):
+        region = {"name": names[i], "lat": float(index.lats[i]), "lon": float(index.lons[i])}
+        if distance is not None:
+            region["distance_km"] = round(float(distance), 3)
+        return region
+
+    def nearest(self, lat, lon, k=1, max_km=None):
+        index, names = self._current()
+        if index is None:
+            return []
+        ids, distances = index.nearest(lat, lon, k, max_km)
+        return [self._region(index, names, i, d) for i, d in zip(ids, distances)]
+
+    def within_radius(self, lat, lon, radius_km):
+        index, names = self._current()
+        if index is None:
+            return []
+        ids, distances = index.within_radius(lat, lon, radius_km)
+        return [self._region(index, names, i, d) for i, d in zip(ids, distances)]
+
+    def within_bbox(self, min_lon, min_lat, max_lon, max_lat):
+        index, names = self._current()
+        if index is None:
+            return []
+        return [self._region(index, names, i) for i in index.within_bbox(min_lon, min_lat, max_lon, max_lat)]
+
+    def match(self, lat, lon, max_km=REGION_MATCH_KM):
+        """
+        The nearest region within max_km of the point, or None.
+        """
+        found = self.nearest(lat, lon, 1, max_km)
+        return found[0] if found else None
+
+
+region_index = RegionIndex()
@@ -0,0 +1,332 @@
+"""
+Local XYZ tile pipeline for the risk and slope map layers.
+
+The risk layer repeats the GEE reclassification in gee_service._risk_layer with NumPy:
+slope from the local terrain store (TerrainRasterStore), peak daily rainfall from a local
+CHIRPS raster. Rendered PNGs are kept in a size-bounded disk cache, so map panning is
+served from local files instead of waiting on GEE tile rendering.
+
+    python -m backend.services.tile_service --zooms 6-11        # pre-render the dashboard zooms
+"""
+import hashlib
+import io
+import math
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from ai_engine.data_loaders.terrain_store import TerrainRasterStore
+
+TILE_CACHE_DIR = os.getenv("TILE_CACHE_DIR", os.path.join("data", "tiles"))
+TILE_CACHE_MAX_MB = float(os.getenv("TILE_CACHE_MAX_MB", 512))
+# 10-year max daily CHIRPS rainfall (mm), e.g. exported from the same GEE expression as _risk_layer
+RAINFALL_PEAK_RASTER = os.getenv("RAINFALL_PEAK_RASTER", os.path.join("data", "rainfall", "chirps_peak.tif"))
+TILE_SIZE = 256
+MAX_ZOOM = 16
+DASHBOARD_ZOOMS = tuple(range(6, 12))
+# min_lon, min_lat, max_lon, max_lat
+TAMIL_NADU_BBOX = (76.2, 8.0, 80.4, 13.6)
+NODATA = 255
+
+
+def tile_pixel_centers(z, x, y, size=TILE_SIZE):
+    """
+    (lats, lons) of the pixel centres of Web Mercator tile z/x/y, each (size, size).
+    """
+    n = 2 ** z
+    offsets = (np.arange(size) + 0.5) / size
+    lons = (x + offsets) / n * 360.0 - 180.0
+    lats = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * (y + offsets) / n))))
+    return np.broadcast_to(lats[:, None], (size, size)), np.broadcast_to(lons[None, :], (size, size))
+
+
+def tiles_for_bbox(bbox, z):
+    """
+    Yields (x, y) of every zoom-z tile intersecting bbox (min_lon, min_lat, max_lon, max_lat).
+    """
+    min_lon, min_lat, max_lon, max_lat = bbox
+    n = 2 ** z
+
+    def tile_x(lon):
+        return min(n - 1, max(0, int((lon + 180.0) / 360.0 * n)))
+
+    def tile_y(lat):
+        lat = math.radians(max(min(lat, 85.0511), -85.0511))
+        return min(n - 1, max(0, int((1 - math.asinh(math.tan(lat)) / math.pi) / 2 * n)))
+
+    for x in range(tile_x(min_lon), tile_x(max_lon) + 1):
+        for y in range(tile_y(max_lat), tile_y(min_lat) + 1):
+            yield x, y
+
+
+def classify_risk(slope, rainfall):
+    """
+    Same rules as gee_service._risk_layer, as uint8 codes (0 Low, 1 Medium, 2 High, NODATA):
+    slope 15-30 -> Medium, slope > 30 -> High, slope > 25 with peak rain > 50 mm -> High.
+    Missing rainfall only disables the rainfall rule.
+    """
+    codes = np.zeros(slope.shape, dtype=np.uint8)
+    codes[(slope > 15) & (slope <= 30)] = 1
+    codes[slope > 30] = 2
+    with np.errstate(invalid="ignore"):
+        codes[(slope > 25) & (rainfall > 50)] = 2
+    codes[np.isnan(slope)] = NODATA
+    return codes
+
+
+def _hex(color):
+    return tuple(int(color[i:i + 2], 16) for i in (1, 3, 5))
+
+
+def _render_risk(slope, rainfall):
+    # Palette and opacity of the GEE risk layer
+    palette = np.zeros((256, 4), dtype=np.uint8)
+    for code, color in enumerate(("#2ecc71", "#f1c40f", "#e74c3c")):
+        palette[code] = _hex(color) + (round(0.7 * 255),)
+    return palette[classify_risk(slope, rainfall)]
+
+
+def _render_slope(slope, rainfall):
+    # GEE slope layer: white -> black over 0-50 degrees, flat (<= 5 degrees) masked out
+    with np.errstate(invalid="ignore"):
+        shade = (255 - np.clip(np.nan_to_num(slope) / 50.0, 0, 1) * 255).astype(np.uint8)
+        visible = ~np.isnan(slope) & (slope > 5)
+    rgba = np.empty(slope.shape + (4,), dtype=np.uint8)
+    rgba[..., 0] = rgba[..., 1] = rgba[..., 2] = shade
+    rgba[..., 3] = np.where(visible, round(0.6 * 255), 0)
+    return rgba
+
+
+LOCAL_LAYERS = {
+    "risk": _render_risk,
+    "slope": _render_slope,
+}
+
+
+def encode_png(rgba):
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.fromarray(rgba, "RGBA").save(buffer, "PNG", compress_level=6)
+    return buffer.getvalue()
+
+
+class PeakRainfallRaster:
+    """
+    Single-band rainfall raster held in memory (CHIRPS at 0.05 deg is small). NaN outside.
+    """
+    def __init__(self, path=RAINFALL_PEAK_RASTER):
+        self.path = path
+        self._data = None
+        self._inverse = None
+        self._lock = threading.Lock()
+
+    def available(self):
+        return os.path.exists(self.path)
+
+    def _load(self):
+        import rasterio
+
+        with rasterio.open(self.path) as src:
+            data = src.read(1, masked=True).astype(np.float32).filled(np.nan)
+            self._inverse = ~src.transform
+        self._data = data
+
+    def sample(self, lats, lons):
+        lats = np.asarray(lats, dtype=np.float64)
+        out = np.full(lats.shape, np.nan, dtype=np.float32)
+        if not self.available():
+            return out
+        if self._data is None:
+            with self._lock:
+                if self._data is None:
+                    self._load()
+        inv = self._inverse
+        lons = np.asarray(lons, dtype=np.float64)
+        cols = np.floor(inv.a * lons + inv.b * lats + inv.c).astype(np.int64)
+        rows = np.floor(inv.d * lons + inv.e * lats + inv.f).astype(np.int64)
+        valid = (rows >= 0) & (rows < self._data.shape[0]) & (cols >= 0) & (cols < self._data.shape[1])
+        out[valid] = self._data[rows[valid], cols[valid]]
+        return out
+
+
+class TileCache:
+    """
+    Disk cache of PNG tiles, <root>/<source version>/<layer>/<z>/<x>/<y>.png, bounded by
+    max_bytes. Least recently served tiles are evicted first. ETags are content hashes.
+    """
+    def __init__(self, root=TILE_CACHE_DIR, max_bytes=int(TILE_CACHE_MAX_MB * 1024 * 1024)):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._entries = None    # relative path -> size, least recently used first
+        self._etags = {}
+        self.total_bytes = 0
+        self._lock = threading.Lock()
+
+    def _scan(self):
+        entries = []
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                if name.endswith(".png"):
+                    path = os.path.join(directory, name)
+                    stat = os.stat(path)
+                    entries.append((stat.st_mtime, os.path.relpath(path, self.root), stat.st_size))
+        entries.sort()
+        self._entries = OrderedDict((rel, size) for _, rel, size in entries)
+        self.total_bytes = sum(self._entries.values())
+
+    def _ensure(self):
+        if self._entries is None:
+            with self._lock:
+                if self._entries is None:
+                    self._scan()
+
+    @staticmethod
+    def etag(data):
+        return '"' + hashlib.blake2b(data, digest_size=12).hexdigest() + '"'
+
+    def get(self, rel):
+        """
+        Returns (png bytes, etag) or None.
+        """
+        self._ensure()
+        with self._lock:
+            if rel not in self._entries:
+                return None
+            self._entries.move_to_end(rel)
+        try:
+            with open(os.path.join(self.root, rel), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            with self._lock:
+                self.total_bytes -= self._entries.pop(rel, 0)
+            return None
+        etag = self._etags.get(rel)
+        if etag is None:
+            etag = self._etags[rel] = self.etag(data)
+        return data, etag
+
+    def cached_etag(self, rel):
+        return self._etags.get(rel)
+
+    def put(self, rel, data):
+        self._ensure()
+        path = os.path.join(self.root, rel)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        etag = self.etag(data)
+        with self._lock:
+            self.total_bytes += len(data) - self._entries.pop(rel, 0)
+            self._entries[rel] = len(data)
+            self._etags[rel] = etag
+            self._evict()
+        return etag
+
+    def _evict(self):
+        # Trim to 90% so eviction does not run on every write once the cache is full
+        if self.total_bytes <= self.max_bytes:
+            return
+        target = 0.9 * self.max_bytes
+        while self._entries and self.total_bytes > target:
+            rel, size = self._entries.popitem(last=False)
+            self.total_bytes -= size
+            self._etags.pop(rel, None)
+            try:
+                os.remove(os.path.join(self.root, rel))
+            except FileNotFoundError:
+                pass
+
+
+class TileService:
+    """
+    Renders local layers tile by tile and serves them through the TileCache.
+    """
+    def __init__(self, terrain_store=None, rainfall=None, cache=None):
+        self.terrain_store = terrain_store or TerrainRasterStore()
+        self.rainfall = rainfall or PeakRainfallRaster()
+        self.cache = cache or TileCache()
+        self._blank = None
+
+    def source_version(self):
+        """
+        Changes whenever the terrain store or rainfall raster is rebuilt, so old tiles stop matching.
+        """
+        parts = []
+        for path in (os.path.join(self.terrain_store.root, "index.json"), self.rainfall.path):
+            parts.append(f"{path}:{os.path.getmtime(path) if os.path.exists(path) else 0}")
+        return hashlib.blake2b("|".join(parts).encode(), digest_size=6).hexdigest()
+
+    def render(self, layer, z, x, y):
+        lats, lons = tile_pixel_centers(z, x, y)
+        _, slope = self.terrain_store.sample(lats, lons)
+        if np.isnan(slope).all():
+            return self.blank()
+        rainfall = self.rainfall.sample(lats, lons) if layer == "risk" else None
+        return encode_png(LOCAL_LAYERS[layer](slope, rainfall))
+
+    def blank(self):
+        if self._blank is None:
+            self._blank = encode_png(np.zeros((TILE_SIZE, TILE_SIZE, 4), dtype=np.uint8))
+        return self._blank
+
+    def _key(self, layer, z, x, y):
+        return os.path.join(self.source_version(), layer, str(z), str(x), f"{y}.png")
+
+    def etag(self, layer, z, x, y):
+        """
+        ETag of an already cached tile without reading it, or None.
+        """
+        return self.cache.cached_etag(self._key(layer, z, x, y))
+
+    def get_tile(self, layer, z, x, y):
+        """
+        Returns (png bytes, etag), rendering and caching the tile on a miss.
+        """
+        key = self._key(layer, z, x, y)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        data = self.render(layer, z, x, y)
+        return data, self.cache.put(key, data)
+
+    def prerender(self, layers=tuple(LOCAL_LAYERS), zooms=DASHBOARD_ZOOMS, bbox=TAMIL_NADU_BBOX, workers=4):
+        """
+        Renders every tile of `layers` over bbox at `zooms` into the cache. Returns the tile count.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        jobs = [(layer, z, x, y) for layer in layers for z in zooms for x, y in tiles_for_bbox(bbox, z)]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for _ in pool.map(lambda job: self.get_tile(*job), jobs):
+                pass
+        print(f"Pre-rendered {len(jobs)} tiles; cache holds {self.cache.total_bytes / 1e6:.1f} MB")
+        return len(jobs)
+
+
+tile_service = TileService()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Pre-render local map tiles into the tile cache.")
+    parser.add_argument("--layers", default=",".join(LOCAL_LAYERS))
+    parser.add_argument("--zooms", default=f"{DASHBOARD_ZOOMS[0]}-{DASHBOARD_ZOOMS[-1]}", help="e.g. 6-11 or 8,10")
+    parser.add_argument("--bbox", default=",".join(map(str, TAMIL_NADU_BBOX)), help="min_lon,min_lat,max_lon,max_lat")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    if "-" in args.zooms:
+        lo, hi = (int(v) for v in args.zooms.split("-"))
+        zooms = range(lo, hi + 1)
+    else:
+        zooms = [int(v) for v in args.zooms.split(",")]
+    tile_service.prerender(
+        [l for l in args.layers.split(",") if l], zooms,
+        tuple(float(v) for v in args.bbox.split(",")), args.workers
+    )
@@ -0,0 +1,221 @@
+"""
+Offline stand-in for the `earthengine-api` module, for benchmarks.
+
+Every expression (ee.Image(...).select(...).clip(...), ...) builds a lightweight node
+locally, like the real client library. Only the calls that hit Google's servers,
+getInfo() and getMapId(), pay the injected latency, so timings show how many round trips
+a code path makes. reduceRegions(...).getInfo() returns one feature per input point with
+a deterministic value for every band of the sampled image.
+
+    from benchmarks import fake_ee
+    fake_ee.install(latency_ms=150)   # before anything imports `ee`
+"""
+import itertools
+import os
+import sys
+import threading
+import time
+
+latency_s = float(os.getenv("FAKE_EE_LATENCY_MS", 0)) / 1000.0
+calls = {"getInfo": 0, "getMapId": 0, "Initialize": 0}
+_calls_lock = threading.Lock()
+_map_ids = itertools.count(1)
+
+# Bands of the datasets the app samples; anything else falls back to the band names used in select()
+DATASET_BANDS = {
+    "USGS/SRTMGL1_003": ["elevation"],
+    "JAXA/GPM_L3/GSMaP/v6/operational": ["hourlyPrecipRate"],
+    "UCSB-CHG/CHIRPS/DAILY": ["precipitation"],
+    "COPERNICUS/S1_GRD": ["VV", "VH"],
+    "COPERNICUS/S2_SR_HARMONIZED": ["B4", "B8"],
+}
+SERIES_LENGTH = 30
+
+
+def set_latency(ms):
+    global latency_s
+    latency_s = ms / 1000.0
+
+
+def reset_calls():
+    with _calls_lock:
+        for name in calls:
+            calls[name] = 0
+
+
+def _round_trip(name):
+    with _calls_lock:
+        calls[name] += 1
+    if latency_s:
+        time.sleep(latency_s)
+
+
+def _value(idx, band):
+    # Cheap, deterministic, band-dependent pseudo-measurement
+    h = (idx * 2654435761 + sum(map(ord, band)) * 40503) % 1000
+    if band == "elevation":
+        return 50.0 + h * 2.4
+    if band == "slope":
+        return h * 0.05
+    if band in ("VV", "VH"):
+        return -30.0 + h * 0.025
+    return h * 0.1
+
+
+class _Node:
+    """
+    A deferred server-side object. Unknown methods return a new node that keeps the bands.
+    """
+    def __init__(self, *args, bands=None, features=None, outputs=None, **kwargs):
+        self.args = args
+        self.bands = list(bands or [])
+        self.features = features
+        self.outputs = outputs
+        if args and isinstance(args[0], str) and not bands:
+            self.bands = list(DATASET_BANDS.get(args[0], []))
+
+    def _derive(self, **changes):
+        node = _Node(bands=self.bands, features=self.features, outputs=self.outputs)
+        for key, value in changes.items():
+            setattr(node, key, value)
+        return node
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: self._derive()
+
+    def select(self, *names, **kwargs):
+        selected = [n for group in names for n in (group if isinstance(group, list) else [group])]
+        return self._derive(bands=[n for n in selected if isinstance(n, str)])
+
+    def addBands(self, other, *args, **kwargs):
+        return self._derive(bands=self.bands + [b for b in other.bands if b not in self.bands])
+
+    def rename(self, *names):
+        flat = [n for group in names for n in (group if isinstance(group, list) else [group])]
+        return self._derive(bands=flat)
+
+    def toBands(self):
+        bands = [f"202601{day + 1:02d}_{band}" for day in range(SERIES_LENGTH) for band in self.bands[:1]]
+        return self._derive(bands=bands)
+
+    def setOutputs(self, outputs):
+        return self._derive(outputs=list(outputs))
+
+    def reduceRegions(self, collection=None, reducer=None, scale=None, **kwargs):
+        bands = (reducer.outputs if reducer is not None and reducer.outputs else None) or self.bands
+        return _Node(bands=bands, features=list(collection.features or []))
+
+    def getInfo(self):
+        _round_trip("getInfo")
+        if self.features is None:
+            return {}
+        features = []
+        for props in self.features:
+            idx = int(props.get("idx", len(features)))
+            row = dict(props)
+            row.update({band: _value(idx, band) for band in self.bands})
+            features.append({"type": "Feature", "properties": row})
+        return {"type": "FeatureCollection", "features": features}
+
+    def getMapId(self, vis_params=None):
+        _round_trip("getMapId")
+
+        class TileFetcher:
+            url_format = f"https://earthengine.googleapis.com/v1/fake/maps/{next(_map_ids)}/tiles/{{z}}/{{x}}/{{y}}"
+
+        return {"mapid": "fake", "tile_fetcher": TileFetcher()}
+
+
+class _Namespace(type):
+    """
+    Lets module-level classes answer static calls like ee.Reducer.first() or ee.Filter.eq(...).
+    """
+    def __getattr__(cls, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: _Node()
+
+
+class Image(_Node, metaclass=_Namespace):
+    pass
+
+
+class ImageCollection(_Node, metaclass=_Namespace):
+    pass
+
+
+class Feature(_Node, metaclass=_Namespace):
+    def __init__(self, geometry=None, properties=None, *args, **kwargs):
+        super().__init__()
+        self.properties = dict(properties or {})
+
+
+class FeatureCollection(_Node, metaclass=_Namespace):
+    def __init__(self, source=None, *args, **kwargs):
+        if isinstance(source, list):
+            super().__init__(features=[getattr(f, "properties", {}) for f in source])
+        else:
+            super().__init__(source, *args, **kwargs)
+
+
+class Terrain(metaclass=_Namespace):
+    @staticmethod
+    def slope(image):
+        return _Node(bands=["slope"])
+
+
+class Geometry(_Node, metaclass=_Namespace):
+    pass
+
+
+class Reducer(_Node, metaclass=_Namespace):
+    pass
+
+
+class Filter(_Node, metaclass=_Namespace):
+    pass
+
+
+class Date(_Node, metaclass=_Namespace):
+    pass
+
+
+class String(_Node, metaclass=_Namespace):
+    pass
+
+
+class Number(_Node, metaclass=_Namespace):
+    pass
+
+
+class List(_Node, metaclass=_Namespace):
+    pass
+
+
+class Dictionary(_Node, metaclass=_Namespace):
+    pass
+
+
+def Initialize(*args, **kwargs):
+    with _calls_lock:
+        calls["Initialize"] += 1
+
+
+def Authenticate(*args, **kwargs):
+    pass
+
+
+def AuthenticateServiceAccount(*args, **kwargs):
+    pass
+
+
+def install(latency_ms=None):
+    """
+    Registers this module as `ee`. Must run before the app modules import ee.
+    """
+    if latency_ms is not None:
+        set_latency(latency_ms)
+    sys.modules["ee"] = sys.modules[__name__]
+    return sys.modules[__name__]
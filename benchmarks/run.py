@@ -0,0 +1,451 @@
+"""
+Microbenchmarks for the hot paths: simulator, GEE layer builders, GEELoader sampling,
+the risk forest and the FastAPI endpoints. Earth Engine is replaced by benchmarks/fake_ee.py,
+so the suite runs offline; --latency-ms adds a delay to every getInfo/getMapId round trip.
+
+    python -m benchmarks.run                        # run and compare with benchmarks/baseline.json
+    python -m benchmarks.run --save-baseline        # record the current numbers as the baseline
+    python -m benchmarks.run --latency-ms 150 -k gee
+
+Results are written as JSON (see --out). Exit status is 1 when any benchmark's median is
+slower than its baseline median by more than --tolerance.
+"""
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from . import fake_ee
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+DEFAULT_OUT = os.path.join(BENCH_DIR, "results", "latest.json")
+DEFAULT_REPEAT = 7
+DEFAULT_TOLERANCE = 0.25
+
+BENCHMARKS = []  # (name, factory) in registration order
+
+
+def benchmark(name):
+    """
+    Registers a factory that does the setup and returns the zero-argument callable to time.
+    """
+    def register(factory):
+        BENCHMARKS.append((name, factory))
+        return factory
+    return register
+
+
+def _points(n, seed=0):
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    return list(zip(rng.uniform(8.0, 13.5, n).round(5), rng.uniform(76.2, 80.3, n).round(5)))
+
+
+# --- Simulator ---
+
+@benchmark("simulator.single_region")
+def bench_simulator_single():
+    from backend.services.simulator_service import LandslideSimulator
+
+    sim = LandslideSimulator(seed=1)
+    return lambda: sim.simulate_landslide_risk("Nilgiris (Ooty)")
+
+
+@benchmark("simulator.default_regions_records")
+def bench_simulator_default():
+    from backend.services.simulator_service import LandslideSimulator
+
+    sim = LandslideSimulator(seed=1)
+    return lambda: sim.simulate_batch().records()
+
+
+@benchmark("simulator.batch_10k_regions_24_steps")
+def bench_simulator_batch():
+    import numpy as np
+    from backend.services.simulator_service import LandslideSimulator
+
+    sim = LandslideSimulator(seed=1)
+    points = np.array(_points(10000))
+    sim.add_regions([f"R{i}" for i in range(len(points))], points[:, 0], points[:, 1])
+    return lambda: sim.simulate_batch(timesteps=24)
+
+
+@benchmark("simulator.ensemble_1k_regions_1k_members")
+def bench_simulator_ensemble():
+    import numpy as np
+    from backend.services.simulator_service import LandslideSimulator
+
+    sim = LandslideSimulator(seed=1)
+    points = np.array(_points(1000))
+    sim.add_regions([f"R{i}" for i in range(len(points))], points[:, 0], points[:, 1])
+    return lambda: sim.simulate_ensemble(members=1000, seed=7)
+
+
+@benchmark("backtest.10y_1k_units_4_rule_sets")
+def bench_backtest():
+    import numpy as np
+    from backend.services.backtest_service import RainfallArchive, run_backtest, threshold_grid, write_archive
+
+    rng = np.random.default_rng(1)
+    units, days = 1000, 3653
+    path = tempfile.mkdtemp(prefix="landslidex-backtest-")
+    write_archive(
+        path, "2010-01-01", [f"U{i}" for i in range(units)], rng.uniform(8, 13.5, units), rng.uniform(76, 80, units),
+        [rng.gamma(0.4, 20, (days, units))], rng.uniform(5, 45, units)
+    )
+    archive = RainfallArchive(path)
+    events = np.column_stack([rng.integers(0, units, 500), rng.integers(0, days, 500)])
+    rule_sets = threshold_grid(heavy_rain=[30, 50], steep_slope=[25, 30])
+    return lambda: run_backtest(archive, events, rule_sets)
+
+
+# --- GEE map layers ---
+
+def _layer_bench(layer):
+    from backend.services import gee_service
+
+    def run():
+        gee_service.layer_cache.clear()
+        return gee_service.get_layer_url(layer, ["Nilgiris", "Coimbatore"])
+    return run
+
+
+for _layer in ("risk", "slope", "twi", "ndvi", "sar"):
+    benchmark(f"gee_service.layer_uncached[{_layer}]")(lambda layer=_layer: _layer_bench(layer))
+
+
+@benchmark("gee_service.layer_cached")
+def bench_layer_cached():
+    from backend.services import gee_service
+
+    gee_service.get_layer_url("risk", ["All"])
+    return lambda: gee_service.get_layer_url("risk", ["All"])
+
+
+# --- GEELoader sampling ---
+
+@benchmark("gee_loader.elevation_single_point")
+def bench_elevation_single():
+    from ai_engine.data_loaders.gee_loader import GEELoader
+
+    loader = GEELoader()
+    return lambda: loader.get_elevation_data(11.41, 76.70)
+
+
+@benchmark("gee_loader.elevation_batch_5000")
+def bench_elevation_batch():
+    from ai_engine.data_loaders.gee_loader import GEELoader
+
+    loader = GEELoader()
+    points = _points(5000)
+    return lambda: loader.get_elevation_batch(points)
+
+
+@benchmark("gee_loader.rainfall_batch_5000")
+def bench_rainfall_batch():
+    from ai_engine.data_loaders.gee_loader import GEELoader
+
+    loader = GEELoader()
+    points = _points(5000)
+    return lambda: loader.get_rainfall_batch(points)
+
+
+@benchmark("gee_loader.rainfall_series_1000")
+def bench_rainfall_series():
+    from ai_engine.data_loaders.gee_loader import GEELoader
+
+    loader = GEELoader()
+    points = _points(1000)
+    return lambda: loader.get_rainfall_series_batch(points, "2026-02-01")
+
+
+# --- Record/replay ---
+
+def _s1_window_class():
+    """
+    A fresh stand-in EE expression class: S1_GRD.filterDate(ee.Date(now).advance(-days, 'day'),
+    ee.Date(now)), serialized in the cloud API encoding with the clock reading embedded the way
+    ee.Date(datetime.utcnow()) embeds it.
+    """
+    class Expression:
+        def __init__(self, now_ms, days):
+            self.now_ms = now_ms
+            self.days = days
+
+        def serialize(self):
+            return json.dumps({"result": "0", "values": {
+                "0": {"functionInvocationValue": {"functionName": "Collection.filter", "arguments": {
+                    "collection": {"functionInvocationValue": {"functionName": "ImageCollection.load", "arguments": {
+                        "id": {"constantValue": "COPERNICUS/S1_GRD"}}}},
+                    "start": {"valueReference": "1"}, "end": {"valueReference": "2"}}}},
+                "1": {"functionInvocationValue": {"functionName": "Date.advance", "arguments": {
+                    "date": {"valueReference": "2"}, "delta": {"constantValue": -self.days},
+                    "unit": {"constantValue": "day"}}}},
+                "2": {"functionInvocationValue": {"functionName": "Date", "arguments": {
+                    "value": {"constantValue": self.now_ms}}}}
+            }})
+
+        def getInfo(self):
+            return {"window_days": self.days}
+
+    return Expression
+
+
+@benchmark("replay.gee_time_window_round_trip")
+def bench_replay_time_window():
+    import types
+    from ai_engine.data_loaders import replay
+
+    cassette = replay.Cassette("gee", root=tempfile.mkdtemp(prefix="landslidex-cassette-"))
+    windows = range(1, 201)
+    recorded_at = int(time.time() * 1000)
+
+    def hooked(mode):
+        module = types.ModuleType("ee")
+        module.Expression = _s1_window_class()
+        replay.install_ee_hooks(module, mode=mode, cassette=cassette, profile=replay.FaultProfile())
+        return module.Expression
+
+    recorder = hooked("record")
+    for days in windows:
+        recorder(recorded_at, days).getInfo()
+    # Replayed three days later: the clock constants differ, the recordings must still match
+    player = hooked("replay")
+    later = [player(recorded_at + 3 * 86400000, days) for days in windows]
+
+    def run():
+        for days, expression in zip(windows, later):
+            if expression.getInfo() != {"window_days": days}:
+                raise AssertionError(f"Replayed the wrong recording for a {days}-day window")
+    return run
+
+
+# --- Risk forest ---
+
+def _trained_forest():
+    import numpy as np
+    from ai_engine.models.rf_risk_classifier import LandslideRiskClassifier, N_FEATURES
+
+    rng = np.random.default_rng(0)
+    clf = LandslideRiskClassifier(n_estimators=100)
+    clf.model.set_params(random_state=0)
+    clf.model.fit(rng.random((3000, N_FEATURES), dtype=np.float32), rng.integers(0, 3, 3000))
+    return clf, rng
+
+
+@benchmark("rf.predict_1_row")
+def bench_rf_single():
+    import numpy as np
+    from ai_engine.models.rf_risk_classifier import N_FEATURES
+
+    clf, rng = _trained_forest()
+    row = rng.random((1, N_FEATURES), dtype=np.float32)
+    return lambda: clf.predict(row)
+
+
+@benchmark("rf.predict_20k_rows")
+def bench_rf_batch():
+    import numpy as np
+    from ai_engine.models.rf_risk_classifier import N_FEATURES
+
+    clf, rng = _trained_forest()
+    rows = rng.random((20000, N_FEATURES), dtype=np.float32)
+    return lambda: clf.predict(rows)
+
+
+# --- FastAPI endpoints ---
+
+_client = None
+
+
+def _api_client():
+    global _client
+    if _client is None:
+        from fastapi.testclient import TestClient
+        from backend.main import app
+
+        # No context manager: startup hooks (EE warm-up, tick scheduler) stay off
+        _client = TestClient(app)
+    return _client
+
+
+def _checked(response):
+    if response.status_code >= 400:
+        raise RuntimeError(f"{response.request.method} {response.request.url} -> {response.status_code}")
+    return response
+
+
+@benchmark("api.get_simulate")
+def bench_api_simulate():
+    client = _api_client()
+    return lambda: _checked(client.get("/api/v1/simulate"))
+
+
+@benchmark("api.post_predict")
+def bench_api_predict():
+    client = _api_client()
+    return lambda: _checked(client.post("/api/v1/predict", json={"lat": 11.41, "lon": 76.70}))
+
+
+@benchmark("api.post_predict_batch_500")
+def bench_api_predict_batch():
+    client = _api_client()
+    body = [{"lat": float(lat), "lon": float(lon)} for lat, lon in _points(500)]
+    return lambda: _checked(client.post("/api/v1/predict/batch", json=body))
+
+
+@benchmark("api.get_history_page")
+def bench_api_history():
+    client = _api_client()
+    return lambda: _checked(client.get("/api/v1/history", params={"limit": 500}))
+
+
+@benchmark("api.post_map_layer_cached")
+def bench_api_map_layer():
+    client = _api_client()
+    body = {"layer_type": "slope", "districts": ["All"]}
+    _checked(client.post("/api/v1/map-layer", json=body))
+    return lambda: _checked(client.post("/api/v1/map-layer", json=body))
+
+
+def time_benchmark(func, repeat=DEFAULT_REPEAT, warmup=1):
+    """
+    Runs func warmup + repeat times. Returns timing stats in seconds and EE round trips per call.
+    """
+    for _ in range(warmup):
+        func()
+    fake_ee.reset_calls()
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        runs.append(time.perf_counter() - start)
+    round_trips = (fake_ee.calls["getInfo"] + fake_ee.calls["getMapId"]) / repeat
+    return {
+        "median_s": statistics.median(runs),
+        "min_s": min(runs),
+        "mean_s": statistics.fmean(runs),
+        "stdev_s": statistics.stdev(runs) if len(runs) > 1 else 0.0,
+        "repeat": repeat,
+        "ee_round_trips": round_trips
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def run_suite(pattern=None, repeat=DEFAULT_REPEAT, latency_ms=0.0):
+    fake_ee.install(latency_ms)
+    results = {}
+    for name, factory in BENCHMARKS:
+        if pattern and pattern not in name:
+            continue
+        try:
+            results[name] = time_benchmark(factory(), repeat)
+        except Exception as e:
+            print(f"{name}: failed ({e})")
+            results[name] = {"error": str(e)}
+            continue
+        r = results[name]
+        print(f"{name:<45} median {r['median_s'] * 1000:>10.3f} ms   min {r['min_s'] * 1000:>10.3f} ms   ee {r['ee_round_trips']:g}/call")
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "latency_ms": latency_ms,
+            "repeat": repeat
+        },
+        "results": results
+    }
+
+
+def compare(current, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Returns [(name, baseline median, current median, ratio)] for benchmarks that got slower
+    than baseline * (1 + tolerance). Benchmarks missing from either side are ignored.
+    """
+    regressions = []
+    print(f"\n{'benchmark':<45} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, result in current["results"].items():
+        before = baseline["results"].get(name)
+        if not before or "median_s" not in before or "median_s" not in result:
+            continue
+        ratio = result["median_s"] / before["median_s"] if before["median_s"] else float("inf")
+        flag = "  REGRESSION" if ratio > 1 + tolerance else ""
+        print(f"{name:<45} {before['median_s'] * 1000:>10.3f}ms {result['median_s'] * 1000:>10.3f}ms {(ratio - 1) * 100:>+7.1f}%{flag}")
+        if flag:
+            regressions.append((name, before["median_s"], result["median_s"], ratio))
+    if baseline["meta"].get("latency_ms") != current["meta"].get("latency_ms"):
+        print("Warning: baseline was recorded with a different --latency-ms")
+    return regressions
+
+
+def _write_json(path, data):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the LandslideX microbenchmarks against an offline Earth Engine stub.")
+    parser.add_argument("-k", dest="pattern", help="Only run benchmarks whose name contains this string")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--latency-ms", type=float, default=fake_ee.latency_s * 1000.0,
+                        help="Injected delay per Earth Engine round trip (default: $FAKE_EE_LATENCY_MS or 0)")
+    parser.add_argument("--out", default=DEFAULT_OUT, help="Where to write the JSON results")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="Write the results to --baseline as well")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Allowed slowdown of the median before it counts as a regression (0.25 = 25%%)")
+    args = parser.parse_args(argv)
+
+    # Keep the benchmark runs away from the real history database
+    os.environ.setdefault("HISTORY_DB_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench_history.db"))
+
+    current = run_suite(args.pattern, args.repeat, args.latency_ms)
+    _write_json(args.out, current)
+    print(f"\nResults written to {args.out}")
+
+    failed = [name for name, result in current["results"].items() if "error" in result]
+    if failed:
+        # A broken hot path has no timing to compare, so it must not pass the gate
+        print(f"\n{len(failed)} benchmark(s) failed: {', '.join(failed)}")
+        return 1
+
+    if args.save_baseline:
+        _write_json(args.baseline, current)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save-baseline to record one.")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(current, baseline, args.tolerance)
+    if regressions:
+        print(f"\n{len(regressions)} benchmark(s) regressed by more than {args.tolerance:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())